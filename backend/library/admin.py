@@ -27,6 +27,12 @@ class CustomUserAdmin(UserAdmin):
         ),
     )
 
+    def save_model(self, request, obj, form, change):
+        if change:
+            # The save writes every column; don't put back a stale unread counter
+            obj.refresh_from_db(fields=["unread_notifications"])
+        super().save_model(request, obj, form, change)
+
 
 # Prevent registering the User model multiple times
 if not admin.site.is_registered(User):
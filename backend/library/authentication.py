@@ -1,8 +1,173 @@
-from django.contrib.auth.backends import BaseBackend
+"""Authentication backends, with a per-process cache of authenticated users.
+
+Every JWT-authenticated request used to load its ``User`` by primary key.
+``CachedJWTAuthentication`` keeps recently seen users in a TTL+LRU cache
+instead. Entries are keyed by user id and hold the ``auth_version`` they were
+loaded with, which tokens carry as the ``ver`` claim: a password change or
+deactivation bumps the version, so tokens issued before it stop matching
+anywhere, and this process also drops the user on every save. Another
+process may serve its cached copy of a saved user for up to
+``LIBRARY_AUTH_CACHE_TTL`` seconds.
+
+Each request gets its own shallow copy of the cached user.
+
+Password logins go through ``authenticate_credentials``, which hashes on
+the pool in ``library.hashing`` rather than the calling thread.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import BaseBackend
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .hashing import get_hashing_pool
 
 User = get_user_model()
 
+VERSION_CLAIM = "ver"
+
+
+class UserCache:
+    """Thread-safe TTL+LRU map of user id to ``(auth_version, user)``."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, version=None):
+        """The cached user, if still fresh and, given ``version``, matching."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is None or (version is not None and entry[1] != version):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return copy.copy(entry[2])
+
+    def set(self, user):
+        if self.max_entries <= 0:
+            return
+        entry = (time.monotonic() + self.ttl, user.auth_version, copy.copy(user))
+        with self._lock:
+            self._entries[user.pk] = entry
+            self._entries.move_to_end(user.pk)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(
+                    max_entries=getattr(settings, "LIBRARY_AUTH_CACHE_SIZE", 10000),
+                    ttl=getattr(settings, "LIBRARY_AUTH_CACHE_TTL", 60),
+                )
+    return _user_cache
+
+
+class VersionedRefreshToken(RefreshToken):
+    """Refresh token carrying the user's ``auth_version``.
+
+    Access tokens made from it, including by ``TokenRefreshView``, copy the
+    claim.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[VERSION_CLAIM] = user.auth_version
+        return token
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = User._meta.pk.to_python(
+                validated_token[jwt_settings.USER_ID_CLAIM]
+            )
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        # Tokens from before versioning are valid until the first bump
+        version = validated_token.get(VERSION_CLAIM, 0)
+
+        cache = get_user_cache()
+        user = cache.get(user_id, version)
+        if user is not None:
+            return user
+        user = super().get_user(validated_token)
+        if user.auth_version != version:
+            raise AuthenticationFailed(
+                _("Token is no longer valid"), code="token_revoked"
+            )
+        cache.set(user)
+        return user
+
+
+class InvalidCredentials(Exception):
+    """The email and password don't identify an active user."""
+
+
+async def authenticate_credentials(email, password):
+    """The active user with ``email`` and ``password``.
+
+    Raises ``InvalidCredentials`` saying what is wrong, or
+    ``library.hashing.HashingPoolFull`` when too many logins are in progress.
+    """
+    user = await User.objects.filter(email=email).afirst()
+    if user is None:
+        raise InvalidCredentials("User does not exist")
+    valid, rehashed = await get_hashing_pool().check(password, user.password)
+    if not valid:
+        raise InvalidCredentials("Wrong Password")
+    if not user.is_active:
+        raise InvalidCredentials("User is inactive")
+    if rehashed is not None:
+        # Same password under the current hasher: no auth_version bump, and
+        # no write at all if the password changed meanwhile
+        await User.objects.filter(pk=user.pk, password=user.password).aupdate(
+            password=rehashed
+        )
+        get_user_cache().invalidate(user.pk)
+    return user
+
 
 class EmailBackend(BaseBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
@@ -14,7 +179,15 @@ class EmailBackend(BaseBackend):
             return user
         return None
 
+    async def aauthenticate(self, request, email=None, password=None, **kwargs):
+        # HashingPoolFull propagates; library.middleware answers it with 503
+        try:
+            return await authenticate_credentials(email, password)
+        except InvalidCredentials:
+            return None
+
     def get_user(self, user_id):
+        # Sessions carry no auth_version to check a cached user against
         try:
             return User.objects.get(pk=user_id)
         except User.DoesNotExist:
@@ -0,0 +1,201 @@
+"""Versioned read-through cache for catalog responses.
+
+Rendered JSON responses of the catalog views are kept in an in-process LRU
+store bounded by memory. Every cache key embeds the current catalog version,
+which is bumped whenever a ``Book`` or ``Category`` is saved or deleted, so
+entries from before a write can never be served again; they simply age out.
+
+The version counter lives in Django's cache framework, which must be
+shared by every process (``manage.py check --deploy`` enforces this),
+or a write in one process would not invalidate the others' responses.
+
+Overdue fees grow with time without any write. A view whose response shows
+fees sets ``cache_expires_at`` to the moment the first of them changes, and
+the response is not served from the cache past it.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+VERSION_CACHE_KEY = "library:catalog:version"
+CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Vary")
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        # Seed from the clock so a lost counter never reuses an old version
+        cache.add(VERSION_CACHE_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(VERSION_CACHE_KEY, int(time.time() * 1000), None)
+
+
+def representation_variant(request):
+    """What besides the data shapes a response: path, query and visibility."""
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+        if value != ""
+    )
+    visibility = "auth" if request.user.is_authenticated else "anon"
+    return request.path, params, visibility
+
+
+class LRUResponseStore:
+    """Thread-safe LRU mapping of keys to responses, capped in bytes."""
+
+    def __init__(self, max_bytes, timeout):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, size, timeout=None):
+        """Store ``value``; ``timeout`` may shorten the store's own."""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if size > self.max_bytes or timeout <= 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + timeout, size, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        self.size -= self._entries.pop(key)[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_response_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = LRUResponseStore(
+                    max_bytes=getattr(
+                        settings, "LIBRARY_RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024
+                    ),
+                    timeout=getattr(settings, "LIBRARY_RESPONSE_CACHE_TIMEOUT", 300),
+                )
+    return _store
+
+
+class CachedResponseMixin:
+    """Serve GET requests of a DRF view from the catalog response cache.
+
+    Only JSON responses with status 200 are cached. Keys are built from the
+    view, the path, the normalized query string and whether the user is
+    authenticated (``BookSerializer.get_borrowed_by`` hides emails from
+    anonymous users).
+
+    Views set ``cache_expires_at`` while building a response whose content
+    goes stale at a known time, such as when a fee it shows next goes up.
+    """
+
+    cache_expires_at = None
+
+    def get_cache_key(self, request):
+        raw = repr((type(self).__name__, representation_variant(request)))
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return f"{get_catalog_version()}:{digest}"
+
+    def is_cacheable(self, request):
+        store = get_response_store()
+        return store.max_bytes > 0 and isinstance(
+            request.accepted_renderer, JSONRenderer
+        )
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().get(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        cached = get_response_store().get(key)
+        if cached is not None:
+            content, headers = cached
+            # Revalidations are answered from the stored validators
+            last_modified = headers.get("Last-Modified")
+            response = get_conditional_response(
+                request,
+                etag=headers.get("ETag"),
+                last_modified=parse_http_date_safe(last_modified or ""),
+            )
+            if response is None:
+                response = HttpResponse(content)
+            for header, value in headers.items():
+                if response.status_code == 200 or header != "Content-Type":
+                    response[header] = value
+            response["X-Cache"] = "HIT"
+            return response
+
+        response = super().get(request, *args, **kwargs)
+        response._response_cache_key = key
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(response, "_response_cache_key", None)
+        if key is not None and response.status_code == 200:
+            timeout = None
+            if self.cache_expires_at is not None:
+                timeout = (self.cache_expires_at - timezone.now()).total_seconds()
+            response.render()
+            headers = {
+                header: response[header]
+                for header in CACHED_HEADERS
+                if header in response
+            }
+            get_response_store().set(
+                key,
+                (response.content, headers),
+                len(response.content) + len(key),
+                timeout,
+            )
+            response["X-Cache"] = "MISS"
+        return response
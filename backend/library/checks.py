@@ -0,0 +1,32 @@
+"""System checks for deployment settings the library app relies on."""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The catalog version must be visible to every server process.
+
+    A write in one process bumps the version so that all processes stop
+    serving responses cached before it. A local-memory cache keeps one
+    counter per process, so other processes would go on serving stale pages.
+    The single-process development server is fine with one, so this is a
+    deployment check (``manage.py check --deploy``).
+    """
+    if getattr(settings, "LIBRARY_RESPONSE_CACHE_MAX_BYTES", 1) <= 0:
+        return []
+    if not isinstance(caches["default"], (LocMemCache, DummyCache)):
+        return []
+    return [
+        Error(
+            "The default cache is local to each process, so catalog writes "
+            "would not invalidate responses cached by other processes.",
+            hint="Set LIBRARY_CACHE_URL (or CACHES) to a shared backend such "
+            "as Redis, or set LIBRARY_RESPONSE_CACHE_MAX_BYTES = 0.",
+            id="library.E001",
+        )
+    ]
@@ -0,0 +1,410 @@
+"""Borrowing, returning and fee payment as conditional UPDATEs.
+
+Every state change is a single ``UPDATE ... WHERE`` whose condition is the
+precondition of the action (the book is free, it is held by this patron, the
+fee is what was quoted), so two concurrent requests can never both succeed
+and no row is read and written back whole. Only when nothing was updated is
+the row read again, to explain why.
+
+A released book goes to the head of its hold queue in the same
+transaction: the head is found with an index seek on ``(book, id)``, so the
+queue is never scanned or re-sorted, and a queue position is an index range
+count. A reservation that lapses passes the book on the same way; that is
+done before any borrow or hold decides on the book, and for all books by
+the periodic ``expire_reservations`` sweep, so the next patron in line is
+told without waiting for someone to ask for the book.
+
+Desk transactions for several books lock the requested rows, decide each
+ISBN's outcome from one narrow read, apply the changes with a single UPDATE
+per outcome. Notifications are handed to ``notifications.send`` and written
+after the commit, off the request path.
+
+``QuerySet.update`` sends no ``post_save``, so the catalog version and the
+suggestion index are brought up to date here instead of by the signals.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, F, Min, Q, Value, When
+from django.utils import timezone
+
+from . import notifications
+from .caching import bump_catalog_version
+from .conditional import overdue_days
+from .models import Book, Hold, Notification
+from .suggest import index as suggestion_index
+
+LOAN_PERIOD = timedelta(days=7)
+HOLD_PERIOD = timedelta(days=3)  # How long a reserved book waits for its holder
+MAX_BATCH_SIZE = 50
+
+# Per-ISBN outcomes
+BORROWED = "borrowed"
+RETURNED = "returned"
+NOT_FOUND = "not_found"
+UNAVAILABLE = "unavailable"
+NOT_BORROWED = "not_borrowed"
+FEE_DUE = "fee_due"
+PAID = "paid"
+RESERVED = "reserved"  # Waiting for another patron's pickup
+HELD = "held"
+AVAILABLE = "available"  # Nothing to wait for
+ALREADY_HOLDING = "already_holding"
+CANCELLED = "cancelled"
+
+CIRCULATION_FIELDS = ("isbn", "title", "author", "borrow_count")
+
+
+def _locked_rows(isbns, *fields):
+    rows = Book.objects.select_for_update().filter(isbn__in=isbns)
+    return {row["isbn"]: row for row in rows.values("isbn", *fields)}
+
+
+def _after_commit(rows):
+    updates = [
+        (row["isbn"], row["title"], row["author"], row["borrow_count"])
+        for row in rows
+    ]
+
+    # Bump now like the post_save receivers do, and again once committed so
+    # nothing cached from the pre-commit rows outlives the transaction
+    bump_catalog_version()
+
+    def apply():
+        bump_catalog_version()
+        for update in updates:
+            suggestion_index.update_book(*update)
+
+    transaction.on_commit(apply)
+
+
+def _available_to(user):
+    # Lapsed reservations have been passed on by _expire_reservations
+    return Q(borrowed_by__isnull=True) & (
+        Q(reserved_for__isnull=True) | Q(reserved_for=user)
+    )
+
+
+def _reserved_for_other(row, user):
+    return row["reserved_for"] is not None and row["reserved_for"] != user.pk
+
+
+def _hand_off(rows, now):
+    """Reserve each released book in ``rows`` for the head of its queue."""
+    titles = {row["isbn"]: row["title"] for row in rows}
+    heads = (
+        Hold.objects.filter(book_id__in=titles)
+        .values("book_id")
+        .annotate(head=Min("id"))
+        .values("head")
+    )
+    holds = list(
+        Hold.objects.select_for_update()
+        .filter(id__in=heads)
+        .values_list("id", "book_id", "user_id")
+    )
+    if not holds:
+        return
+    Hold.objects.filter(id__in=[hold_id for hold_id, _, _ in holds]).delete()
+    until = now + HOLD_PERIOD
+    Book.objects.filter(isbn__in=[isbn for _, isbn, _ in holds]).update(
+        reserved_for=Case(
+            *(When(isbn=isbn, then=Value(user_id)) for _, isbn, user_id in holds)
+        ),
+        reserved_until=until,
+        updated_at=now,
+    )
+    notifications.send(
+        Notification(
+            user_id=user_id,
+            message=f"'{titles[isbn]}' is reserved for you until {until:%Y-%m-%d}.",
+        )
+        for _, isbn, user_id in holds
+    )
+
+
+def _expire_reservations(now, isbns=None):
+    """Pass books whose reservation lapsed to the next hold in their queue.
+
+    Runs inside the caller's transaction; returns how many books it freed.
+    """
+    lapsed = Book.objects.select_for_update().filter(
+        borrowed_by__isnull=True, reserved_until__lte=now
+    )
+    if isbns is not None:
+        lapsed = lapsed.filter(isbn__in=isbns)
+    rows = list(lapsed.values(*CIRCULATION_FIELDS, "reserved_for"))
+    if not rows:
+        return 0
+    Book.objects.filter(isbn__in=[row["isbn"] for row in rows]).update(
+        reserved_for=None, reserved_until=None, updated_at=now
+    )
+    notifications.send(
+        Notification(
+            user_id=row["reserved_for"],
+            message=f"Your reservation for '{row['title']}' has expired.",
+        )
+        for row in rows
+    )
+    _hand_off(rows, now)
+    _after_commit(rows)
+    return len(rows)
+
+
+def expire_reservations(now=None):
+    """Sweep every lapsed reservation; returns how many books moved on."""
+    with transaction.atomic():
+        return _expire_reservations(now or timezone.now())
+
+
+def overdue_fee(row, now):
+    return overdue_days(row["due_date"], now) * row["fine_per_day"]
+
+
+def _current(isbn, *fields):
+    return Book.objects.filter(isbn=isbn).values(*fields).first()
+
+
+def borrow_book(user, isbn):
+    """Check out one book if nobody has it or it is reserved for ``user``."""
+    now = timezone.now()
+    due_date = now + LOAN_PERIOD
+    with transaction.atomic():
+        _expire_reservations(now, [isbn])
+        updated = Book.objects.filter(_available_to(user), isbn=isbn).update(
+            borrowed_by=user,
+            due_date=due_date,
+            borrow_count=F("borrow_count") + 1,
+            reserved_for=None,
+            reserved_until=None,
+            updated_at=now,
+        )
+        if not updated:
+            row = _current(isbn, "borrowed_by")
+            if row is None:
+                return {"isbn": isbn, "status": NOT_FOUND}
+            if row["borrowed_by"] is None:
+                return {"isbn": isbn, "status": RESERVED}
+            return {"isbn": isbn, "status": UNAVAILABLE}
+        Hold.objects.filter(book_id=isbn, user=user).delete()
+        row = _current(isbn, *CIRCULATION_FIELDS)
+        notifications.send(
+            [Notification(user=user, message=f"You have borrowed '{row['title']}'.")]
+        )
+        _after_commit([row])
+    return {"isbn": isbn, "status": BORROWED, "due_date": due_date}
+
+
+def return_book(user, isbn):
+    """Return one book held by ``user`` unless it has run up a fee."""
+    now = timezone.now()
+    with transaction.atomic():
+        # A fee is owed from the first whole day past due, unless the book
+        # has no daily fine
+        updated = (
+            Book.objects.filter(isbn=isbn, borrowed_by=user)
+            .filter(
+                Q(due_date__isnull=True)
+                | Q(due_date__gt=now - timedelta(days=1))
+                | Q(fine_per_day=0)
+            )
+            .update(borrowed_by=None, due_date=None, updated_at=now)
+        )
+        if not updated:
+            row = _current(isbn, "borrowed_by", "due_date", "fine_per_day")
+            if row is None:
+                return {"isbn": isbn, "status": NOT_FOUND}
+            if row["borrowed_by"] != user.pk:
+                return {"isbn": isbn, "status": NOT_BORROWED}
+            return {"isbn": isbn, "status": FEE_DUE, "fee": overdue_fee(row, now)}
+        row = _current(isbn, *CIRCULATION_FIELDS)
+        notifications.send(
+            [Notification(user=user, message=f"You have returned '{row['title']}'.")]
+        )
+        _hand_off([row], now)
+        _after_commit([row])
+    return {"isbn": isbn, "status": RETURNED}
+
+
+def pay_fee(user, isbn, amount):
+    """Settle the overdue fee on a book held by ``user`` and release it.
+
+    The UPDATE is conditional on the due date the fee was quoted from, so a
+    payment can't settle a loan that changed in the meantime.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        row = (
+            Book.objects.filter(isbn=isbn, borrowed_by=user)
+            .values(*CIRCULATION_FIELDS, "due_date", "fine_per_day")
+            .first()
+        )
+        if row is None:
+            return {"isbn": isbn, "status": NOT_FOUND}
+        fee = overdue_fee(row, now)
+        if fee > 0 and amount < fee:
+            return {"isbn": isbn, "status": FEE_DUE, "fee": fee}
+        updated = Book.objects.filter(
+            isbn=isbn, borrowed_by=user, due_date=row["due_date"]
+        ).update(borrowed_by=None, due_date=None, updated_at=now)
+        if not updated:
+            return {"isbn": isbn, "status": NOT_BORROWED}
+        notifications.send(
+            [
+                Notification(
+                    user=user,
+                    message=f"Overdue fee of ${amount:.2f} paid for '{row['title']}'.",
+                )
+            ]
+        )
+        _hand_off([row], now)
+        _after_commit([row])
+    return {"isbn": isbn, "status": PAID, "fee": fee}
+
+
+def borrow_books(user, isbns):
+    """Check out ``isbns`` to ``user``; returns one outcome dict per ISBN."""
+    isbns = list(dict.fromkeys(isbns))
+    now = timezone.now()
+    due_date = now + LOAN_PERIOD
+    with transaction.atomic():
+        _expire_reservations(now, isbns)
+        rows = _locked_rows(
+            isbns, "title", "author", "borrow_count", "borrowed_by", "reserved_for"
+        )
+        outcomes, granted = [], []
+        for isbn in isbns:
+            row = rows.get(isbn)
+            if row is None:
+                outcomes.append({"isbn": isbn, "status": NOT_FOUND})
+            elif row["borrowed_by"] is not None:
+                outcomes.append({"isbn": isbn, "status": UNAVAILABLE})
+            elif _reserved_for_other(row, user):
+                outcomes.append({"isbn": isbn, "status": RESERVED})
+            else:
+                row["borrow_count"] += 1
+                granted.append(row)
+                outcomes.append(
+                    {"isbn": isbn, "status": BORROWED, "due_date": due_date}
+                )
+
+        if granted:
+            granted_isbns = [row["isbn"] for row in granted]
+            # The condition keeps this safe where rows can't be locked
+            available = Book.objects.filter(
+                _available_to(user), isbn__in=granted_isbns
+            )
+            updated = available.update(
+                borrowed_by=user,
+                due_date=due_date,
+                borrow_count=F("borrow_count") + 1,
+                reserved_for=None,
+                reserved_until=None,
+                updated_at=now,
+            )
+            if updated < len(granted):
+                # Another borrower got some of them first; due_date is this
+                # call's own, so it tells which rows the UPDATE took
+                won = set(
+                    Book.objects.filter(
+                        isbn__in=granted_isbns, borrowed_by=user, due_date=due_date
+                    ).values_list("isbn", flat=True)
+                )
+                granted = [row for row in granted if row["isbn"] in won]
+                granted_isbns = [row["isbn"] for row in granted]
+                outcomes = [
+                    (
+                        {"isbn": outcome["isbn"], "status": UNAVAILABLE}
+                        if outcome["status"] == BORROWED
+                        and outcome["isbn"] not in won
+                        else outcome
+                    )
+                    for outcome in outcomes
+                ]
+
+        if granted:
+            Hold.objects.filter(book_id__in=granted_isbns, user=user).delete()
+            notifications.send(
+                Notification(user=user, message=f"You have borrowed '{row['title']}'.")
+                for row in granted
+            )
+            _after_commit(granted)
+    return outcomes
+
+
+def return_books(user, isbns):
+    """Return ``isbns`` borrowed by ``user``; overdue books stay out."""
+    isbns = list(dict.fromkeys(isbns))
+    now = timezone.now()
+    with transaction.atomic():
+        rows = _locked_rows(
+            isbns,
+            "title",
+            "author",
+            "borrow_count",
+            "borrowed_by",
+            "due_date",
+            "fine_per_day",
+        )
+        outcomes, returned = [], []
+        for isbn in isbns:
+            row = rows.get(isbn)
+            if row is None:
+                outcomes.append({"isbn": isbn, "status": NOT_FOUND})
+            elif row["borrowed_by"] != user.pk:
+                outcomes.append({"isbn": isbn, "status": NOT_BORROWED})
+            elif overdue_fee(row, now) > 0:
+                fee = overdue_fee(row, now)
+                outcomes.append({"isbn": isbn, "status": FEE_DUE, "fee": fee})
+            else:
+                returned.append(row)
+                outcomes.append({"isbn": isbn, "status": RETURNED})
+
+        if returned:
+            Book.objects.filter(
+                isbn__in=[row["isbn"] for row in returned], borrowed_by=user
+            ).update(borrowed_by=None, due_date=None, updated_at=now)
+            notifications.send(
+                Notification(user=user, message=f"You have returned '{row['title']}'.")
+                for row in returned
+            )
+            _hand_off(returned, now)
+            _after_commit(returned)
+    return outcomes
+
+
+def hold_position(isbn, hold_id):
+    """1-based place in the queue: an index range count on ``(book, id)``."""
+    return Hold.objects.filter(book_id=isbn, id__lte=hold_id).count()
+
+
+def place_hold(user, isbn):
+    """Queue ``user`` for a book that someone else has or has reserved."""
+    with transaction.atomic():
+        _expire_reservations(timezone.now(), [isbn])
+        row = _current(isbn, "borrowed_by", "reserved_for")
+        if row is None:
+            return {"isbn": isbn, "status": NOT_FOUND}
+        if user.pk in (row["borrowed_by"], row["reserved_for"]):
+            return {"isbn": isbn, "status": ALREADY_HOLDING}
+        if row["borrowed_by"] is None and row["reserved_for"] is None:
+            return {"isbn": isbn, "status": AVAILABLE}
+        hold, _ = Hold.objects.get_or_create(book_id=isbn, user=user)
+    return {"isbn": isbn, "status": HELD, "position": hold_position(isbn, hold.id)}
+
+
+def get_hold(user, isbn):
+    hold_id = (
+        Hold.objects.filter(book_id=isbn, user=user)
+        .values_list("id", flat=True)
+        .first()
+    )
+    if hold_id is None:
+        return {"isbn": isbn, "status": NOT_FOUND}
+    return {"isbn": isbn, "status": HELD, "position": hold_position(isbn, hold_id)}
+
+
+def cancel_hold(user, isbn):
+    deleted, _ = Hold.objects.filter(book_id=isbn, user=user).delete()
+    return {"isbn": isbn, "status": CANCELLED if deleted else NOT_FOUND}
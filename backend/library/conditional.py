@@ -0,0 +1,144 @@
+"""Conditional GET (ETag / Last-Modified / 304) for catalog views.
+
+Validators are computed from a narrow ``values_list`` query over the rows a
+response would contain, so a revalidation that matches is answered with 304
+before the full rows are loaded or the serializer runs.
+"""
+
+import hashlib
+from datetime import timedelta
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .caching import representation_variant
+
+BOOK_VALIDATOR_FIELDS = (
+    "isbn",
+    "updated_at",
+    "due_date",
+    "borrowed_by__email",
+    "category__name",
+    "category__updated_at",
+)
+
+
+def overdue_days(due_date, now):
+    """Whole days past due, as used by ``Book.calculate_overdue_fee``."""
+    if due_date is None:
+        return 0
+    return max((now - due_date).days, 0)
+
+
+def book_validators(rows):
+    """ETag material and last-modified time for ``BOOK_VALIDATOR_FIELDS`` rows.
+
+    Overdue fees grow with time without any row being saved, so the number of
+    overdue days is part of the ETag and the moment the fee last went up
+    counts as a modification.
+    """
+    now = timezone.now()
+    material = []
+    changed = []
+    for isbn, updated_at, due_date, email, category, category_updated in rows:
+        days = overdue_days(due_date, now) if email else 0
+        material.append((isbn, updated_at.isoformat(), email, category, days))
+        changed += [updated_at, category_updated]
+        if days:
+            changed.append(due_date + timedelta(days=days))
+    return material, max(changed, default=None)
+
+
+class ConditionalGetMixin:
+    """Add ETag (and optionally Last-Modified) validators to GET responses.
+
+    Views implement ``get_validators(request, *args, **kwargs)`` returning
+    ``(etag_material, last_modified)``; either may be ``None``. The ETag also
+    covers the normalized query string and whether the user is authenticated,
+    since both change the representation.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    def get_etag(self, request, material):
+        raw = repr(
+            (
+                type(self).__name__,
+                representation_variant(request),
+                request.accepted_media_type,
+                material,
+            )
+        )
+        return quote_etag(hashlib.sha1(raw.encode()).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().get(request, *args, **kwargs)
+
+        material, last_modified = self.get_validators(request, *args, **kwargs)
+        etag = self.get_etag(request, material) if material is not None else None
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        if etag:
+            response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        patch_vary_headers(response, ["Authorization"])
+        return response
+
+
+class BookListValidatorsMixin(ConditionalGetMixin):
+    """Validators for a keyset-paginated book list, from the page's rows only.
+
+    No Last-Modified is sent: deleting a book changes the page without moving
+    any timestamp, so only the ETag can describe a list page. Views that add
+    data computed over the whole result set return it from
+    ``get_extra_validators``.
+    """
+
+    def get_extra_validators(self, request, queryset):
+        return None
+
+    def get_validators(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginator.get_page_queryset(queryset, request)
+        material, _ = book_validators(page.values_list(*BOOK_VALIDATOR_FIELDS))
+        return (material, self.get_extra_validators(request, queryset)), None
+
+
+class BookDetailValidatorsMixin(ConditionalGetMixin):
+    def get_validators(self, request, *args, **kwargs):
+        rows = list(
+            self.get_queryset()
+            .filter(**{self.lookup_field: kwargs[self.lookup_field]})
+            .values_list(*BOOK_VALIDATOR_FIELDS)
+        )
+        if not rows:
+            return None, None
+        return book_validators(rows)
+
+
+class AggregateValidatorsMixin(ConditionalGetMixin):
+    """Validators from the newest ``updated_at`` and row count of a list.
+
+    Any edit moves the maximum and any insert or delete changes the count, so
+    the pair changes whenever the list does. Meant for small tables.
+    """
+
+    def get_validators(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stats = queryset.aggregate(latest=Max("updated_at"), total=Count("pk"))
+        latest = stats["latest"]
+        material = (latest.isoformat() if latest else None, stats["total"])
+        return material, None
@@ -0,0 +1,80 @@
+"""Streaming catalog export as NDJSON or CSV.
+
+Rows are read in keyset chunks (``isbn > last seen``) rather than with one
+big cursor: MySQL drivers buffer a whole result set client side, so this is
+what keeps memory flat on every backend. Each chunk is encoded and handed to
+the response as soon as it is read.
+"""
+
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+COLUMNS = {
+    "isbn": "isbn",
+    "title": "title",
+    "author": "author",
+    "published_date": "published_date",
+    "category": "category__name",
+    "borrowed_by": "borrowed_by__email",
+    "due_date": "due_date",
+    "fine_per_day": "fine_per_day",
+    "borrow_count": "borrow_count",
+    "updated_at": "updated_at",
+}
+CONTENT_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Yield lists of export rows (tuples in ``COLUMNS`` order)."""
+    queryset = queryset.order_by("isbn").values_list(*COLUMNS.values())
+    last = None
+    while True:
+        chunk = queryset.filter(isbn__gt=last) if last is not None else queryset
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def ndjson_chunks(queryset, chunk_size=2000):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    names = list(COLUMNS)
+    for rows in iter_rows(queryset, chunk_size):
+        yield "".join(
+            encoder.encode(dict(zip(names, row))) + "\n" for row in rows
+        ).encode()
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(queryset, chunk_size=2000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(COLUMNS)
+    yield flush()  # The header goes out before the first query
+    for rows in iter_rows(queryset, chunk_size):
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield flush()
+
+
+def export_chunks(queryset, format, chunk_size=2000):
+    if format == "csv":
+        return csv_chunks(queryset, chunk_size)
+    return ndjson_chunks(queryset, chunk_size)
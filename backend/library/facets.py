@@ -0,0 +1,44 @@
+from django.db.models import Count, Q
+from django.db.models.functions import ExtractYear
+
+
+def book_facets(queryset):
+    """Category, availability and publication year counts for a book queryset.
+
+    Two GROUP BY queries: one per category (which also yields the borrowed
+    and available totals) and one per publication year.
+    """
+    queryset = queryset.order_by()
+    by_category = (
+        queryset.values("category_id", "category__name")
+        .annotate(
+            count=Count("pk"),
+            borrowed=Count("pk", filter=Q(borrowed_by__isnull=False)),
+        )
+        .order_by("-count", "category__name")
+    )
+    by_year = (
+        queryset.annotate(year=ExtractYear("published_date"))
+        .values("year")
+        .annotate(count=Count("pk"))
+        .order_by("-year")
+    )
+
+    categories = []
+    total = borrowed = 0
+    for row in by_category:
+        categories.append(
+            {
+                "id": row["category_id"],
+                "name": row["category__name"],
+                "count": row["count"],
+            }
+        )
+        total += row["count"]
+        borrowed += row["borrowed"]
+
+    return {
+        "category": categories,
+        "status": {"available": total - borrowed, "borrowed": borrowed},
+        "year": [{"year": row["year"], "count": row["count"]} for row in by_year],
+    }
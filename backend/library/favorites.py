@@ -0,0 +1,72 @@
+"""Favorite status for many books at once.
+
+A book grid shouldn't ask about its books one request at a time: the status
+endpoint answers a list of ISBNs with one query, and book lists can carry an
+``is_favorited`` flag computed with an ``EXISTS`` subquery on the
+``(user, book)`` unique index.
+
+The favorites list joins each favorite to its book, category and borrower,
+so full book records come back from a single query.
+"""
+
+from django.db.models import Count, Exists, F, Max, OuterRef, Value
+
+from .models import FavoriteBook
+from .overdue import with_overdue
+
+MAX_STATUS_ISBNS = 100
+
+
+def favorite_status(user, isbns):
+    """``{isbn: favorited}`` for ``isbns``, from a single query."""
+    favorited = set(
+        FavoriteBook.objects.filter(user=user, book_id__in=isbns).values_list(
+            "book_id", flat=True
+        )
+    )
+    return {isbn: isbn in favorited for isbn in isbns}
+
+
+def favorite_books(user, columns):
+    """``user``'s favorites, newest first, as rows of book ``columns``.
+
+    Rows also carry the favorite's ``id`` and ``created_at``. The query runs
+    from the favorites side so that the ordering, including the id tiebreak
+    keyset pagination adds, is read straight off the ``(user, created_at)``
+    index.
+    """
+    fields = {
+        column: F("book_id" if column == "isbn" else f"book__{column}")
+        for column in columns
+        if column != "overdue_fee"
+    }
+    return (
+        with_overdue(FavoriteBook.objects.filter(user=user), prefix="book__")
+        .order_by("-created_at")
+        .values("id", "created_at", "overdue_fee", **fields)
+    )
+
+
+def with_favorited(queryset, user):
+    """Annotate ``is_favorited`` for ``user`` (always false when anonymous)."""
+    if not user.is_authenticated:
+        return queryset.annotate(is_favorited=Value(False))
+    return queryset.annotate(
+        is_favorited=Exists(
+            FavoriteBook.objects.filter(user=user, book=OuterRef("pk"))
+        )
+    )
+
+
+def favorites_validator(user):
+    """ETag material that changes whenever ``user``'s favorites do.
+
+    Adding a favorite raises the highest id and removing one lowers the
+    count, so the pair never repeats across a change.
+    """
+    if not user.is_authenticated:
+        return None
+    stats = FavoriteBook.objects.filter(user=user).aggregate(
+        latest=Max("id"), total=Count("id")
+    )
+    return user.pk, stats["latest"], stats["total"]
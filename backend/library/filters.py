@@ -0,0 +1,54 @@
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from . import search
+
+
+class BookSearchFilter(BaseFilterBackend):
+    """Filter and rank books through the search index.
+
+    ``?search=`` matches title, author and category name together, while
+    ``?title=``, ``?author=`` and ``?category=`` restrict a query to one field.
+    Unless the client asks for an explicit ``ordering``, matches come back
+    best first: the ranking is left on ``request.ranking`` for
+    ``KeysetPagination`` to page through.
+    """
+
+    search_param = "search"
+    field_params = {
+        "title": ("title",),
+        "author": ("author",),
+        "category": ("category",),
+    }
+
+    def get_clauses(self, request):
+        clauses = []
+        text = request.query_params.get(self.search_param, "").strip()
+        if text:
+            clauses.append((text, search.FIELDS))
+        for param, fields in self.field_params.items():
+            text = request.query_params.get(param, "").strip()
+            if text:
+                clauses.append((text, fields))
+        return clauses
+
+    def filter_queryset(self, request, queryset, view):
+        clauses = self.get_clauses(request)
+        if not clauses:
+            return queryset
+
+        # Conditional GET filters the queryset twice in one request
+        cache_key = repr(clauses)
+        memo = getattr(request, "_book_search_groups", {})
+        if cache_key not in memo:
+            memo[cache_key] = search.query_groups(clauses)
+            request._book_search_groups = memo
+        groups = memo[cache_key]
+        if not groups:
+            return queryset.none()
+
+        queryset = queryset.filter(search.matches(groups))
+        if api_settings.ORDERING_PARAM not in request.query_params:
+            if getattr(request, "ranking", None) is None:
+                request.ranking = search.rank(groups)
+        return queryset
@@ -0,0 +1,169 @@
+"""Local verification of Google Sign-In ID tokens.
+
+An ID token is a JWT signed with one of the keys Google publishes as a JSON
+Web Key Set. ``KeySet`` keeps that set in memory for as long as Google's
+``Cache-Control: max-age`` allows (``LIBRARY_GOOGLE_JWKS_TTL`` seconds if it
+gives none), so verifying a token is a signature check and no network call.
+From ``REFRESH_FRACTION`` of the way through that lifetime a background
+thread fetches the set again while the cached keys keep being served; only
+a cold start, an expired set or an unknown key id makes a caller wait for
+the fetch, and unknown ids refetch at most once per ``MIN_REFETCH_INTERVAL``.
+
+``verify_id_token`` checks the signature, expiry, issuer, that the audience
+is ``GOOGLE_CLIENT_ID`` and that Google has verified the email address.
+RS256 needs PyJWT's ``cryptography`` extra.
+"""
+
+import logging
+import re
+import threading
+import time
+
+import jwt
+import requests
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+JWKS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+REFRESH_FRACTION = 0.75
+MIN_REFETCH_INTERVAL = 60
+LEEWAY = 30  # Seconds of clock skew tolerated on exp and iat
+
+
+class InvalidIDToken(Exception):
+    """The token is not a valid Google ID token for this application."""
+
+
+class KeySetUnavailable(Exception):
+    """The signing keys could not be fetched and none are cached."""
+
+
+def fetch_jwks(url):
+    """``(jwks, max_age)`` from ``url``; ``max_age`` is ``None`` if not sent."""
+    response = requests.get(
+        url, timeout=getattr(settings, "LIBRARY_GOOGLE_HTTP_TIMEOUT", 5)
+    )
+    response.raise_for_status()
+    match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+    return response.json(), int(match.group(1)) if match else None
+
+
+class KeySet:
+    def __init__(self, url=JWKS_URL, fetch=fetch_jwks, ttl=3600):
+        self.url = url
+        self.fetch = fetch
+        self.ttl = ttl
+        self._keys = {}  # kid -> PyJWK
+        self._attempted_at = float("-inf")  # Last fetch, successful or not
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._lock = threading.Lock()  # Serializes fetches
+        self._background = threading.Lock()  # Held by the refresh thread
+
+    def get(self, kid):
+        """The key with id ``kid``, or ``None`` if Google doesn't publish it."""
+        now = time.monotonic()
+        if now >= self._expires_at:
+            self._refresh()
+        elif now >= self._refresh_at:
+            self._refresh_in_background()
+        if not self._keys:
+            raise KeySetUnavailable
+        key = self._keys.get(kid)
+        if key is None and (
+            time.monotonic() - self._attempted_at >= MIN_REFETCH_INTERVAL
+        ):
+            # Google may have rotated in a key we haven't seen yet
+            self._refresh()
+            key = self._keys.get(kid)
+        return key
+
+    def _refresh(self):
+        attempted_at = self._attempted_at
+        with self._lock:
+            if self._attempted_at != attempted_at:
+                return  # Another caller fetched while this one waited
+            now = self._attempted_at = time.monotonic()
+            try:
+                jwks, max_age = self.fetch(self.url)
+                keys = {
+                    key.key_id: key
+                    for key in jwt.PyJWKSet.from_dict(jwks).keys
+                    if key.key_id
+                }
+            except Exception:
+                logger.exception("Fetching %s failed", self.url)
+                if not self._keys:
+                    raise KeySetUnavailable
+                # Keep serving the old keys, and retry in a while, not per call
+                self._refresh_at = now + MIN_REFETCH_INTERVAL
+                self._expires_at = max(self._expires_at, self._refresh_at)
+                return
+            lifetime = self.ttl if max_age is None else max_age
+            self._keys = keys
+            self._expires_at = now + lifetime
+            self._refresh_at = now + lifetime * REFRESH_FRACTION
+
+    def _refresh_in_background(self):
+        if not self._background.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self._refresh()
+            except KeySetUnavailable:
+                pass
+            finally:
+                self._background.release()
+
+        threading.Thread(target=run, name="google-jwks", daemon=True).start()
+
+
+_key_set = None
+_key_set_lock = threading.Lock()
+
+
+def get_key_set():
+    global _key_set
+    if _key_set is None:
+        with _key_set_lock:
+            if _key_set is None:
+                _key_set = KeySet(
+                    url=getattr(settings, "LIBRARY_GOOGLE_JWKS_URL", JWKS_URL),
+                    ttl=getattr(settings, "LIBRARY_GOOGLE_JWKS_TTL", 3600),
+                )
+    return _key_set
+
+
+def verify_id_token(token, key_set=None):
+    """The claims of ``token`` once it checks out; raises ``InvalidIDToken``.
+
+    May also raise ``KeySetUnavailable`` if Google's keys can't be fetched.
+    """
+    key_set = key_set or get_key_set()
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as error:
+        raise InvalidIDToken(str(error))
+    if header.get("alg") != "RS256":
+        raise InvalidIDToken("Unexpected signing algorithm")
+    key = key_set.get(header.get("kid"))
+    if key is None:
+        raise InvalidIDToken("Unknown signing key")
+    try:
+        claims = jwt.decode(
+            token,
+            key.key,
+            algorithms=["RS256"],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=ISSUERS,
+            leeway=LEEWAY,
+            options={"require": ["exp", "iat", "iss", "aud", "sub"]},
+        )
+    except jwt.PyJWTError as error:
+        raise InvalidIDToken(str(error))
+    if not claims.get("email") or claims.get("email_verified") is not True:
+        raise InvalidIDToken("No verified email address")
+    return claims
@@ -0,0 +1,107 @@
+"""Password checks on a bounded pool of worker threads.
+
+PBKDF2 costs tens of milliseconds of CPU per check. Run inline it holds a
+request thread, or under ASGI the thread every synchronous view shares,
+for that long, so a burst of logins queues everything behind it. Checks are
+handed to ``LIBRARY_HASHING_WORKERS`` threads instead; ``hashlib`` releases
+the GIL while it hashes, so they run in parallel with each other and with
+request handling. No more than ``LIBRARY_HASHING_QUEUE_LIMIT`` checks may be
+running or waiting at once; beyond that ``check`` raises ``HashingPoolFull``
+straight away, so an overloaded login endpoint answers 503 in microseconds
+rather than letting its backlog grow.
+
+The workers only hash: they never touch the database.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class HashingPoolFull(Exception):
+    """Too many password checks are already running or queued."""
+
+
+def _check(password, encoded):
+    """``(valid, rehashed)``: ``rehashed`` replaces an outdated ``encoded``."""
+    outdated = []
+    valid = check_password(password, encoded, setter=outdated.append)
+    return valid, make_password(password) if outdated else None
+
+
+class HashingPool:
+    def __init__(self, workers, queue_limit):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._executor = (
+            ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+            if workers > 0
+            else None
+        )
+
+    async def check(self, password, encoded):
+        """``(valid, rehashed)`` for ``password`` against ``encoded``.
+
+        With no workers the check runs inline, blocking the event loop; that
+        mode only exists to compare against.
+        """
+        if self._executor is None:
+            return _check(password, encoded)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingPoolFull
+        with self._lock:
+            self._in_flight += 1
+        try:
+            future = self._executor.submit(_check, password, encoded)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "in_flight": self._in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = getattr(
+                    settings, "LIBRARY_HASHING_WORKERS", min(4, os.cpu_count() or 1)
+                )
+                limit = getattr(
+                    settings, "LIBRARY_HASHING_QUEUE_LIMIT", 8 * max(workers, 1)
+                )
+                _pool = HashingPool(workers, limit)
+    return _pool
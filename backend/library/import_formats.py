@@ -0,0 +1,169 @@
+"""Readers and validation for catalog import files.
+
+Everything here is plain Python with no Django imports, so validation can
+run in worker processes that never set Django up.
+"""
+
+import csv
+import io
+import json
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+FORMATS = ("csv", "jsonl", "marc")
+
+_ISBN_RE = re.compile(r"\d{9}[\dX]|\d{13}")
+_YEAR_RE = re.compile(r"\d{4}")
+
+
+def guess_format(filename):
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return {"ndjson": "jsonl", "mrc": "marc", "json": "jsonl"}.get(
+        extension, extension
+    )
+
+
+# Readers: each yields (record number, dict of raw values)
+
+
+def read_csv(binary):
+    reader = csv.DictReader(io.TextIOWrapper(binary, encoding="utf-8-sig"))
+    for number, row in enumerate(reader, start=2):  # Line 1 is the header
+        yield number, row
+
+
+def read_jsonl(binary):
+    for number, line in enumerate(io.TextIOWrapper(binary, encoding="utf-8"), 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            record = {"__error__": f"Invalid JSON: {exc}"}
+        if not isinstance(record, dict):
+            record = {"__error__": "Each line must be a JSON object"}
+        yield number, record
+
+
+def _marc_subfields(data):
+    """Split a MARC data field into {code: first value}, skipping indicators."""
+    subfields = {}
+    for chunk in data[2:].split("\x1f")[1:]:
+        if chunk:
+            subfields.setdefault(chunk[0], chunk[1:].strip())
+    return subfields
+
+
+def read_marc(binary):
+    """Minimal MARC 21 reader for the fields the catalog uses.
+
+    020$a ISBN, 245$a$b title, 100$a author, 264$c or 260$c publication
+    date and 650$a category.
+    """
+    number = 0
+    while True:
+        leader = binary.read(24)
+        if not leader:
+            return
+        number += 1
+        try:
+            length = int(leader[:5])
+            base = int(leader[12:17])
+            body = binary.read(length - 24)
+            directory = body[: base - 24 - 1]
+            fields = {}
+            for start in range(0, len(directory), 12):
+                entry = directory[start : start + 12].decode("ascii")
+                tag, size, offset = entry[:3], int(entry[3:7]), int(entry[7:12])
+                raw = body[base - 24 + offset : base - 24 + offset + size - 1]
+                fields.setdefault(tag, raw.decode("utf-8", "replace"))
+        except (ValueError, UnicodeDecodeError) as exc:
+            yield number, {"__error__": f"Malformed MARC record: {exc}"}
+            return  # Record boundaries are lost; stop reading
+
+        record = {}
+        if "020" in fields:
+            record["isbn"] = _marc_subfields(fields["020"]).get("a", "").split(" ")[0]
+        if "245" in fields:
+            title = _marc_subfields(fields["245"])
+            record["title"] = " ".join(
+                part for part in (title.get("a"), title.get("b")) if part
+            ).rstrip(" /:;,.")
+        if "100" in fields:
+            record["author"] = _marc_subfields(fields["100"]).get("a", "").rstrip(",.")
+        for tag in ("264", "260"):
+            if tag in fields:
+                record["published_date"] = _marc_subfields(fields[tag]).get("c", "")
+                break
+        if "650" in fields:
+            record["category"] = _marc_subfields(fields["650"]).get("a", "").rstrip(".")
+        yield number, record
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "marc": read_marc}
+
+
+# Validation (pure Python so it can run in a process pool)
+
+
+def _parse_date(value):
+    value = (value or "").strip()
+    if not value:
+        raise ValueError("This field is required.")
+    for pattern in ("%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, pattern).date()
+        except ValueError:
+            pass
+    year = _YEAR_RE.search(value)  # MARC dates look like "c1999."
+    if year:
+        return date(int(year.group()), 1, 1)
+    raise ValueError("Enter a date as YYYY-MM-DD or a year.")
+
+
+def validate_record(item):
+    """Return ``(number, cleaned, errors)`` for one raw record."""
+    number, raw = item
+    if "__error__" in raw:
+        return number, {}, {"record": raw["__error__"]}
+
+    errors = {}
+    cleaned = {}
+
+    isbn = re.sub(r"[\s-]", "", str(raw.get("isbn") or "")).upper()
+    if not _ISBN_RE.fullmatch(isbn):
+        errors["isbn"] = "Enter a 10 or 13 character ISBN."
+    cleaned["isbn"] = isbn
+
+    for field, limit in (("title", 255), ("author", 255)):
+        value = str(raw.get(field) or "").strip()
+        if not value:
+            errors[field] = "This field is required."
+        elif len(value) > limit:
+            errors[field] = f"Ensure this field has no more than {limit} characters."
+        cleaned[field] = value
+
+    category = str(raw.get("category") or raw.get("category_name") or "").strip()
+    if not category:
+        errors["category"] = "This field is required."
+    elif len(category) > 100:
+        errors["category"] = "Ensure this field has no more than 100 characters."
+    cleaned["category"] = category
+
+    try:
+        cleaned["published_date"] = _parse_date(str(raw.get("published_date") or ""))
+    except ValueError as exc:
+        errors["published_date"] = str(exc)
+
+    fine = raw.get("fine_per_day")
+    if fine not in (None, ""):
+        try:
+            fine = Decimal(str(fine)).quantize(Decimal("0.01"))
+            if fine < 0 or fine >= 10000:
+                raise InvalidOperation
+            cleaned["fine_per_day"] = fine
+        except InvalidOperation:
+            errors["fine_per_day"] = "Enter an amount between 0 and 9999.99."
+
+    return number, cleaned, errors
@@ -0,0 +1,154 @@
+"""Streaming bulk import of catalog records.
+
+Records are read one at a time from CSV, JSON Lines or MARC 21 (ISO 2709)
+input, validated in batches (optionally in a process pool), and written with
+one upsert on ``isbn`` per batch. Memory use depends on the batch size, not
+on the size of the file.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from . import search
+from .caching import bump_catalog_version
+from .import_formats import READERS, validate_record
+from .models import Book, Category
+
+MAX_REPORTED_ERRORS = 1000
+UPSERT_FIELDS = ["title", "author", "published_date", "category", "updated_at"]
+
+
+class BookImporter:
+    def __init__(self, batch_size=1000, workers=0):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.categories = {}
+        self.processed = 0
+        self.imported = 0
+        self.superseded = 0
+        self.failed = 0
+        self.errors = []
+
+    def report(self):
+        return {
+            "processed": self.processed,
+            "imported": self.imported,
+            # Earlier records overridden by a later one with the same ISBN
+            "superseded": self.superseded,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+    def add_error(self, number, isbn, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"record": number, "isbn": isbn, "errors": errors})
+
+    def run(self, records):
+        self.categories = {
+            category.name: category for category in Category.objects.all()
+        }
+        executor = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            while True:
+                batch = list(islice(records, self.batch_size))
+                if not batch:
+                    break
+                if executor:
+                    chunksize = max(len(batch) // (self.workers * 4), 1)
+                    results = executor.map(validate_record, batch, chunksize=chunksize)
+                else:
+                    results = map(validate_record, batch)
+                self.write_batch(list(results))
+        finally:
+            if executor:
+                executor.shutdown()
+        return self.report()
+
+    def resolve_categories(self, names):
+        missing = [name for name in names if name not in self.categories]
+        if missing:
+            Category.objects.bulk_create(
+                [Category(name=name) for name in missing], ignore_conflicts=True
+            )
+            for category in Category.objects.filter(name__in=missing):
+                self.categories[category.name] = category
+
+    def write_batch(self, results):
+        valid = {}
+        for number, cleaned, errors in results:
+            self.processed += 1
+            if errors:
+                self.add_error(number, cleaned.get("isbn") or None, errors)
+            else:
+                # The last occurrence of an ISBN in a batch wins
+                self.superseded += valid.pop(cleaned["isbn"], None) is not None
+                valid[cleaned["isbn"]] = (number, cleaned)
+        if not valid:
+            return
+
+        rows = list(valid.values())
+        known = dict(self.categories)
+        try:
+            with transaction.atomic():
+                self.resolve_categories({cleaned["category"] for _, cleaned in rows})
+                self.upsert([cleaned for _, cleaned in rows])
+            self.imported += len(rows)
+        except DatabaseError:
+            # Isolate the offending rows instead of failing the whole batch
+            for number, cleaned in rows:
+                self.categories = dict(known)  # Forget rolled back categories
+                try:
+                    with transaction.atomic():
+                        self.resolve_categories({cleaned["category"]})
+                        self.upsert([cleaned])
+                    self.imported += 1
+                    known = self.categories
+                except DatabaseError as exc:
+                    self.add_error(number, cleaned["isbn"], {"record": str(exc)})
+            self.categories = known
+        # bulk_create sends no signals, so invalidate cached listings here
+        bump_catalog_version()
+
+    def upsert(self, rows):
+        now = timezone.now()
+        # Rows without a fine keep the stored one (or the model default)
+        groups = {True: [], False: []}
+        for row in rows:
+            book = Book(
+                isbn=row["isbn"],
+                title=row["title"],
+                author=row["author"],
+                published_date=row["published_date"],
+                category=self.categories[row["category"]],
+                updated_at=now,
+            )
+            if "fine_per_day" in row:
+                book.fine_per_day = row["fine_per_day"]
+            groups["fine_per_day" in row].append(book)
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target, and Django
+        # refuses unique_fields there
+        target = (
+            {"unique_fields": ["isbn"]}
+            if connection.features.supports_update_conflicts_with_target
+            else {}
+        )
+        for with_fine, books in groups.items():
+            if books:
+                Book.objects.bulk_create(
+                    books,
+                    update_conflicts=True,
+                    update_fields=UPSERT_FIELDS + ["fine_per_day"] * with_fine,
+                    **target,
+                )
+        search.index_books(groups[True] + groups[False])
+
+
+def import_books(binary, format, batch_size=1000, workers=0):
+    """Import a binary file-like object in ``format``; returns a report dict."""
+    records = READERS[format](binary)
+    return BookImporter(batch_size=batch_size, workers=workers).run(records)
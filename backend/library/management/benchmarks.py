@@ -0,0 +1,22 @@
+"""Helpers shared by the benchmark commands."""
+
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def test_database():
+    """Point the default connection at a fresh test database, then drop it.
+
+    Benchmarks that drive requests or borrows from other threads need the
+    seed data committed, so it can't live in a transaction that is rolled
+    back afterwards. An existing test database is replaced.
+    """
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
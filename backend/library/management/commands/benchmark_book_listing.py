@@ -0,0 +1,91 @@
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from library.models import Book, Category
+from library.overdue import with_overdue
+from library.serializers import BookListingSerializer, BookSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare BookSerializer with the values()-based listing path. "
+        "Seed rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[10, 100, 1000])
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(max(options["rows"]))
+                for rows in options["rows"]:
+                    self.run(rows, options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        category = Category.objects.create(name="__benchmark__")
+        due = timezone.now() - timedelta(days=3)
+        Book.objects.bulk_create(
+            Book(
+                isbn=f"B{i:012}",
+                title=f"Benchmark Book {i}",
+                author=f"Author {i % 97}",
+                published_date=date(1950 + i % 70, 1, 1),
+                category=category,
+                image=f"book_images/{i}.jpg" if i % 2 else None,
+                due_date=due if i % 5 == 0 else None,
+            )
+            for i in range(count)
+        )
+
+    def time(self, fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
+
+    def run(self, rows, repeat):
+        factory = APIRequestFactory()
+        request = Request(factory.get("/api/books/", SERVER_NAME="localhost"))
+        request.user = AnonymousUser()
+        context = {"request": request}
+        renderer = JSONRenderer()
+        books = with_overdue(Book.objects.filter(isbn__startswith="B")).order_by(
+            "isbn"
+        )[:rows]
+
+        def model_path():
+            queryset = BookSerializer.setup_eager_loading(books)
+            renderer.render(BookSerializer(queryset, many=True, context=context).data)
+
+        def values_path():
+            serializer = BookListingSerializer(context)
+            renderer.render(
+                serializer.serialize(books.values(*BookListingSerializer.columns))
+            )
+
+        slow = self.time(model_path, repeat)
+        fast = self.time(values_path, repeat)
+        self.stdout.write(
+            f"{rows:>6} rows  BookSerializer {slow:8.2f} ms  "
+            f"BookListingSerializer {fast:8.2f} ms  speedup {slow / fast:5.1f}x"
+        )
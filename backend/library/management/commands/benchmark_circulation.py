@@ -0,0 +1,115 @@
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.test.utils import override_settings
+
+from library import circulation, notifications
+from library.management.benchmarks import test_database
+from library.models import Book, Category, Notification, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer borrow/return from many threads and report throughput, "
+        "latency and winners, with notifications written inline and behind "
+        "the commit. Threads need committed rows, so it runs against a test "
+        "database that is dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--attempts", type=int, default=50)
+        parser.add_argument("--books", type=int, default=16)
+
+    def handle(self, *args, **options):
+        with test_database():
+            category = Category.objects.create(name="__benchmark__")
+            users = [
+                User.objects.create(email=f"benchmark{i}@example.invalid")
+                for i in range(options["threads"])
+            ]
+            for books in (1, options["books"]):
+                Book.objects.filter(category=category).delete()
+                Book.objects.bulk_create(
+                    Book(
+                        isbn=f"C{i:012}",
+                        title=f"Benchmark {i}",
+                        author="Author",
+                        published_date=date(2000, 1, 1),
+                        category=category,
+                    )
+                    for i in range(books)
+                )
+                for write_behind in (False, True):
+                    with override_settings(
+                        LIBRARY_NOTIFICATION_WRITE_BEHIND=write_behind
+                    ):
+                        self.run(users, books, options["attempts"], write_behind)
+
+    def run(self, users, books, attempts, write_behind):
+        notified = Notification.objects.filter(user__in=users)
+        before = notified.count()
+        barrier = threading.Barrier(len(users))
+        lock = threading.Lock()
+        counts = {"requests": 0, "borrowed": 0, "returned": 0, "retries": 0}
+        latencies = []
+
+        def call(action, *args):
+            start = time.perf_counter()
+            while True:
+                try:
+                    outcome = action(*args)
+                    break
+                except OperationalError:  # SQLite: database is locked
+                    with lock:
+                        counts["retries"] += 1
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            return outcome
+
+        def worker(number, user):
+            barrier.wait()
+            try:
+                for attempt in range(attempts):
+                    isbn = f"C{(number + attempt) % books:012}"
+                    outcome = call(circulation.borrow_book, user, isbn)
+                    won = outcome["status"] == circulation.BORROWED
+                    if won:
+                        call(circulation.return_book, user, isbn)
+                    with lock:
+                        counts["requests"] += 2 if won else 1
+                        counts["borrowed"] += won
+                        counts["returned"] += won
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(number, user))
+            for number, user in enumerate(users)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # Every won borrow and its return notify exactly once
+        notifications.queue.flush()
+        unaccounted = notified.count() - before - 2 * counts["borrowed"]
+        latencies.sort()
+        p50, p99 = (
+            latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.99)
+        )
+        self.stdout.write(
+            f"{'write-behind' if write_behind else 'inline':>12}  "
+            f"{len(users):>3} threads on {books:>3} books  "
+            f"{counts['requests'] / elapsed:8.0f} req/s  "
+            f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+            f"borrows won {counts['borrowed']:>5}  "
+            f"lost {len(users) * attempts - counts['borrowed']:>5}  "
+            f"retries {counts['retries']:>5}  unaccounted {unaccounted}"
+        )
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import date
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.test.utils import override_settings
+
+from library import hashing
+from library.management.benchmarks import test_database
+from library.models import Book, Category, User
+
+PASSWORD = "benchmark-password"
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return 0.0, 0.0
+    return tuple(latencies[int(len(latencies) * q)] * 1000 for q in (0.5, 0.99))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire a burst of concurrent logins through the ASGI request path while "
+        "a reader keeps fetching the book list, and report catalog latency "
+        "with passwords hashed inline and on the hashing pool. Runs against "
+        "a test database that is dropped afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=64)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--queue-limit", type=int, default=16)
+
+    def handle(self, *args, **options):
+        with test_database():
+            self.benchmark(options)
+
+    def benchmark(self, options):
+        category = Category.objects.create(name="__benchmark__")
+        Book.objects.bulk_create(
+            Book(
+                isbn=f"L{i:012}",
+                title=f"Benchmark {i}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+            )
+            for i in range(50)
+        )
+        encoded = make_password(PASSWORD)
+        users = User.objects.bulk_create(
+            User(email=f"login{i}@example.invalid", password=encoded)
+            for i in range(options["concurrency"])
+        )
+        # Each refused login would otherwise log a "Service Unavailable" error
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        for workers in (0, options["workers"]):
+            pool = hashing.HashingPool(workers, options["queue_limit"])
+            previous, hashing._pool = hashing._pool, pool
+            try:
+                with override_settings(ALLOWED_HOSTS=["testserver"]):
+                    asyncio.run(self.run(users, pool, options))
+            finally:
+                hashing._pool = previous
+                pool.shutdown()
+
+    async def run(self, users, pool, options):
+        client = AsyncClient()
+        catalog = []
+        statuses = {}
+        login_latencies = []
+        done = asyncio.Event()
+
+        async def read_catalog():
+            while not done.is_set():
+                start = time.perf_counter()
+                await client.get("/api/books/", {"page_size": 10})
+                catalog.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        async def login(user):
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/login/user/",
+                json.dumps({"email": user.email, "password": PASSWORD}),
+                content_type="application/json",
+            )
+            login_latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def logins(number):
+            for _ in range(number, options["logins"], len(users)):
+                await login(users[number])
+
+        reader = asyncio.create_task(read_catalog())
+        await asyncio.sleep(0.2)  # Baseline reads before the burst
+        baseline = len(catalog)
+        start = time.perf_counter()
+        await asyncio.gather(*(logins(number) for number in range(len(users))))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await reader
+
+        base_p50, base_p99 = percentiles(catalog[:baseline])
+        p50, p99 = percentiles(catalog[baseline:])
+        login_p50, login_p99 = percentiles(login_latencies)
+        self.stdout.write(
+            f"{'inline' if pool.workers == 0 else f'{pool.workers} workers':>10}  "
+            f"{len(login_latencies) / elapsed:6.1f} logins/s  "
+            f"login p50 {login_p50:8.1f} ms p99 {login_p99:8.1f} ms  "
+            f"catalog p99 idle {base_p99:7.1f} ms burst {p99:8.1f} ms "
+            f"(p50 {base_p50:6.1f}/{p50:7.1f})  "
+            f"statuses {dict(sorted(statuses.items()))}"
+        )
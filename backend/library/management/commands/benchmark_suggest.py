@@ -0,0 +1,82 @@
+import random
+import statistics
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.models import Book, Category
+from library.suggest import SuggestionIndex
+
+WORDS = (
+    "river shadow winter garden empire silent golden night house stone "
+    "light secret storm history dream ocean machine journey kingdom city"
+).split()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure build time, memory and lookup latency of the autocomplete "
+        "index. Seed rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=50000)
+        parser.add_argument("--queries", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options["books"])
+                self.run(options["queries"])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, count):
+        rng = random.Random(1)
+        category = Category.objects.create(name="__benchmark__")
+        batch = []
+        for i in range(count):
+            batch.append(
+                Book(
+                    isbn=f"S{i:012}",
+                    title=" ".join(rng.choices(WORDS, k=rng.randint(2, 6))) + f" {i}",
+                    author=f"{rng.choice(WORDS).title()} Author{i % 5000}",
+                    published_date=date(2000, 1, 1),
+                    category=category,
+                    borrow_count=rng.randint(0, 500),
+                )
+            )
+            if len(batch) == 5000:
+                Book.objects.bulk_create(batch)
+                batch = []
+        Book.objects.bulk_create(batch)
+
+    def run(self, queries):
+        index = SuggestionIndex()
+        start = time.perf_counter()
+        index.rebuild()
+        build = time.perf_counter() - start
+
+        rng = random.Random(2)
+        prefixes = [rng.choice(WORDS)[: rng.randint(1, 6)] for _ in range(queries)]
+        for prefix in prefixes:  # Warm up the lazily ranked blocks
+            index.suggest(prefix, 10)
+        samples = []
+        for prefix in prefixes:
+            start = time.perf_counter()
+            index.suggest(prefix, 10)
+            samples.append((time.perf_counter() - start) * 1e6)
+        samples.sort()
+
+        self.stdout.write(f"entries        {len(index)}")
+        self.stdout.write(f"build          {build:.2f} s")
+        self.stdout.write(f"memory         {index.memory_usage() / 2**20:.1f} MiB")
+        self.stdout.write(f"lookup p50     {statistics.median(samples):.0f} us")
+        self.stdout.write(f"lookup p99     {samples[int(len(samples) * 0.99)]:.0f} us")
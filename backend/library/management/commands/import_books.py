@@ -0,0 +1,58 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.import_formats import FORMATS, guess_format
+from library.importer import import_books
+
+
+class Command(BaseCommand):
+    help = "Upsert books from a CSV, JSON Lines or MARC file, keyed on ISBN."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Input format. Guessed from the file extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of records validated and written per transaction.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Processes used to validate records (1 validates inline).",
+        )
+
+    def handle(self, *args, **options):
+        format = options["format"] or guess_format(options["path"])
+        if format not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {options['path']}")
+
+        with open(options["path"], "rb") as binary:
+            report = import_books(
+                binary,
+                format,
+                batch_size=options["batch_size"],
+                workers=options["workers"],
+            )
+
+        for error in report["errors"]:
+            self.stderr.write(
+                f"record {error['record']} {error['isbn'] or ''}: {error['errors']}"
+            )
+        if report["errors_truncated"]:
+            self.stderr.write("... more errors omitted")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {report['processed']} records: "
+                f"{report['imported']} imported, "
+                f"{report['superseded']} superseded by a later duplicate, "
+                f"{report['failed']} failed."
+            )
+        )
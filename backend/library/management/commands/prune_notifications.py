@@ -0,0 +1,63 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.retention import FileArchive, TableArchive, prune
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete notifications past their retention period in small primary "
+        "key ranges, optionally archiving them first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Width of the id range deleted per transaction.",
+        )
+        parser.add_argument(
+            "--archive",
+            choices=("none", "table", "file"),
+            default="none",
+            help="Copy pruned rows to ArchivedNotification or a gzip file.",
+        )
+        parser.add_argument(
+            "--archive-path",
+            help="JSON Lines file appended to with --archive file (gzipped).",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            metavar="SECONDS",
+            help="Sleep between batches to leave room for other writers.",
+        )
+        parser.add_argument(
+            "--every",
+            type=int,
+            metavar="SECONDS",
+            help="Keep running, pruning at this interval.",
+        )
+
+    def handle(self, *args, **options):
+        archive = None
+        if options["archive"] == "table":
+            archive = TableArchive()
+        elif options["archive"] == "file":
+            if not options["archive_path"]:
+                raise CommandError("--archive file needs --archive-path.")
+            archive = FileArchive(options["archive_path"])
+
+        while True:
+            pruned = prune(
+                batch_size=options["batch_size"],
+                archive=archive,
+                pause=options["pause"],
+            )
+            self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} notifications."))
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.circulation import expire_reservations
+from library.reminders import SweepConflict, sweep
+
+
+class Command(BaseCommand):
+    help = (
+        "Notify borrowers of books due tomorrow or 1, 7 or 30 days overdue, "
+        "and pass books whose reservation lapsed to the next hold. Each run "
+        "only handles thresholds crossed since the previous one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Loans read and notifications inserted per transaction.",
+        )
+        parser.add_argument(
+            "--every",
+            type=int,
+            metavar="SECONDS",
+            help="Keep running, sweeping at this interval.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent = sweep(chunk_size=options["chunk_size"])
+            except SweepConflict:
+                raise CommandError("Another sweep is running.")
+            self.stdout.write(self.style.SUCCESS(f"Sent {sent} reminders."))
+            expired = expire_reservations()
+            self.stdout.write(
+                self.style.SUCCESS(f"Passed on {expired} lapsed reservations.")
+            )
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
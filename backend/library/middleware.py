@@ -0,0 +1,27 @@
+"""Answers for errors raised below the views that handle them.
+
+``HashingPoolFull`` can come out of any password check made on the pool in
+``library.hashing``, including ``EmailBackend.aauthenticate`` called through
+``django.contrib.auth.aauthenticate``. ``LoginView`` answers it itself; this
+middleware gives every other caller the same 503 instead of a 500.
+"""
+
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+
+from .hashing import HashingPoolFull
+
+
+def pool_full_response():
+    response = JsonResponse(
+        {"error": "Too many logins in progress, try again shortly"}, status=503
+    )
+    response["Retry-After"] = "1"
+    return response
+
+
+class HashingPoolFullMiddleware(MiddlewareMixin):
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingPoolFull):
+            return pool_full_response()
+        return None
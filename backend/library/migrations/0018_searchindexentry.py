@@ -0,0 +1,110 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+import re
+import unicodedata
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The analyzer of library.search as of this migration, so later changes to it
+# can't change what this migration builds. They come with a migration (or a
+# "manage.py rebuild_search_index") of their own.
+MAX_TERM_LENGTH = 64
+MAX_COUNT = 32767  # PositiveSmallIntegerField
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SUFFIXES = (
+    ("ational", "ate"),
+    ("ization", "ize"),
+    ("fulness", "ful"),
+    ("ousness", "ous"),
+    ("iveness", "ive"),
+    ("ement", ""),
+    ("ment", ""),
+    ("ness", ""),
+    ("ings", ""),
+    ("ing", ""),
+    ("ies", "y"),
+    ("ied", "y"),
+    ("edly", ""),
+    ("ed", ""),
+    ("ly", ""),
+    ("es", ""),
+    ("s", ""),
+)
+
+
+def stem(token):
+    if token.isdigit() or len(token) <= 3:
+        return token
+    for suffix, replacement in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "s" and token.endswith("ss"):
+                return token
+            token = token[: -len(suffix)] + replacement
+            break
+    if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "lsz":
+        token = token[:-1]
+    return token
+
+
+def analyze(text):
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return [stem(token)[:MAX_TERM_LENGTH] for token in TOKEN_RE.findall(text)]
+
+
+def build_search_index(apps, schema_editor):
+    Book = apps.get_model("library", "Book")
+    SearchIndexEntry = apps.get_model("library", "SearchIndexEntry")
+    batch = []
+    for book in Book.objects.select_related("category").iterator(chunk_size=1000):
+        fields = {
+            "title": book.title,
+            "author": book.author,
+            "category": book.category.name if book.category_id else "",
+        }
+        for field, text in fields.items():
+            terms = analyze(text)
+            for term, frequency in Counter(terms).items():
+                batch.append(
+                    SearchIndexEntry(
+                        term=term,
+                        field=field,
+                        book_id=book.pk,
+                        frequency=min(frequency, MAX_COUNT),
+                        length=min(len(terms), MAX_COUNT),
+                    )
+                )
+        if len(batch) >= 1000:
+            SearchIndexEntry.objects.bulk_create(batch)
+            batch = []
+    SearchIndexEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0017_favoritebook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('field', models.CharField(choices=[('title', 'Title'), ('author', 'Author'), ('category', 'Category')], max_length=10)),
+                ('frequency', models.PositiveSmallIntegerField(default=1)),
+                ('length', models.PositiveSmallIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='library.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'field'], name='library_sea_term_f4e3ea_idx')],
+                'unique_together': {('book', 'field', 'term')},
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0021_book_reservation_hold'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OverdueSweepState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('swept_until', models.DateTimeField()),
+                ('target', models.DateTimeField(blank=True, null=True)),
+                ('threshold', models.PositiveSmallIntegerField(default=0)),
+                ('last_due_date', models.DateTimeField(blank=True, null=True)),
+                ('last_isbn', models.CharField(blank=True, max_length=13)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='due_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0022_overdue_sweep'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'isbn'], name='library_boo_title_f1a648_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['published_date', 'isbn'], name='library_boo_publish_ef447b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['borrowed_by', 'due_date'], name='library_boo_borrowe_ee75ce_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoritebook',
+            index=models.Index(fields=['isbn'], name='library_fav_isbn_85fa81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='library_not_user_id_57053b_idx'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def link_books(apps, schema_editor):
+    Book = apps.get_model("library", "Book")
+    FavoriteBook = apps.get_model("library", "FavoriteBook")
+    # Favorites of ISBNs that aren't in the catalog have nothing to point at
+    FavoriteBook.objects.exclude(isbn__in=Book.objects.values("isbn")).delete()
+    FavoriteBook.objects.update(book_id=models.F("isbn"))
+
+
+def unlink_books(apps, schema_editor):
+    FavoriteBook = apps.get_model("library", "FavoriteBook")
+    FavoriteBook.objects.update(isbn=models.F("book_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0025_archived_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoritebook',
+            name='book',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to='library.book'),
+        ),
+        migrations.AddField(
+            model_name='favoritebook',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='favoritebook',
+            name='isbn',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.RemoveIndex(
+            model_name='favoritebook',
+            name='library_fav_isbn_85fa81_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='favoritebook',
+            unique_together={('user', 'book')},
+        ),
+        migrations.RunPython(link_books, unlink_books),
+        migrations.RemoveField(
+            model_name='favoritebook',
+            name='isbn',
+        ),
+        migrations.AlterField(
+            model_name='favoritebook',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to='library.book'),
+        ),
+        migrations.AddIndex(
+            model_name='favoritebook',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='library_fav_user_id_430df0_idx'),
+        ),
+    ]
@@ -40,18 +40,59 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(default=now)
     is_librarian = models.BooleanField(default=False)
+    # Only ever changed by the UPDATEs in library.notifications; code that
+    # saves a whole user refreshes it first so a stale value isn't written back
+    unread_notifications = models.PositiveIntegerField(default=0, editable=False)
+    # Carried by issued tokens; bumped to revoke them (see library.authentication)
+    auth_version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_credentials = user._credentials()
+        return user
+
+    def _credentials(self):
+        return {name: self.__dict__.get(name) for name in ("password", "is_active")}
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        # A new password or a deactivation revokes the tokens issued so far
+        loaded = getattr(self, "_loaded_credentials", None) or {}
+        current = self._credentials()
+        if any(
+            loaded[name] != current[name]
+            for name in loaded
+            if update_fields is None or name in update_fields
+        ):
+            self.auth_version += 1
+            if update_fields is not None:
+                kwargs["update_fields"] = update_fields = [
+                    *update_fields,
+                    "auth_version",
+                ]
+        super().save(*args, **kwargs)
+        self._loaded_credentials = {
+            **loaded,
+            **{
+                name: value
+                for name, value in current.items()
+                if update_fields is None or name in update_fields
+            },
+        }
+
     def __str__(self):
         return self.email
 
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -71,11 +112,33 @@ class Book(models.Model):
         blank=True,
         related_name="borrowed_books",
     )
-    due_date = models.DateTimeField(null=True, blank=True)
+    due_date = models.DateTimeField(null=True, blank=True, db_index=True)
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     fine_per_day = models.DecimalField(
         max_digits=6, decimal_places=2, default=5.00
     )  # Default fine per day
+    borrow_count = models.PositiveIntegerField(default=0)  # Popularity
+    # Set when a returned book is handed to the head of its hold queue
+    reserved_for = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="reserved_books",
+    )
+    reserved_until = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # List orderings, with the primary key keyset pagination adds
+            models.Index(fields=["title", "isbn"]),
+            models.Index(fields=["published_date", "isbn"]),
+            # A patron's loans, and fee checks on them
+            models.Index(fields=["borrowed_by", "due_date"]),
+            # Sweeping lapsed reservations
+            models.Index(fields=["reserved_until"]),
+        ]
 
     def calculate_overdue_fee(self):
         """Calculate overdue fee based on days past due date."""
@@ -96,19 +159,104 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Newest first per user, with the id tiebreak keyset pagination adds
+        indexes = [models.Index(fields=["user", "-timestamp", "-id"])]
+
     def __str__(self):
         return f"Notification for {self.user.email} - {self.message}"
 
 
+class ArchivedNotification(models.Model):
+    """A notification pruned from the hot table by ``prune_notifications``.
+
+    Keeps the original id, and the user as a plain id so archived rows
+    outlive the account and never slow down its deletion.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user_id = models.BigIntegerField(db_index=True)
+    message = models.TextField()
+    is_read = models.BooleanField()
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived notification {self.id} for user {self.user_id}"
+
+
+class Hold(models.Model):
+    """A patron waiting for a borrowed book; served in ``id`` order."""
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="holds")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="holds")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("book", "user")
+        # Queue head and positions are range reads on this index
+        indexes = [models.Index(fields=["book", "id"])]
+
+    def __str__(self):
+        return f"{self.user.email} waiting for {self.book_id}"
+
+
+class OverdueSweepState(models.Model):
+    """Progress of the due date reminder sweep; there is a single row.
+
+    Reminders for every threshold crossed up to ``swept_until`` have been
+    sent. While a run is in flight ``target`` is its end time and
+    ``threshold``/``last_due_date``/``last_isbn`` mark how far it got, so an
+    interrupted run resumes instead of starting over.
+    """
+
+    swept_until = models.DateTimeField()
+    target = models.DateTimeField(null=True, blank=True)
+    threshold = models.PositiveSmallIntegerField(default=0)
+    last_due_date = models.DateTimeField(null=True, blank=True)
+    last_isbn = models.CharField(max_length=13, blank=True)
+
+    def __str__(self):
+        return f"Overdue reminders sent up to {self.swept_until}"
+
+
 class FavoriteBook(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    isbn = models.CharField(max_length=20)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="favorites")
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = (
             "user",
-            "isbn",
+            "book",
         )  # Ensures a user can't favorite the same book multiple times
+        # A user's favorites, newest first, with the keyset pagination tiebreak
+        indexes = [models.Index(fields=["user", "-created_at", "-id"])]
+
+    def __str__(self):
+        return f"{self.user.email} - {self.book_id}"
+
+
+class SearchIndexEntry(models.Model):
+    """One posting of the book search index: a stemmed term found in a field."""
+
+    FIELD_CHOICES = [
+        ("title", "Title"),
+        ("author", "Author"),
+        ("category", "Category"),
+    ]
+
+    term = models.CharField(max_length=64)
+    field = models.CharField(max_length=10, choices=FIELD_CHOICES)
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name="search_entries"
+    )
+    frequency = models.PositiveSmallIntegerField(default=1)
+    length = models.PositiveSmallIntegerField(default=1)  # Tokens in the field
+
+    class Meta:
+        unique_together = ("book", "field", "term")
+        indexes = [models.Index(fields=["term", "field"])]
 
     def __str__(self):
-        return f"{self.user.email} - {self.isbn}"
+        return f"{self.term} ({self.field}) - {self.book_id}"
@@ -0,0 +1,259 @@
+"""Notification delivery and the per-user unread counter.
+
+``User.unread_notifications`` is kept in step with the unread rows by
+adjusting it with an ``F()`` expression in the same transaction as the rows
+change, so a badge is one primary key read instead of a count over the
+inbox. Single saves and deletes are counted by the signal receivers; the
+set-based paths here, which send no signals, adjust it themselves.
+
+New notifications are also published, once committed, to the user's
+channel on the pub/sub broker for any open notification streams.
+
+Notifications that only report an action, like a borrow or a return, go
+through ``send``: once the action commits they join a write-behind queue that
+a background thread drains with one bulk insert per batch, so the request
+that caused them doesn't pay for the extra INSERT and commit.
+"""
+
+import atexit
+import json
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Notification, User
+from .pubsub import get_broker
+
+MAX_MARK_READ_IDS = 1000
+MAX_NOTIFICATION_ID = 2**63 - 1  # BigAutoField
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_unread(counts):
+    """Add ``{user_id: delta}`` to each user's counter with one UPDATE."""
+    counts = {user_id: delta for user_id, delta in counts.items() if delta}
+    if not counts:
+        return
+    User.objects.filter(pk__in=counts).update(
+        unread_notifications=F("unread_notifications")
+        + Case(*(When(pk=pk, then=Value(delta)) for pk, delta in counts.items()))
+    )
+
+
+def channel(user_id):
+    return f"notifications:{user_id}"
+
+
+def encode(notification):
+    """The stream event for ``notification``: ``(id, JSON data)``."""
+    data = {
+        "id": notification.pk,
+        "message": notification.message,
+        "is_read": notification.is_read,
+        "timestamp": notification.timestamp,
+    }
+    return notification.pk, json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def publish(notifications):
+    """Push ``notifications`` to their users' streams once committed."""
+    events = [
+        (channel(notification.user_id), encode(notification))
+        for notification in notifications
+    ]
+
+    def send():
+        broker = get_broker()
+        for name, event in events:
+            broker.publish(name, event)
+
+    transaction.on_commit(send)
+
+
+def _stored(notifications):
+    """``notifications`` as read back after a bulk insert, with their ids.
+
+    For backends that don't return the ids of a bulk insert (MySQL). Rows
+    are matched on user, timestamp and message; the timestamps were set per
+    row by the insert, and the read is one range on the ``(user, timestamp)``
+    index.
+    """
+    wanted = {
+        (notification.user_id, notification.timestamp, notification.message)
+        for notification in notifications
+    }
+    rows = Notification.objects.filter(
+        user_id__in={user_id for user_id, _, _ in wanted},
+        timestamp__in={timestamp for _, timestamp, _ in wanted},
+    ).order_by("id")
+    return [
+        row for row in rows if (row.user_id, row.timestamp, row.message) in wanted
+    ]
+
+
+def create_many(notifications):
+    """Bulk insert ``notifications``, count the unread ones and publish them."""
+    notifications = list(notifications)
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications)
+        if any(notification.pk is None for notification in created):
+            # Streams replay from Last-Event-ID, so every event needs its id
+            created = _stored(created)
+        adjust_unread(
+            Counter(
+                notification.user_id
+                for notification in notifications
+                if not notification.is_read
+            )
+        )
+        publish(created)
+    return created
+
+
+class WriteBehindQueue:
+    """Buffers notifications and writes them in batches from a thread.
+
+    A batch is written once ``LIBRARY_NOTIFICATION_BATCH_SIZE`` notifications
+    are waiting or ``LIBRARY_NOTIFICATION_FLUSH_INTERVAL`` seconds have
+    passed, and whatever is left is written when the process exits. A batch
+    that fails to write goes back to the front of the queue and is retried.
+    Past ``LIBRARY_NOTIFICATION_QUEUE_CAPACITY`` waiting notifications the
+    caller writes its own synchronously, so a stalled database slows
+    requests down rather than growing the queue without bound.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Keeps batches in order
+        self._wake = threading.Event()
+        self._pending = []
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, notifications):
+        batch_size = getattr(settings, "LIBRARY_NOTIFICATION_BATCH_SIZE", 100)
+        capacity = getattr(settings, "LIBRARY_NOTIFICATION_QUEUE_CAPACITY", 10000)
+        with self._lock:
+            queued = len(self._pending) + len(notifications) <= capacity
+            if queued:
+                self._pending.extend(notifications)
+                self._start()
+                if len(self._pending) >= batch_size:
+                    self._wake.set()
+        if not queued:
+            create_many(notifications)
+
+    def flush(self):
+        """Write everything queued so far; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                try:
+                    create_many(batch)
+                except IntegrityError:
+                    # Users deleted since would have lost these in the cascade
+                    batch = _drop_deleted_users(batch)
+                    create_many(batch)
+            except BaseException:
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            return len(batch)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="notification-writer", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(
+                getattr(settings, "LIBRARY_NOTIFICATION_FLUSH_INTERVAL", 0.5)
+            )
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing queued notifications failed; will retry")
+
+
+def _drop_deleted_users(notifications):
+    existing = set(
+        User.objects.filter(
+            pk__in={notification.user_id for notification in notifications}
+        ).values_list("pk", flat=True)
+    )
+    return [
+        notification
+        for notification in notifications
+        if notification.user_id in existing
+    ]
+
+
+queue = WriteBehindQueue()
+
+
+def send(notifications):
+    """Write ``notifications`` behind the current transaction's commit."""
+    # Only the ids are kept: a queued notification shouldn't pin its user
+    notifications = [
+        Notification(user_id=notification.user_id, message=notification.message)
+        for notification in notifications
+    ]
+    if not notifications:
+        return
+    if getattr(settings, "LIBRARY_NOTIFICATION_WRITE_BEHIND", True):
+        transaction.on_commit(lambda: queue.put(notifications))
+    else:
+        create_many(notifications)
+
+
+def is_notification_id(value):
+    """Whether ``value`` is an integer a notification id column can hold."""
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and 1 <= value <= MAX_NOTIFICATION_ID
+    )
+
+
+def mark_read(user, ids=None, up_to=None):
+    """Mark ``user``'s notifications in ``ids``, or with id <= ``up_to``, read.
+
+    Returns how many changed. Only rows still unread are updated, so the
+    count the counter drops by is exactly what this call changed, however
+    many requests race on the same rows.
+    """
+    unread = Notification.objects.filter(user=user, is_read=False)
+    if ids is not None:
+        unread = unread.filter(id__in=ids)
+    if up_to is not None:
+        unread = unread.filter(id__lte=up_to)
+    with transaction.atomic():
+        marked = unread.update(is_read=True)
+        adjust_unread({user.pk: -marked})
+    return marked
+
+
+def unread_count(user):
+    return (
+        User.objects.filter(pk=user.pk)
+        .values_list("unread_notifications", flat=True)
+        .first()
+        or 0
+    )
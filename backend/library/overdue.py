@@ -0,0 +1,119 @@
+"""Overdue days and fees as query expressions.
+
+Mirrors ``Book.calculate_overdue_fee``: a borrowed book owes ``fine_per_day``
+for every whole day past its ``due_date``. Computing it in SQL lets the book
+list filter and sort on the fee; the ``due_date`` cutoff that selects
+overdue rows is a plain range condition the database can use an index for.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import (
+    Case,
+    DateTimeField,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Func,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+
+class WholeDays(Func):
+    """Whole days from ``earlier`` to ``later``, truncated toward zero."""
+
+    arity = 2  # (later, earlier)
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="CAST(julianday(%(expressions)s) AS INTEGER)",
+            arg_joiner=") - julianday(",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        clone = self.copy()
+        clone.set_source_expressions(self.get_source_expressions()[::-1])
+        return super(WholeDays, clone).as_sql(
+            compiler,
+            connection,
+            template="TIMESTAMPDIFF(DAY, %(expressions)s)",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler,
+            connection,
+            template="EXTRACT(DAY FROM (%(expressions)s))::integer",
+            arg_joiner=" - ",
+            **extra_context,
+        )
+
+
+def overdue_q(now, prefix=""):
+    """Borrowed books at least one whole day past due.
+
+    ``prefix`` is the path to the book from the queried model, e.g. ``"book__"``.
+    """
+    return Q(
+        **{
+            f"{prefix}borrowed_by__isnull": False,
+            f"{prefix}due_date__lte": now - timedelta(days=1),
+        }
+    )
+
+
+def with_overdue(queryset, now=None, prefix=""):
+    """Annotate ``overdue_days`` and ``overdue_fee`` as of ``now``."""
+    now = now or timezone.now()
+    days = WholeDays(Value(now, output_field=DateTimeField()), F(f"{prefix}due_date"))
+    return queryset.annotate(
+        # At least one day once past the cutoff, whatever the float rounding
+        overdue_days=Case(
+            When(overdue_q(now, prefix), then=Greatest(days, Value(1))),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        overdue_fee=ExpressionWrapper(
+            F("overdue_days") * F(f"{prefix}fine_per_day"),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def fee_changes_at(rows, now=None):
+    """When the first fee of ``rows`` next goes up, or ``None`` if none will.
+
+    ``rows`` are ``(borrowed, due_date, fine_per_day)``. A fee first appears
+    a whole day past ``due_date`` and then rises once a day.
+    """
+    now = now or timezone.now()
+    moments = [
+        due_date + timedelta(days=max((now - due_date).days, 0) + 1)
+        for borrowed, due_date, fine in rows
+        if borrowed and due_date is not None and fine
+    ]
+    return min(moments, default=None)
+
+
+def filter_overdue(queryset, overdue=None, min_fee=None, now=None):
+    """Apply the ``overdue`` flag and ``min_fee`` threshold to an annotated set."""
+    now = now or timezone.now()
+    # Both apply when they disagree, so nothing matches
+    if overdue is False:
+        queryset = queryset.exclude(overdue_q(now))
+    elif overdue is True or (min_fee is not None and min_fee > Decimal(0)):
+        queryset = queryset.filter(overdue_q(now))
+    if min_fee is not None:
+        queryset = queryset.filter(overdue_fee__gte=min_fee)
+    return queryset
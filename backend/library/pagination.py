@@ -0,0 +1,263 @@
+import base64
+import binascii
+import bisect
+import datetime
+import decimal
+import json
+from collections import OrderedDict
+from functools import reduce
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Case, FloatField, Q, Value, When
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def _encode_value(value):
+    # Keep full precision; DjangoJSONEncoder drops datetime microseconds
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over the queryset's own ordering.
+
+    The cursor stores the ordering values of the last row seen plus the
+    primary key as a tiebreak, and the next page is fetched with a
+    ``WHERE (a, b, pk) > (...)`` style filter. Unlike page numbers there is
+    no ``COUNT(*)`` and no ``OFFSET``, so every page costs the same. Lists
+    that used ``PageNumberPagination`` before therefore no longer answer with
+    a ``count`` and ignore ``?page=``; clients follow ``next`` and
+    ``previous``. A cursor that doesn't decode, or whose values don't fit
+    the ordering fields, is answered with 404 as by DRF's
+    ``CursorPagination``.
+
+    Ordering fields must be non-null.
+
+    A filter that ranks rows outside the database sets ``request.ranking`` to
+    ``[(pk, score), ...]``, best first with ties by pk, after restricting the
+    queryset to those rows. Pages then follow the ranking: the cursor holds
+    the last score and pk, the next keys are read from the list in chunks
+    until enough of them pass the queryset's other filters, and only those
+    rows are fetched, carrying their score as ``rank_field``.
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+    rank_field = "search_rank"
+    max_rank_chunk = 1000
+
+    def __init__(self):
+        self.page_size = api_settings.PAGE_SIZE or 10
+        self.ranking = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_ordering(self, queryset):
+        pk_name = self.pk_name = queryset.model._meta.pk.name
+        if self.ranking is not None:
+            return [f"-{self.rank_field}", pk_name]
+        ordering = list(queryset.query.order_by) or list(
+            queryset.model._meta.ordering
+        )
+        for field in ordering:
+            if not isinstance(field, str):
+                raise ImproperlyConfigured(
+                    "KeysetPagination only supports ordering by field names."
+                )
+        if not {field.lstrip("-") for field in ordering} & {pk_name, "pk"}:
+            descending = bool(ordering) and ordering[0].startswith("-")
+            ordering.append(f"-{pk_name}" if descending else pk_name)
+        return ordering
+
+    def encode_cursor(self, values, reverse):
+        payload = {"o": self.ordering, "p": [_encode_value(v) for v in values]}
+        if reverse:
+            payload["r"] = 1
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padded = encoded + "=" * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, reverse = payload["p"], bool(payload.get("r"))
+            if payload["o"] != self.ordering or len(values) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def keyset_filter(self, values, reverse):
+        """Rows strictly after ``values`` in the (possibly reversed) ordering."""
+        clauses = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            ascending = not field.startswith("-")
+            lookup = "gt" if ascending != reverse else "lt"
+            equal = {
+                self.ordering[i].lstrip("-"): values[i] for i in range(index)
+            }
+            clauses.append(Q(**equal, **{f"{name}__{lookup}": values[index]}))
+        return reduce(lambda a, b: a | b, clauses)
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            name = field.lstrip("-")
+            if isinstance(obj, dict):  # Rows from a values() queryset
+                position.append(obj[name if name != "pk" else self.pk_name])
+                continue
+            value = obj
+            for part in name.split("__"):
+                value = getattr(value, part)
+            position.append(value)
+        return position
+
+    def ranked_keys(self, queryset):
+        """Up to a page plus one of ``(pk, score)`` past the cursor, in order.
+
+        Remembered for the request, whose validators ask for the page too.
+        """
+        memo_key = (repr(self.position), self.reverse, self.page_size)
+        memo = getattr(self, "_ranked_keys", None)
+        if memo is not None and memo[0] == memo_key:
+            return memo[1]
+        if self.position is None:
+            remaining = self.ranking
+        else:
+            score, pk = self.position
+            if isinstance(score, bool) or not isinstance(score, (int, float)):
+                raise NotFound(self.invalid_cursor_message)
+            keys = [(-rank, key) for key, rank in self.ranking]
+            try:
+                if self.reverse:
+                    index = bisect.bisect_left(keys, (-score, pk))
+                    remaining = self.ranking[:index][::-1]
+                else:
+                    index = bisect.bisect_right(keys, (-score, pk))
+                    remaining = self.ranking[index:]
+            except TypeError:
+                raise NotFound(self.invalid_cursor_message)
+
+        wanted = self.page_size + 1
+        found = []
+        start, size = 0, wanted
+        while start < len(remaining) and len(found) < wanted:
+            chunk = remaining[start : start + size]
+            present = set(
+                queryset.filter(pk__in=[key for key, _ in chunk])
+                .order_by()
+                .values_list("pk", flat=True)
+            )
+            found += [item for item in chunk if item[0] in present]
+            start += size
+            size = min(size * 2, self.max_rank_chunk)
+        self._ranked_keys = (memo_key, found[:wanted])
+        return found[:wanted]
+
+    def get_page_queryset(self, queryset, request):
+        """The unevaluated query for the requested page plus one lookahead row."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ranking = getattr(request, "ranking", None)
+        self.ordering = self.get_ordering(queryset)
+        self.position, self.reverse = self.decode_cursor(request)
+
+        order_by = self.ordering
+        if self.reverse:
+            order_by = [
+                field[1:] if field.startswith("-") else f"-{field}"
+                for field in self.ordering
+            ]
+        if self.ranking is not None:
+            found = self.ranked_keys(queryset)
+            if not found:
+                return queryset.none()
+            queryset = queryset.filter(pk__in=[key for key, _ in found]).annotate(
+                **{
+                    self.rank_field: Case(
+                        *[When(pk=key, then=Value(score)) for key, score in found],
+                        output_field=FloatField(),
+                    )
+                }
+            )
+            return queryset.order_by(*order_by)
+        queryset = queryset.order_by(*order_by)
+        if self.position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.keyset_filter(self.position, self.reverse)
+                )
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+        return queryset[: self.page_size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        results = list(self.get_page_queryset(queryset, request))
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = self.encode_cursor(self.get_position(self.page[-1]), False)
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        url = self.request.build_absolute_uri()
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        cursor = self.encode_cursor(self.get_position(self.page[0]), True)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("next", self.get_next_link()),
+                    ("previous", self.get_previous_link()),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
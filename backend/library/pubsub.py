@@ -0,0 +1,104 @@
+"""Publish/subscribe for pushing events to open streams.
+
+The broker is chosen with ``LIBRARY_PUBSUB_BROKER`` (a dotted path). The
+default, ``LocalBroker``, fans messages out to the subscribers in this
+process only, which is all a single server needs. A broker for several
+processes implements the same two methods: ``publish`` is called from
+ordinary synchronous code, and ``subscribe`` returns a ``Subscription`` that
+it feeds from whatever transport it uses, typically by relaying into a
+``LocalBroker`` of its own.
+
+A subscriber costs one small bounded queue and no thread or database
+connection, so idle streams are cheap. A subscriber that stops reading is
+not allowed to grow its queue: once full it is marked overflowed and its
+stream ends, and the client catches up when it reconnects.
+"""
+
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_QUEUE_SIZE = 100
+
+_timeout = getattr(asyncio, "timeout", None)  # Python 3.11+
+
+
+class Subscription:
+    __slots__ = ("channel", "queue", "loop", "overflowed")
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.overflowed = False
+
+    def deliver(self, message):
+        """Queue ``message``; runs on the subscriber's event loop."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout=None):
+        """Next message, or ``None`` if nothing arrives within ``timeout``."""
+        try:
+            if _timeout is None:
+                return await asyncio.wait_for(self.queue.get(), timeout)
+            # Unlike wait_for before 3.12, no extra task per waiting stream
+            async with _timeout(timeout):
+                return await self.queue.get()
+        except asyncio.TimeoutError:
+            return None
+
+
+class LocalBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+
+    def subscribe(self, channel, maxsize=DEFAULT_QUEUE_SIZE):
+        """Start receiving ``channel``; call from the subscriber's event loop."""
+        subscription = Subscription(channel, maxsize)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        """Hand ``message`` to every subscriber of ``channel``; thread-safe."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:  # Its event loop has closed
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(
+                    settings, "LIBRARY_PUBSUB_BROKER", "library.pubsub.LocalBroker"
+                )
+                _broker = import_string(path)()
+    return _broker
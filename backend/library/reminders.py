@@ -0,0 +1,105 @@
+"""Due date reminders sent by a resumable sweep over ``Book.due_date``.
+
+A loan crosses a threshold at ``due_date + offset``. A run covering the
+window ``(swept_until, target]`` therefore only needs, per threshold, the
+books whose ``due_date`` lies in that window shifted by the offset: an index
+range scan, read in keyset chunks. Each chunk's notifications are inserted
+together with the progress marker in one transaction, so rerunning after a
+crash neither skips nor repeats a reminder.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import notifications
+from .models import Book, Notification, OverdueSweepState
+
+# (offset from due_date, message)
+THRESHOLDS = (
+    (timedelta(days=-1), "'{title}' is due tomorrow."),
+    (
+        timedelta(days=1),
+        "'{title}' is overdue. A fine of ${fine:.2f} per day now applies.",
+    ),
+    (timedelta(days=7), "'{title}' is 7 days overdue."),
+    (timedelta(days=30), "'{title}' is 30 days overdue."),
+)
+INITIAL_WINDOW = timedelta(days=1)
+
+
+class SweepConflict(Exception):
+    """Another sweep moved the progress marker underneath this one."""
+
+
+def _state(now):
+    state, _ = OverdueSweepState.objects.get_or_create(
+        pk=1, defaults={"swept_until": now - INITIAL_WINDOW}
+    )
+    return state
+
+
+def _save_progress(state, **fields):
+    for name, value in fields.items():
+        setattr(state, name, value)
+    state.save(update_fields=list(fields))
+
+
+def _position(state):
+    return state.target, state.threshold, state.last_due_date, state.last_isbn
+
+
+def sweep(now=None, chunk_size=1000):
+    """Notify every threshold crossed since the last run; returns the count."""
+    now = now or timezone.now()
+    state = _state(now)
+    if state.target is None:
+        _save_progress(
+            state, target=now, threshold=0, last_due_date=None, last_isbn=""
+        )
+    sent = 0
+    while state.threshold < len(THRESHOLDS):
+        offset, message = THRESHOLDS[state.threshold]
+        loans = Book.objects.filter(
+            borrowed_by__isnull=False,
+            due_date__gt=state.swept_until - offset,
+            due_date__lte=state.target - offset,
+        )
+        while True:
+            chunk = loans
+            if state.last_due_date is not None:
+                chunk = chunk.filter(
+                    Q(due_date__gt=state.last_due_date)
+                    | Q(due_date=state.last_due_date, isbn__gt=state.last_isbn)
+                )
+            rows = list(
+                chunk.order_by("due_date", "isbn").values_list(
+                    "isbn", "due_date", "borrowed_by", "title", "fine_per_day"
+                )[:chunk_size]
+            )
+            if not rows:
+                break
+            with transaction.atomic():
+                current = OverdueSweepState.objects.select_for_update().get(
+                    pk=state.pk
+                )
+                if _position(current) != _position(state):
+                    raise SweepConflict
+                notifications.create_many(
+                    Notification(
+                        user_id=user_id,
+                        message=message.format(title=title, fine=fine),
+                    )
+                    for _, _, user_id, title, fine in rows
+                )
+                _save_progress(
+                    state, last_due_date=rows[-1][1], last_isbn=rows[-1][0]
+                )
+            sent += len(rows)
+        _save_progress(
+            state, threshold=state.threshold + 1, last_due_date=None, last_isbn=""
+        )
+    _save_progress(state, swept_until=state.target, target=None, threshold=0)
+    return sent
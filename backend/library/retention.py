@@ -0,0 +1,119 @@
+"""Retention for the notification table.
+
+Read notifications older than ``LIBRARY_NOTIFICATION_RETENTION_DAYS`` are
+pruned, and so are unread ones older than
+``LIBRARY_UNREAD_NOTIFICATION_RETENTION_DAYS`` if that is set. Pruning walks
+the primary key in fixed ranges from the oldest row, so each transaction
+locks at most one small range and the walk needs no index beyond the key.
+Ids grow with ``timestamp``, so the walk stops at the first range whose
+oldest row is still within the retention period.
+
+Pruned rows can first be copied to an archive: the ``ArchivedNotification``
+table, written in the same transaction as the delete, or gzipped JSON Lines
+appended to a file, which is written before the delete commits and so may
+repeat a batch if the delete then fails.
+"""
+
+import gzip
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .models import ArchivedNotification, Notification
+from .notifications import adjust_unread
+
+ARCHIVE_FIELDS = ("id", "user_id", "message", "is_read", "timestamp")
+
+
+class TableArchive:
+    def write(self, rows):
+        ArchivedNotification.objects.bulk_create(
+            (ArchivedNotification(**row) for row in rows), ignore_conflicts=True
+        )
+
+
+class FileArchive:
+    """Appends gzip members; concatenated members read back as one stream."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, rows):
+        encoder = DjangoJSONEncoder()
+        with gzip.open(self.path, "at", encoding="utf-8") as archive:
+            archive.writelines(encoder.encode(row) + "\n" for row in rows)
+
+
+def _cutoffs(now):
+    """Timestamps before which read and unread notifications expire."""
+    read_days = getattr(settings, "LIBRARY_NOTIFICATION_RETENTION_DAYS", 90)
+    unread_days = getattr(settings, "LIBRARY_UNREAD_NOTIFICATION_RETENTION_DAYS", None)
+    return (
+        now - timedelta(days=read_days),
+        None if unread_days is None else now - timedelta(days=unread_days),
+    )
+
+
+def prune(now=None, batch_size=1000, archive=None, pause=0):
+    """Delete expired notifications; returns how many were removed.
+
+    ``archive`` is an object with a ``write(rows)`` method, such as
+    ``TableArchive`` or ``FileArchive``, or ``None`` to just delete. ``pause``
+    seconds are slept between batches to leave room for other writers.
+    """
+    now = now or timezone.now()
+    read_cutoff, unread_cutoff = _cutoffs(now)
+    expired = Q(is_read=True, timestamp__lt=read_cutoff)
+    oldest_kept = read_cutoff
+    if unread_cutoff is not None:
+        expired |= Q(is_read=False, timestamp__lt=unread_cutoff)
+        oldest_kept = min(read_cutoff, unread_cutoff)
+
+    bounds = Notification.objects.aggregate(low=Min("id"), high=Max("id"))
+    if bounds["low"] is None:
+        return 0
+    pruned = 0
+    for low in range(bounds["low"], bounds["high"] + 1, batch_size):
+        in_range = Notification.objects.filter(id__gte=low, id__lt=low + batch_size)
+        first = in_range.order_by("id").values_list("timestamp", flat=True).first()
+        if first is None:
+            continue
+        if first >= oldest_kept:
+            break
+        with transaction.atomic():
+            rows = list(
+                in_range.filter(expired)
+                .select_for_update()
+                .order_by("id")
+                .values(*ARCHIVE_FIELDS)
+            )
+            if not rows:
+                continue
+            if archive is not None:
+                archive.write(rows)
+            unread = [row for row in rows if not row["is_read"]]
+            if unread:
+                # Retire them as read with one counter UPDATE, so the
+                # post_delete receiver has nothing left to adjust row by row
+                Notification.objects.filter(
+                    id__in=[row["id"] for row in unread]
+                ).update(is_read=True)
+                adjust_unread(
+                    {
+                        user_id: -count
+                        for user_id, count in Counter(
+                            row["user_id"] for row in unread
+                        ).items()
+                    }
+                )
+            Notification.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        pruned += len(rows)
+        if pause:
+            time.sleep(pause)
+    return pruned
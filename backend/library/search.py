@@ -0,0 +1,268 @@
+"""Inverted-index search over the book catalog.
+
+Books are tokenized into stemmed terms per field (title, author, category
+name) and stored as ``SearchIndexEntry`` postings. Queries look up only the
+postings for their own terms and rank matching books with BM25F, so search
+cost follows the number of matches instead of the size of the catalog.
+
+``matches`` restricts a queryset to the matching books with one posting
+subquery per query term, and ``rank`` scores every match; neither caps the
+number of results, so pages can be served from anywhere in the ranking.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import Book, SearchIndexEntry
+
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "category": 1.0}
+FIELDS = tuple(FIELD_WEIGHTS)
+
+# BM25 tuning constants (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+MAX_TERM_LENGTH = 64
+MAX_PREFIX_EXPANSIONS = 50
+STATS_CACHE_KEY = "library:search:stats"
+STATS_CACHE_TIMEOUT = 300
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Ordered longest-first so the most specific suffix wins
+_SUFFIXES = (
+    ("ational", "ate"),
+    ("ization", "ize"),
+    ("fulness", "ful"),
+    ("ousness", "ous"),
+    ("iveness", "ive"),
+    ("ement", ""),
+    ("ment", ""),
+    ("ness", ""),
+    ("ings", ""),
+    ("ing", ""),
+    ("ies", "y"),
+    ("ied", "y"),
+    ("edly", ""),
+    ("ed", ""),
+    ("ly", ""),
+    ("es", ""),
+    ("s", ""),
+)
+
+
+def stem(token):
+    """Strip common English suffixes, keeping at least a three letter stem."""
+    if token.isdigit() or len(token) <= 3:
+        return token
+    for suffix, replacement in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            if suffix == "s" and token.endswith("ss"):
+                return token
+            token = token[: -len(suffix)] + replacement
+            break
+    # "running" -> "runn" -> "run"
+    if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "lsz":
+        token = token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lowercase, strip accents and split text into raw word tokens."""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return _TOKEN_RE.findall(text)
+
+
+def analyze(text):
+    return [stem(token)[:MAX_TERM_LENGTH] for token in tokenize(text)]
+
+
+def book_fields(book):
+    return {
+        "title": book.title,
+        "author": book.author,
+        "category": book.category.name if book.category_id else "",
+    }
+
+
+def build_entries(book):
+    """Return the unsaved postings for a single book."""
+    entries = []
+    for field, text in book_fields(book).items():
+        terms = analyze(text)
+        for term, frequency in Counter(terms).items():
+            entries.append(
+                SearchIndexEntry(
+                    term=term,
+                    field=field,
+                    book_id=book.pk,
+                    frequency=min(frequency, 32767),
+                    length=min(len(terms), 32767),
+                )
+            )
+    return entries
+
+
+def index_book(book):
+    """(Re)index one book, replacing any postings it already has."""
+    with transaction.atomic():
+        SearchIndexEntry.objects.filter(book_id=book.pk).delete()
+        SearchIndexEntry.objects.bulk_create(build_entries(book))
+    cache.delete(STATS_CACHE_KEY)
+
+
+def index_books(books):
+    """(Re)index a batch of books with one delete and one insert."""
+    entries = [entry for book in books for entry in build_entries(book)]
+    with transaction.atomic():
+        stale = SearchIndexEntry.objects.filter(book_id__in=[book.pk for book in books])
+        stale.delete()
+        SearchIndexEntry.objects.bulk_create(entries, batch_size=1000)
+    cache.delete(STATS_CACHE_KEY)
+
+
+def index_category(category):
+    """Reindex every book filed under a (renamed) category."""
+    books = Book.objects.filter(category=category).select_related("category")
+    for book in books.iterator(chunk_size=500):
+        index_book(book)
+
+
+def rebuild_index(batch_size=1000):
+    """Drop and rebuild the whole index. Returns the number of books indexed."""
+    indexed = 0
+    with transaction.atomic():
+        SearchIndexEntry.objects.all().delete()
+        batch = []
+        books = Book.objects.select_related("category").order_by("pk")
+        for book in books.iterator(chunk_size=batch_size):
+            batch.extend(build_entries(book))
+            indexed += 1
+            if len(batch) >= batch_size:
+                SearchIndexEntry.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            SearchIndexEntry.objects.bulk_create(batch)
+    cache.delete(STATS_CACHE_KEY)
+    return indexed
+
+
+def _collection_stats():
+    """Document count and average field lengths, cached between writes."""
+    stats = cache.get(STATS_CACHE_KEY)
+    if stats is None:
+        total = Book.objects.count()
+        lengths = dict(
+            SearchIndexEntry.objects.values_list("field")
+            .annotate(tokens=Sum("frequency"))
+            .values_list("field", "tokens")
+        )
+        stats = {
+            "documents": total,
+            "avg_length": {
+                field: (lengths.get(field) or 0) / total if total else 0
+                for field in FIELDS
+            },
+        }
+        cache.set(STATS_CACHE_KEY, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def query_groups(clauses):
+    """Turn ``(text, fields)`` clauses into groups of alternative terms.
+
+    Every group must be matched by a book. The last token of each clause is
+    also matched as a prefix so results keep up while the user is typing.
+    """
+    groups = []
+    for text, fields in clauses:
+        tokens = tokenize(text)
+        for position, token in enumerate(tokens):
+            terms = {stem(token)[:MAX_TERM_LENGTH]}
+            if position == len(tokens) - 1:
+                prefix = token[:MAX_TERM_LENGTH]
+                terms.add(prefix)
+                # Terms are [a-z0-9] only, so this range is exactly the
+                # prefix matches and, unlike LIKE, can use the index anywhere
+                last = prefix + "z" * (MAX_TERM_LENGTH - len(prefix))
+                terms.update(
+                    SearchIndexEntry.objects.filter(
+                        term__gte=prefix, term__lte=last, field__in=fields
+                    )
+                    .values_list("term", flat=True)
+                    .distinct()[:MAX_PREFIX_EXPANSIONS]
+                )
+            groups.append((terms, tuple(fields)))
+    return groups
+
+
+def matches(groups):
+    """A filter on ``Book`` for the books matching every group."""
+    condition = Q()
+    for terms, fields in groups:
+        postings = SearchIndexEntry.objects.filter(term__in=terms, field__in=fields)
+        condition &= Q(pk__in=postings.values("book_id"))
+    return condition
+
+
+def rank(groups):
+    """Score the books matching every group of ``query_groups``.
+
+    Returns ``[(isbn, score), ...]`` ordered best first, ties by isbn.
+    """
+    if not groups:
+        return []
+    stats = _collection_stats()
+    documents = stats["documents"]
+
+    all_terms = set().union(*(terms for terms, _ in groups))
+    df = dict(
+        SearchIndexEntry.objects.filter(term__in=all_terms)
+        .values("term")
+        .annotate(df=Count("book_id", distinct=True))
+        .values_list("term", "df")
+    )
+    # Most selective groups first so later lookups can be narrowed
+    groups = sorted(groups, key=lambda group: sum(df.get(term, 0) for term in group[0]))
+
+    candidates = None
+    scores = defaultdict(float)
+    for terms, fields in groups:
+        postings = SearchIndexEntry.objects.filter(
+            term__in=terms, field__in=fields
+        ).values_list("book_id", "term", "field", "frequency", "length")
+        if candidates is not None and len(candidates) <= 900:
+            postings = postings.filter(book_id__in=candidates)
+
+        weighted = defaultdict(lambda: defaultdict(float))
+        for book_id, term, field, frequency, length in postings.iterator():
+            if candidates is not None and book_id not in candidates:
+                continue
+            avg_length = stats["avg_length"].get(field) or 1
+            norm = 1 - B + B * length / avg_length
+            weighted[book_id][term] += FIELD_WEIGHTS[field] * frequency / norm
+
+        matched = set(weighted)
+        candidates = matched if candidates is None else candidates & matched
+        if not candidates:
+            return []
+
+        for book_id in candidates:
+            for term, tf in weighted[book_id].items():
+                n = df.get(term, 0)
+                idf = math.log(1 + (documents - n + 0.5) / (n + 0.5))
+                scores[book_id] += idf * tf / (K1 + tf)
+
+    return sorted(
+        ((book_id, round(scores[book_id], 6)) for book_id in candidates),
+        key=lambda item: (-item[1], item[0]),
+    )
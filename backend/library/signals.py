@@ -0,0 +1,82 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_user_cache
+from .caching import bump_catalog_version
+from .models import Book, Category, Notification, User
+from .notifications import adjust_unread, publish
+from .search import STATS_CACHE_KEY, index_book, index_category
+from .suggest import index as suggestion_index
+
+# Saves that only touch circulation fields don't change the search index
+INDEXED_BOOK_FIELDS = {"title", "author", "category"}
+
+
+@receiver(post_save, sender=Book)
+def reindex_book(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not INDEXED_BOOK_FIELDS & set(update_fields):
+        return
+    index_book(instance)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_books(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    index_category(instance)
+
+
+@receiver(post_delete, sender=Book)
+def drop_search_stats(sender, instance, **kwargs):
+    # Postings go with the book through the cascade; only the stats are stale
+    cache.delete(STATS_CACHE_KEY)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Book)
+def update_suggestions(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    row = (instance.isbn, instance.title, instance.author, instance.borrow_count)
+    transaction.on_commit(lambda: suggestion_index.update_book(*row))
+
+
+@receiver(post_delete, sender=Book)
+def remove_suggestions(sender, instance, **kwargs):
+    isbn = instance.isbn
+    transaction.on_commit(lambda: suggestion_index.remove_book(isbn))
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notification(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw and not instance.is_read:
+        adjust_unread({instance.user_id: 1})
+
+
+@receiver(post_save, sender=Notification)
+def push_notification(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        publish([instance])
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_unread_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread({instance.user_id: -1})
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    get_user_cache().invalidate(instance.pk)
@@ -0,0 +1,170 @@
+"""Server-Sent Events stream of a user's new notifications.
+
+Served through ``backend.asgi`` an open stream is a suspended coroutine
+waiting on its pub/sub queue: no thread, and a comment line every
+``LIBRARY_STREAM_HEARTBEAT`` seconds to keep proxies from timing it out.
+The database is read to replay what was published after the
+``Last-Event-ID`` the client reports on reconnect, and to check the user
+when the stream opens and at each heartbeat, unless the cache in
+``library.authentication`` already vouches for them. Under WSGI a stream
+would hold a worker thread for as long as it stays open, so streams are
+refused there and clients poll instead.
+
+``EventSource`` can't set headers, and an access token in the URL would end
+up in server and proxy logs. Browsers instead ``POST`` for a ticket, a
+random string kept in the cache for ``LIBRARY_STREAM_TICKET_TTL`` seconds,
+and pass it as ``?ticket=``. Redeeming a ticket deletes it, so it opens a
+single stream, which ends when the access token it was issued for expires.
+"""
+
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import VERSION_CLAIM, get_user_cache
+from .models import Notification
+from .notifications import channel, encode
+from .pubsub import get_broker
+
+User = get_user_model()
+
+RETRY_MILLISECONDS = 5000
+MAX_REPLAY = 100
+TICKET_PREFIX = "stream-ticket:"
+
+
+def streams_supported(request):
+    """Whether ``request`` came through the ASGI handler."""
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def issue_ticket(user, token):
+    """A single-use ticket opening one stream of ``user``'s notifications.
+
+    ``token`` is the access token the ticket is requested with.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(
+        TICKET_PREFIX + ticket,
+        {
+            "user_id": user.pk,
+            "version": user.auth_version,
+            "expires_at": token["exp"],
+        },
+        timeout=getattr(settings, "LIBRARY_STREAM_TICKET_TTL", 30),
+    )
+    return ticket
+
+
+async def _redeem(ticket):
+    key = TICKET_PREFIX + ticket
+    grant = await cache.aget(key)
+    # Of concurrent redeemers only one gets to delete the ticket
+    if grant is None or not await cache.adelete(key):
+        return None
+    return grant
+
+
+async def _authorized(grant):
+    """The checks ``CachedJWTAuthentication`` makes: active, not revoked."""
+    users = get_user_cache()
+    if users.get(grant["user_id"], grant["version"]) is not None:
+        return True
+    user = await User.objects.filter(pk=grant["user_id"]).afirst()
+    if user is None or not user.is_active or user.auth_version != grant["version"]:
+        return False
+    users.set(user)
+    return True
+
+
+async def stream_grant(request):
+    """``{"user_id", "version", "expires_at"}`` for ``request``, or ``None``.
+
+    Clients that can set headers may send their access token instead of a
+    ticket.
+    """
+    scheme, _, raw = request.headers.get("Authorization", "").partition(" ")
+    if scheme in jwt_settings.AUTH_HEADER_TYPES and raw:
+        try:
+            token = AccessToken(raw)
+        except TokenError:
+            return None
+        if jwt_settings.USER_ID_CLAIM not in token:
+            return None
+        grant = {
+            "user_id": token[jwt_settings.USER_ID_CLAIM],
+            "version": token.get(VERSION_CLAIM, 0),
+            "expires_at": token["exp"],
+        }
+    else:
+        ticket = request.GET.get("ticket")
+        grant = await _redeem(ticket) if ticket else None
+    if grant is None or not await _authorized(grant):
+        return None
+    return grant
+
+
+def last_event_id(request):
+    value = request.headers.get("Last-Event-ID") or request.GET.get("last_event_id")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _event(event):
+    pk, data = event
+    if pk is None:
+        return f"data: {data}\n\n"
+    return f"id: {pk}\ndata: {data}\n\n"
+
+
+@sync_to_async
+def _missed(user_id, last_id):
+    notifications = Notification.objects.filter(
+        user_id=user_id, id__gt=last_id
+    ).order_by("id")[:MAX_REPLAY]
+    return [encode(notification) for notification in notifications]
+
+
+async def notification_events(grant, last_id=None):
+    """Yield SSE frames for the grant's user until its token expires.
+
+    The stream also ends once the user is deactivated or their tokens are
+    revoked, or if the client reads too slowly to keep its queue from
+    filling; the browser then reconnects and the gap is replayed.
+    """
+    user_id = grant["user_id"]
+    heartbeat = getattr(settings, "LIBRARY_STREAM_HEARTBEAT", 25)
+    broker = get_broker()
+    # Subscribe before replaying so nothing published in between is missed
+    subscription = broker.subscribe(
+        channel(user_id), getattr(settings, "LIBRARY_STREAM_QUEUE_SIZE", 100)
+    )
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        if last_id is not None:
+            for event in await _missed(user_id, last_id):
+                last_id = event[0]
+                yield _event(event)
+        while not subscription.overflowed:
+            remaining = grant["expires_at"] - time.time()
+            if remaining <= 0:
+                return
+            event = await subscription.get(timeout=min(heartbeat, remaining))
+            if event is None:
+                if not await _authorized(grant):
+                    return
+                yield ": keep-alive\n\n"
+            elif last_id is None or event[0] is None or event[0] > last_id:
+                yield _event(event)
+    finally:
+        broker.unsubscribe(subscription)
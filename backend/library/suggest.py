@@ -0,0 +1,351 @@
+"""In-process prefix index for title and author autocomplete.
+
+Every title and author is stored under the normalized text starting at each
+of its first few words. The keys are kept sorted in fixed-size blocks (a
+flat B-tree), and each block remembers the highest popularity among its
+entries. A lookup binary-searches the range of keys sharing the prefix and
+then pulls entries best-first from a heap of blocks ordered by that
+maximum, so only the few blocks holding the top results are ever opened,
+however common the prefix is.
+
+Each process keeps its own copy. Local writes are applied through signals.
+Writes made by other processes are picked up from ``Book.updated_at`` once
+the catalog version moves, and a periodic full rebuild drops deleted books.
+Only the first build keeps a request waiting, and concurrent requests wait
+for that one build; later rebuilds run on a background thread while the
+current index keeps answering.
+"""
+
+import bisect
+import heapq
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+
+from .caching import get_catalog_version
+from .models import Book
+from .search import tokenize
+
+MAX_KEY_LENGTH = 48
+MAX_WORD_STARTS = 6
+BLOCK_SIZE = 64
+TITLE, AUTHOR = "title", "author"
+
+
+def normalize(text):
+    return " ".join(tokenize(text))
+
+
+def keys_for(text):
+    """Normalized text starting at each of its first words."""
+    words = tokenize(text)
+    return {
+        " ".join(words[start:])[:MAX_KEY_LENGTH]
+        for start in range(min(len(words), MAX_WORD_STARTS))
+    }
+
+
+class Block:
+    __slots__ = ("keys", "refs", "best", "ranked")
+
+    def __init__(self, keys, refs):
+        self.keys = keys
+        self.refs = refs
+        self.best = 0
+        self.ranked = None  # refs by descending score, built on first use
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuilding = threading.Lock()  # Held by whoever is rebuilding
+        self._reset()
+
+    def _reset(self):
+        self.blocks = []  # Sorted runs of keys; refs are (kind, isbn/author)
+        self.firsts = []  # First key of each block, for bisect
+        self.books = {}  # isbn -> (title, author, popularity)
+        self.authors = {}  # author -> {isbn: popularity}
+        self.author_scores = {}  # author -> total popularity of their books
+        self.built_at = None
+        self.synced_at = None
+        self.version = None
+
+    def __len__(self):
+        return sum(len(block.keys) for block in self.blocks)
+
+    def _score(self, ref):
+        kind, value = ref
+        if kind == TITLE:
+            return self.books[value][2]
+        return self.author_scores[value]
+
+    def _refresh_best(self, block):
+        block.best = max(map(self._score, block.refs), default=0)
+        block.ranked = None
+
+    def _ranked(self, block):
+        if block.ranked is None:
+            block.ranked = sorted(
+                ((self._score(ref), ref) for ref in block.refs),
+                key=lambda item: -item[0],
+            )
+        return block.ranked
+
+    # Maintenance
+
+    def rebuild(self):
+        started = time.time()
+        version = get_catalog_version()
+        rows = Book.objects.values_list("isbn", "title", "author", "borrow_count")
+        books, authors, pairs = {}, {}, []
+        for isbn, title, author, popularity in rows.iterator(chunk_size=2000):
+            books[isbn] = (title, author, popularity)
+            pairs.extend((key, (TITLE, isbn)) for key in keys_for(title))
+            holders = authors.setdefault(author, {})
+            if not holders:
+                pairs.extend((key, (AUTHOR, author)) for key in keys_for(author))
+            holders[isbn] = popularity
+        pairs.sort()
+        with self._lock:
+            self._reset()
+            self.books, self.authors = books, authors
+            self.author_scores = {
+                author: sum(holders.values()) for author, holders in authors.items()
+            }
+            for start in range(0, len(pairs), BLOCK_SIZE):
+                chunk = pairs[start : start + BLOCK_SIZE]
+                block = Block([key for key, _ in chunk], [ref for _, ref in chunk])
+                self._refresh_best(block)
+                self.blocks.append(block)
+                self.firsts.append(block.keys[0])
+            self.built_at = self.synced_at = started
+            self.version = version
+
+    def _block_for(self, key):
+        """The block ``key`` is inserted into."""
+        return max(bisect.bisect_right(self.firsts, key) - 1, 0)
+
+    def _first_block_for(self, key):
+        """The first block that may hold ``key``.
+
+        Equal keys can fill several blocks, so this is the block before the
+        first one starting at or after ``key``, not the last one starting at
+        or before it.
+        """
+        return max(bisect.bisect_left(self.firsts, key) - 1, 0)
+
+    def _insert(self, key, ref):
+        if not self.blocks:
+            self.blocks.append(Block([], []))
+            self.firsts.append(key)
+        number = self._block_for(key)
+        block = self.blocks[number]
+        position = bisect.bisect_left(block.keys, key)
+        block.keys.insert(position, key)
+        block.refs.insert(position, ref)
+        block.best = max(block.best, self._score(ref))
+        block.ranked = None
+        self.firsts[number] = block.keys[0]
+        if len(block.keys) > 2 * BLOCK_SIZE:
+            tail = Block(block.keys[BLOCK_SIZE:], block.refs[BLOCK_SIZE:])
+            del block.keys[BLOCK_SIZE:], block.refs[BLOCK_SIZE:]
+            self._refresh_best(block)
+            self._refresh_best(tail)
+            self.blocks.insert(number + 1, tail)
+            self.firsts.insert(number + 1, tail.keys[0])
+
+    def _remove(self, key, ref):
+        number = self._first_block_for(key)
+        while number < len(self.blocks) and self.firsts[number] <= key:
+            block = self.blocks[number]
+            position = bisect.bisect_left(block.keys, key)
+            while position < len(block.keys) and block.keys[position] == key:
+                if block.refs[position] == ref:
+                    del block.keys[position], block.refs[position]
+                    if block.keys:
+                        self.firsts[number] = block.keys[0]
+                        self._refresh_best(block)
+                    else:
+                        del self.blocks[number], self.firsts[number]
+                    return
+                position += 1
+            number += 1
+
+    def _refresh_keys(self, keys):
+        for key in keys:
+            number = self._first_block_for(key)
+            while number < len(self.blocks) and self.firsts[number] <= key:
+                self._refresh_best(self.blocks[number])
+                number += 1
+
+    def _set_popularity(self, isbn, author, popularity):
+        holders = self.authors.setdefault(author, {})
+        holders[isbn] = popularity
+        self.author_scores[author] = sum(holders.values())
+
+    def remove_book(self, isbn):
+        with self._lock:
+            if self.built_at is None or isbn not in self.books:
+                return
+            title, author, _ = self.books[isbn]
+            for key in keys_for(title):
+                self._remove(key, (TITLE, isbn))
+            del self.books[isbn]
+            holders = self.authors[author]
+            del holders[isbn]
+            if holders:
+                self.author_scores[author] = sum(holders.values())
+                self._refresh_keys(keys_for(author))
+            else:
+                for key in keys_for(author):
+                    self._remove(key, (AUTHOR, author))
+                del self.authors[author], self.author_scores[author]
+
+    def update_book(self, isbn, title, author, popularity):
+        with self._lock:
+            if self.built_at is None:
+                return
+            current = self.books.get(isbn)
+            if current and current[:2] == (title, author):
+                # Only popularity changed: no keys move
+                self.books[isbn] = (title, author, popularity)
+                self._set_popularity(isbn, author, popularity)
+                self._refresh_keys(keys_for(title) | keys_for(author))
+                return
+            self.remove_book(isbn)
+            self.books[isbn] = (title, author, popularity)
+            new_author = author not in self.authors
+            self._set_popularity(isbn, author, popularity)
+            for key in keys_for(title):
+                self._insert(key, (TITLE, isbn))
+            if new_author:
+                for key in keys_for(author):
+                    self._insert(key, (AUTHOR, author))
+            else:
+                self._refresh_keys(keys_for(author))
+
+    def sync(self):
+        """Catch up with writes made by other processes."""
+        if self.built_at is None:
+            with self._rebuilding:
+                if self.built_at is None:
+                    self.rebuild()
+            return
+        rebuild_interval = getattr(settings, "LIBRARY_SUGGEST_REBUILD_INTERVAL", 600)
+        if time.time() - self.built_at > rebuild_interval:
+            self._rebuild_in_background()
+        version = get_catalog_version()
+        if version == self.version:
+            return
+        started = time.time()
+        # Small overlap so rows committed while we read are not missed
+        since = datetime.fromtimestamp(self.synced_at - 1, tz=timezone.utc)
+        changed = Book.objects.filter(updated_at__gte=since).values_list(
+            "isbn", "title", "author", "borrow_count"
+        )
+        for row in changed:
+            self.update_book(*row)
+        with self._lock:
+            self.synced_at = started
+            self.version = version
+
+    def _rebuild_in_background(self):
+        if not self._rebuilding.acquire(blocking=False):
+            return  # Already under way
+
+        def run():
+            try:
+                self.rebuild()
+            finally:
+                self._rebuilding.release()
+                connection.close()
+
+        threading.Thread(target=run, name="suggest-rebuild", daemon=True).start()
+
+    # Queries
+
+    def _display(self, ref):
+        kind, value = ref
+        if kind == TITLE:
+            return {"type": TITLE, "text": self.books[value][0], "isbn": value}
+        return {"type": AUTHOR, "text": value}
+
+    def _top(self, prefix, limit):
+        """Merge the matching blocks best-first until ``limit`` refs are found.
+
+        Heap items are ``(-score, tiebreak, ranked list, position)``; a block
+        lying wholly inside the prefix range enters with its best score and
+        is walked down its ranked list only as far as needed.
+        """
+        end = prefix + "\uffff"
+        if not self.blocks:
+            return []
+        first = self._first_block_for(prefix)
+        last = bisect.bisect_left(self.firsts, end) - 1
+        # Blocks strictly between the first and last lie wholly in the range
+        heap = [
+            (-self.blocks[number].best, number, self.blocks[number], None)
+            for number in range(first + 1, last)
+        ]
+        for number in {first, last}:
+            if number < 0:
+                continue
+            block = self.blocks[number]
+            low = bisect.bisect_left(block.keys, prefix)
+            high = bisect.bisect_left(block.keys, end, lo=low)
+            if low < high:
+                # Edge block: rank just the entries inside the range
+                ranked = sorted(
+                    ((self._score(ref), ref) for ref in block.refs[low:high]),
+                    key=lambda item: -item[0],
+                )
+                heap.append((-ranked[0][0], number, ranked, 0))
+        heapq.heapify(heap)
+
+        results, seen = [], set()
+        while heap and len(results) < limit:
+            _, number, ranked, position = heapq.heappop(heap)
+            if position is None:  # A whole block, not opened yet
+                ranked, position = self._ranked(ranked), 0
+            ref = ranked[position][1]
+            # A title or author may match at several word starts
+            if ref not in seen:
+                seen.add(ref)
+                results.append(ref)
+            if position + 1 < len(ranked):
+                next_score = ranked[position + 1][0]
+                heapq.heappush(heap, (-next_score, number, ranked, position + 1))
+        return results
+
+    def suggest(self, text, limit=10):
+        prefix = normalize(text)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        with self._lock:
+            return [self._display(ref) for ref in self._top(prefix, limit)]
+
+    def memory_usage(self):
+        """Approximate bytes held by the index structures."""
+        with self._lock:
+            size = sys.getsizeof(self.blocks) + sys.getsizeof(self.firsts)
+            for block in self.blocks:
+                size += sys.getsizeof(block)
+                size += sys.getsizeof(block.keys) + sys.getsizeof(block.refs)
+                size += sum(sys.getsizeof(key) for key in block.keys)
+                size += sum(sys.getsizeof(ref) for ref in block.refs)
+            for mapping in (self.books, self.authors, self.author_scores):
+                size += sys.getsizeof(mapping)
+            size += sum(
+                sys.getsizeof(value) + sum(sys.getsizeof(part) for part in value)
+                for value in self.books.values()
+            )
+            size += sum(sys.getsizeof(value) for value in self.authors.values())
+            return size
+
+
+index = SuggestionIndex()
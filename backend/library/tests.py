@@ -1,3 +1,2155 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import importlib
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
 
-# Create your tests here.
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+import jwt
+from jwt.algorithms import has_crypto
+
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.contrib.auth import aauthenticate
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.conf import settings
+from django.core import checks
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    AsyncClient,
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    circulation,
+    exporter,
+    google,
+    hashing,
+    notifications,
+    reminders,
+    retention,
+    suggest,
+)
+from .authentication import EmailBackend, VersionedRefreshToken, get_user_cache
+from .caching import get_response_store
+from .favorites import MAX_STATUS_ISBNS
+from .hashing import HashingPool, HashingPoolFull
+from .importer import import_books
+from .middleware import HashingPoolFullMiddleware
+from .models import (
+    ArchivedNotification,
+    Book,
+    Category,
+    FavoriteBook,
+    Notification,
+    OverdueSweepState,
+    SearchIndexEntry,
+    User,
+)
+from .overdue import fee_changes_at, filter_overdue, with_overdue
+from .search import build_entries, rebuild_index
+from .serializers import BookListingSerializer, BookSerializer, UserSerializer
+
+
+class BookQueryBudgetTests(TestCase):
+    """Guard against per-row queries creeping back into the book endpoints."""
+
+    # Queries allowed per request, independent of the number of rows returned.
+    # Each includes the narrow validator query run for conditional GET.
+    BUDGETS = {
+        "book-list": 2,
+        "book-detail": 2,
+        # Includes the uncached collection stats, and finding which of the
+        # best ranked matches pass the list's other filters
+        "book-search": 9,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        categories = [
+            Category.objects.create(name=name) for name in ("Fiction", "History")
+        ]
+        for i in range(10):
+            Book.objects.create(
+                isbn=f"978000000{i:04}",
+                title=f"Common Title {i}",
+                author=f"Author {i}",
+                published_date=date(2000 + i, 1, 1),
+                category=categories[i % 2],
+                borrowed_by=cls.user if i % 3 == 0 else None,
+                due_date=timezone.now() + timedelta(days=3) if i % 3 == 0 else None,
+            )
+
+    def setUp(self):
+        cache.clear()
+        get_response_store().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_book_list(self):
+        with self.assertNumQueries(self.BUDGETS["book-list"]):
+            response = self.client.get("/api/books/")
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_book_detail(self):
+        with self.assertNumQueries(self.BUDGETS["book-detail"]):
+            response = self.client.get("/api/books/9780000000000/")
+        self.assertEqual(response.data["borrowed_by"], self.user.email)
+
+    def test_book_search(self):
+        with self.assertNumQueries(self.BUDGETS["book-search"]):
+            response = self.client.get("/api/books/?search=common+title")
+        self.assertEqual(len(response.data["results"]), 10)
+
+
+class BookListingSerializerTests(TestCase):
+    """The fast listing path must render exactly what BookSerializer renders."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        now = timezone.now()
+        Book.objects.create(
+            isbn="1",
+            title="Plain",
+            author="Author",
+            published_date=date(2001, 2, 3),
+            category=category,
+        )
+        Book.objects.create(
+            isbn="2",
+            title="With Files",
+            author="Author",
+            published_date=date(2002, 2, 3),
+            category=category,
+            image="book_images/cover.jpg",
+            pdf="book_pdfs/my book (2).pdf",
+            fine_per_day=Decimal("1.5"),
+        )
+        Book.objects.create(
+            isbn="3",
+            title="Overdue",
+            author="Author",
+            published_date=date(2003, 2, 3),
+            category=category,
+            borrowed_by=cls.user,
+            due_date=now - timedelta(days=4, hours=3, microseconds=7),
+            fine_per_day=Decimal("2.25"),
+        )
+        Book.objects.create(
+            isbn="4",
+            title="Borrowed",
+            author="Author",
+            published_date=date(2004, 2, 3),
+            category=category,
+            borrowed_by=cls.user,
+            due_date=now + timedelta(days=6),
+        )
+
+    def render_both(self, user):
+        request = Request(APIRequestFactory().get("/api/books/"))
+        request.user = user
+        context = {"request": request}
+        books = BookSerializer.setup_eager_loading(Book.objects.order_by("isbn"))
+        rows = with_overdue(Book.objects.order_by("isbn")).values(
+            *BookListingSerializer.columns
+        )
+        expected = BookSerializer(books, many=True, context=context).data
+        actual = BookListingSerializer(context).serialize(rows)
+        renderer = JSONRenderer()
+        return renderer.render(expected), renderer.render(actual)
+
+    def test_matches_for_anonymous_user(self):
+        expected, actual = self.render_both(AnonymousUser())
+        self.assertEqual(actual, expected)
+
+    def test_matches_for_authenticated_user(self):
+        expected, actual = self.render_both(self.user)
+        self.assertEqual(actual, expected)
+
+
+# Written in the borrowing transaction: the writer thread would contend with
+# the racing patrons for SQLite's lock and outlive the test
+@override_settings(LIBRARY_NOTIFICATION_WRITE_BEHIND=False)
+class ConcurrentCirculationTests(TransactionTestCase):
+    """Many patrons hitting one ISBN at once: exactly one may win."""
+
+    THREADS = 16
+
+    def setUp(self):
+        category = Category.objects.create(name="Fiction")
+        self.book = Book.objects.create(
+            isbn="9780000000001",
+            title="Contested",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+        )
+        self.users = [
+            User.objects.create(email=f"patron{i}@example.com")
+            for i in range(self.THREADS)
+        ]
+
+    def race(self, action):
+        """Run ``action(user)`` in one thread per patron, released together."""
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def worker(user):
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        outcomes.append(action(user))
+                        return
+                    except OperationalError:
+                        # SQLite reports a busy table instead of waiting
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(user,)) for user in self.users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(outcomes), self.THREADS)
+        return [outcome["status"] for outcome in outcomes]
+
+    def test_one_borrower_wins(self):
+        statuses = self.race(
+            lambda user: circulation.borrow_book(user, self.book.isbn)
+        )
+        self.assertEqual(statuses.count(circulation.BORROWED), 1)
+        self.assertEqual(
+            statuses.count(circulation.UNAVAILABLE), self.THREADS - 1
+        )
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.borrow_count, 1)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(
+            Notification.objects.get().user_id, self.book.borrowed_by_id
+        )
+
+    def test_one_return_wins(self):
+        holder = self.users[0]
+        circulation.borrow_book(holder, self.book.isbn)
+        self.users = [holder] * self.THREADS  # The same patron double-submits
+        statuses = self.race(
+            lambda user: circulation.return_book(user, self.book.isbn)
+        )
+        self.assertEqual(statuses.count(circulation.RETURNED), 1)
+        self.assertEqual(
+            statuses.count(circulation.NOT_BORROWED), self.THREADS - 1
+        )
+        self.assertEqual(Notification.objects.count(), 2)
+
+
+@override_settings(LIBRARY_NOTIFICATION_WRITE_BEHIND=False)
+class CirculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Fiction")
+        cls.patrons = [
+            User.objects.create(email=f"patron{i}@example.com") for i in range(3)
+        ]
+
+    def add_book(self, isbn="9780000000001", **fields):
+        return Book.objects.create(
+            isbn=isbn,
+            title=f"Book {isbn}",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=self.category,
+            **fields,
+        )
+
+    def test_overdue_book_without_fine_can_be_returned(self):
+        patron = self.patrons[0]
+        past_due = timezone.now() - timedelta(days=3)
+        self.add_book("9780000000001", fine_per_day=Decimal("0"))
+        self.add_book("9780000000002", fine_per_day=Decimal("0"))
+        self.add_book("9780000000003", fine_per_day=Decimal("0.50"))
+        Book.objects.update(borrowed_by=patron, due_date=past_due)
+
+        outcome = circulation.return_book(patron, "9780000000001")
+        self.assertEqual(outcome["status"], circulation.RETURNED)
+        outcomes = circulation.return_books(
+            patron, ["9780000000002", "9780000000003"]
+        )
+        self.assertEqual(
+            [(outcome["status"], outcome.get("fee")) for outcome in outcomes],
+            [(circulation.RETURNED, None), (circulation.FEE_DUE, Decimal("1.50"))],
+        )
+        outcome = circulation.return_book(patron, "9780000000003")
+        self.assertEqual(outcome["status"], circulation.FEE_DUE)
+
+    def test_fee_amount_is_parsed_before_payment(self):
+        patron = self.patrons[0]
+        self.add_book(
+            borrowed_by=patron,
+            due_date=timezone.now() - timedelta(days=3),
+            fine_per_day=Decimal("0.50"),
+        )
+        client = APIClient()
+        client.force_authenticate(patron)
+        for amount in ["ten", "NaN", "Infinity", "-1", [1], True]:
+            response = client.post(
+                "/api/pay-fee/",
+                {"isbn": "9780000000001", "amount": amount},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 400, amount)
+        self.assertEqual(Book.objects.get().borrowed_by, patron)
+
+        response = client.post(
+            "/api/pay-fee/",
+            {"isbn": "9780000000001", "amount": "1.00"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        response = client.post(
+            "/api/pay-fee/",
+            {"isbn": "9780000000001", "amount": "1.50"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Book.objects.get().borrowed_by)
+        self.assertTrue(
+            Notification.objects.filter(message__startswith="Overdue fee of $1.50")
+        )
+
+    def test_batch_borrow_reports_rows_lost_to_another_borrower(self):
+        patron, rival = self.patrons[:2]
+        self.add_book("9780000000001")
+        self.add_book("9780000000002", borrowed_by=rival)
+        locked_rows = circulation._locked_rows
+
+        def unlocked_rows(isbns, *fields):
+            # As read without row locks, before the rival's borrow landed
+            rows = locked_rows(isbns, *fields)
+            rows["9780000000002"]["borrowed_by"] = None
+            return rows
+
+        with mock.patch.object(circulation, "_locked_rows", unlocked_rows):
+            outcomes = circulation.borrow_books(
+                patron, ["9780000000001", "9780000000002"]
+            )
+        self.assertEqual(
+            [outcome["status"] for outcome in outcomes],
+            [circulation.BORROWED, circulation.UNAVAILABLE],
+        )
+        self.assertEqual(Book.objects.get(isbn="9780000000002").borrowed_by, rival)
+        self.assertEqual(
+            list(patron.notifications.values_list("message", flat=True)),
+            ["You have borrowed 'Book 9780000000001'."],
+        )
+
+    def test_hold_queue_is_served_in_order(self):
+        first, second, third = self.patrons
+        book = self.add_book()
+        circulation.borrow_book(first, book.isbn)
+        self.assertEqual(circulation.place_hold(second, book.isbn)["position"], 1)
+        self.assertEqual(circulation.place_hold(third, book.isbn)["position"], 2)
+
+        circulation.return_book(first, book.isbn)
+        book.refresh_from_db()
+        self.assertEqual(book.reserved_for, second)
+        self.assertEqual(circulation.get_hold(third, book.isbn)["position"], 1)
+        self.assertEqual(
+            circulation.borrow_book(third, book.isbn)["status"], circulation.RESERVED
+        )
+        self.assertEqual(
+            circulation.borrow_book(second, book.isbn)["status"],
+            circulation.BORROWED,
+        )
+        self.assertTrue(
+            Notification.objects.filter(
+                user=second, message__contains="reserved for you"
+            ).exists()
+        )
+
+    def test_lapsed_reservation_passes_to_next_hold(self):
+        first, second, third = self.patrons
+        book = self.add_book()
+        circulation.borrow_book(first, book.isbn)
+        circulation.place_hold(second, book.isbn)
+        circulation.place_hold(third, book.isbn)
+        circulation.return_book(first, book.isbn)
+        Book.objects.filter(isbn=book.isbn).update(
+            reserved_until=timezone.now() - timedelta(minutes=1)
+        )
+
+        # Whoever asks first, the book goes to the next patron in line
+        outcome = circulation.borrow_book(first, book.isbn)
+        self.assertEqual(outcome["status"], circulation.RESERVED)
+        book.refresh_from_db()
+        self.assertEqual(book.reserved_for, third)
+        self.assertGreater(book.reserved_until, timezone.now())
+        self.assertTrue(
+            Notification.objects.filter(
+                user=second, message__contains="has expired"
+            ).exists()
+        )
+        self.assertTrue(
+            Notification.objects.filter(
+                user=third, message__contains="reserved for you"
+            ).exists()
+        )
+
+    def test_sweep_frees_lapsed_reservations(self):
+        first, second, _ = self.patrons
+        held = self.add_book("9780000000001")
+        unheld = self.add_book("9780000000002")
+        circulation.borrow_book(first, held.isbn)
+        circulation.place_hold(second, held.isbn)
+        circulation.return_book(first, held.isbn)
+        Book.objects.filter(isbn=unheld.isbn).update(
+            reserved_for=second, reserved_until=timezone.now() + timedelta(hours=1)
+        )
+        later = timezone.now() + circulation.HOLD_PERIOD + timedelta(hours=2)
+        self.assertEqual(circulation.expire_reservations(later), 2)
+        self.assertEqual(
+            list(Book.objects.values_list("reserved_for", flat=True)), [None, None]
+        )
+
+    def test_cancelled_hold_leaves_the_queue(self):
+        first, second, third = self.patrons
+        book = self.add_book()
+        circulation.borrow_book(first, book.isbn)
+        circulation.place_hold(second, book.isbn)
+        circulation.place_hold(third, book.isbn)
+        self.assertEqual(
+            circulation.cancel_hold(second, book.isbn)["status"],
+            circulation.CANCELLED,
+        )
+        self.assertEqual(
+            circulation.cancel_hold(second, book.isbn)["status"],
+            circulation.NOT_FOUND,
+        )
+        self.assertEqual(circulation.get_hold(third, book.isbn)["position"], 1)
+        circulation.return_book(first, book.isbn)
+        book.refresh_from_db()
+        self.assertEqual(book.reserved_for, third)
+
+    def test_free_book_needs_no_hold(self):
+        book = self.add_book()
+        self.assertEqual(
+            circulation.place_hold(self.patrons[0], book.isbn)["status"],
+            circulation.AVAILABLE,
+        )
+
+
+class QueryPlanTests(TestCase):
+    """Hot endpoints must be served from indexes on a sizeable catalog.
+
+    Every query an endpoint runs is EXPLAINed (SQLite or MySQL) and the test
+    fails on a full table scan or a sort, unless the case allows it.
+    """
+
+    BOOKS = 5000
+    PATRONS = 200
+    NOTIFICATIONS = 20000
+
+    # name: (url, allowed plan problems)
+    CASES = {
+        "book-list": ("/api/books/", set()),
+        "book-list-by-date": ("/api/books/?ordering=-published_date", set()),
+        # One patron's loans are few; sorting them beats another index
+        "borrowed-books": ("/api/books/?borrowed_by=patron1@example.com", {"sort"}),
+        # The fee is computed, so only the overdue range can come from an index
+        "overdue-books": ("/api/books/?overdue=true&ordering=-overdue_fee", {"sort"}),
+        "book-detail": ("/api/books/9780000000004/", set()),
+        # Relevance is sorted over one page of rows
+        "book-search": ("/api/books/?search=title", {"sort"}),
+        # Every category is returned
+        "categories": ("/api/categories/", {"scan"}),
+        "notifications": ("/api/notifications/", set()),
+        "favorites": ("/api/favorites/", set()),
+        "favorite-check": ("/api/favorite/check/9780000000004/", set()),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create(
+            Category(name=f"Category {i}") for i in range(20)
+        )
+        patrons = User.objects.bulk_create(
+            User(email=f"patron{i}@example.com") for i in range(cls.PATRONS)
+        )
+        cls.user = patrons[1]
+        now = timezone.now()
+        Book.objects.bulk_create(
+            Book(
+                isbn=f"978{i:010}",
+                title=f"Title {i * 7919 % cls.BOOKS}",
+                author=f"Author {i % 300}",
+                published_date=date(1950 + i % 70, 1, 1),
+                category=categories[i % 20],
+                borrowed_by=patrons[i % cls.PATRONS] if i % 4 == 0 else None,
+                due_date=now + timedelta(days=i % 20 - 10) if i % 4 == 0 else None,
+            )
+            for i in range(cls.BOOKS)
+        )
+        Notification.objects.bulk_create(
+            Notification(user=patrons[i % cls.PATRONS], message=f"Message {i}")
+            for i in range(cls.NOTIFICATIONS)
+        )
+        FavoriteBook.objects.bulk_create(
+            FavoriteBook(user=patrons[i % cls.PATRONS], book_id=f"978{i:010}")
+            for i in range(0, cls.BOOKS, 2)
+        )
+        rebuild_index()
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def plan_problems(self, sql):
+        """Yield ``(kind, detail)`` for each scan or sort in the plan of ``sql``."""
+        with connection.cursor() as cursor:
+            if connection.vendor == "mysql":
+                cursor.execute("EXPLAIN " + sql)
+                columns = [column[0] for column in cursor.description]
+                for row in cursor.fetchall():
+                    row = dict(zip(columns, row))
+                    if row["type"] == "ALL":
+                        yield "scan", f"full scan of {row['table']}"
+                    if "filesort" in (row["Extra"] or ""):
+                        yield "sort", f"filesort on {row['table']}"
+            else:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                for *_, detail in cursor.fetchall():
+                    if detail.startswith("SCAN") and "USING" not in detail:
+                        yield "scan", detail
+                    if re.search(r"TEMP B-TREE FOR .*ORDER BY", detail):
+                        yield "sort", detail
+
+    def assertIndexedPlans(self, name):
+        url, allowed = self.CASES[name]
+        self.client.get(url)  # Warm the search statistics cache
+        get_response_store().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries.captured_queries:
+            if not query["sql"].startswith("SELECT"):
+                continue
+            for kind, detail in self.plan_problems(query["sql"]):
+                if kind not in allowed:
+                    self.fail(f"{name}: {detail}\n{query['sql']}")
+
+    def test_book_list(self):
+        self.assertIndexedPlans("book-list")
+
+    def test_book_list_by_date(self):
+        self.assertIndexedPlans("book-list-by-date")
+
+    def test_borrowed_books(self):
+        self.assertIndexedPlans("borrowed-books")
+
+    def test_overdue_books(self):
+        self.assertIndexedPlans("overdue-books")
+
+    def test_book_detail(self):
+        self.assertIndexedPlans("book-detail")
+
+    def test_book_search(self):
+        self.assertIndexedPlans("book-search")
+
+    def test_categories(self):
+        self.assertIndexedPlans("categories")
+
+    def test_notifications(self):
+        self.assertIndexedPlans("notifications")
+
+    def test_favorites(self):
+        self.assertIndexedPlans("favorites")
+
+    def test_favorite_check(self):
+        self.assertIndexedPlans("favorite-check")
+
+
+class FakeJWKS:
+    """Stand-in for Google's key endpoint: signs tokens and counts fetches."""
+
+    def __init__(self):
+        self.fetches = 0
+        self.fail = False
+        self.fetched = threading.Event()
+        self.rotate()
+
+    def rotate(self):
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.kid = f"key-{self.fetches}-{time.monotonic_ns()}"
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+
+    def __call__(self, url):
+        self.fetches += 1
+        self.fetched.set()
+        if self.fail:
+            raise OSError("unreachable")
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(
+            self.private_key.public_key(), as_dict=True
+        )
+        return {"keys": [{**jwk, "kid": self.kid, "alg": "RS256", "use": "sig"}]}, 600
+
+    def token(self, **claims):
+        now = int(time.time())
+        claims = {
+            "iss": "https://accounts.google.com",
+            "aud": settings.GOOGLE_CLIENT_ID,
+            "sub": "1234",
+            "iat": now,
+            "exp": now + 3600,
+            "email": "reader@example.com",
+            "email_verified": True,
+            "given_name": "Ada",
+            "family_name": "Reader",
+            **claims,
+        }
+        return jwt.encode(
+            claims, self.private_key, algorithm="RS256", headers={"kid": self.kid}
+        )
+
+
+@skipUnless(has_crypto, "RS256 needs the cryptography package")
+class GoogleIDTokenTests(TestCase):
+    """ID tokens are verified offline against the cached key set."""
+
+    def setUp(self):
+        self.jwks = FakeJWKS()
+        self.key_set = google.KeySet(fetch=self.jwks)
+        self.clock = 1000.0
+        patcher = mock.patch.object(google.time, "monotonic", lambda: self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def verify(self, token):
+        return google.verify_id_token(token, self.key_set)
+
+    def test_login_verifies_locally_and_creates_user(self):
+        client = APIClient()
+        with mock.patch.object(google, "get_key_set", return_value=self.key_set):
+            for _ in range(3):
+                response = client.post(
+                    "/api/auth/google/", {"token": self.jwks.token()}, format="json"
+                )
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["first_name"], "Ada")
+        self.assertEqual(User.objects.filter(email="reader@example.com").count(), 1)
+        self.assertEqual(self.jwks.fetches, 1)
+
+    def test_rejects_bad_tokens(self):
+        forger = FakeJWKS()
+        forger.kid = self.jwks.kid  # Right key id, wrong key
+        bad = {
+            "audience": self.jwks.token(aud="someone-else"),
+            "issuer": self.jwks.token(iss="https://evil.example"),
+            "expiry": self.jwks.token(exp=int(time.time()) - 3600),
+            "email": self.jwks.token(email_verified=False),
+            "signature": forger.token(),
+            "garbage": "not.a.token",
+        }
+        for name, token in bad.items():
+            with self.subTest(name), self.assertRaises(google.InvalidIDToken):
+                self.verify(token)
+
+    def test_unknown_key_refetches_at_most_once_per_interval(self):
+        self.verify(self.jwks.token())
+        self.jwks.rotate()
+        with self.assertRaises(google.InvalidIDToken):
+            self.verify(self.jwks.token())
+        self.assertEqual(self.jwks.fetches, 1)
+        self.clock += google.MIN_REFETCH_INTERVAL
+        self.assertEqual(self.verify(self.jwks.token())["sub"], "1234")
+        self.assertEqual(self.jwks.fetches, 2)
+
+    def test_refreshes_in_background_before_expiry(self):
+        self.verify(self.jwks.token())
+        self.jwks.fetched.clear()
+        self.clock += 600 * google.REFRESH_FRACTION
+        self.verify(self.jwks.token())  # Served from the cached keys
+        self.assertTrue(self.jwks.fetched.wait(5))
+        with self.key_set._background:  # Wait for the refresh thread to finish
+            pass
+        self.assertEqual(self.jwks.fetches, 2)
+
+    def test_keeps_old_keys_when_fetch_fails(self):
+        token = self.jwks.token()
+        self.verify(token)
+        self.jwks.fail = True
+        self.clock += 600
+        with self.assertLogs("library.google", "ERROR"):
+            self.assertEqual(self.verify(token)["sub"], "1234")
+        self.verify(token)
+        self.assertEqual(self.jwks.fetches, 2)  # No retry until the interval
+
+    def test_unreachable_on_cold_start(self):
+        self.jwks.fail = True
+        with (
+            mock.patch.object(google, "get_key_set", return_value=self.key_set),
+            self.assertLogs("library.google", "ERROR"),
+        ):
+            response = APIClient().post(
+                "/api/auth/google/", {"token": self.jwks.token()}, format="json"
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class BookImportTests(TestCase):
+    HEADER = "isbn,title,author,published_date,category,fine_per_day\n"
+
+    def run_import(self, *lines, batch_size=1000):
+        data = (self.HEADER + "".join(line + "\n" for line in lines)).encode()
+        return import_books(BytesIO(data), "csv", batch_size=batch_size)
+
+    def test_upserts_on_isbn(self):
+        category = Category.objects.create(name="Fiction")
+        Book.objects.create(
+            isbn="9780000000001",
+            title="Old Title",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+            fine_per_day=Decimal("2.50"),
+        )
+        report = self.run_import(
+            "9780000000001,New Title,Author,2001-02-03,History,",
+            "9780000000002,Second,Other,1999,Fiction,1.25",
+        )
+        self.assertEqual((report["imported"], report["failed"]), (2, 0))
+        updated = Book.objects.get(isbn="9780000000001")
+        self.assertEqual(updated.title, "New Title")
+        self.assertEqual(updated.category.name, "History")
+        self.assertEqual(updated.fine_per_day, Decimal("2.50"))  # Kept: no fine given
+        self.assertEqual(
+            Book.objects.get(isbn="9780000000002").fine_per_day, Decimal("1.25")
+        )
+
+    def test_last_duplicate_wins_and_is_reported_separately(self):
+        report = self.run_import(
+            "9780000000001,First,Author,2000,Fiction,",
+            "9780000000001,Second,Author,2000,Fiction,",
+            "9780000000002,Other,Author,2000,Fiction,",
+        )
+        self.assertEqual(
+            (report["processed"], report["imported"], report["superseded"]), (3, 2, 1)
+        )
+        self.assertEqual(Book.objects.get(isbn="9780000000001").title, "Second")
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        report = self.run_import(
+            "not-an-isbn,Title,Author,2000,Fiction,",
+            "9780000000001,,Author,someday,Fiction,-1",
+            "9780000000002,Good,Author,2000,Fiction,",
+        )
+        self.assertEqual((report["imported"], report["failed"]), (1, 2))
+        self.assertEqual(
+            [error["record"] for error in report["errors"]], [2, 3]
+        )  # CSV line numbers
+        self.assertEqual(
+            set(report["errors"][1]["errors"]),
+            {"title", "published_date", "fine_per_day"},
+        )
+        self.assertEqual(
+            list(Book.objects.values_list("isbn", flat=True)), ["9780000000002"]
+        )
+
+    def test_upsert_omits_conflict_target_where_unsupported(self):
+        with (
+            mock.patch.object(
+                connection.features, "supports_update_conflicts_with_target", False
+            ),
+            mock.patch.object(Book.objects, "bulk_create") as bulk_create,
+            mock.patch("library.search.index_books"),
+        ):
+            self.run_import("9780000000001,Title,Author,2000,Fiction,")
+        self.assertTrue(bulk_create.called)
+        self.assertNotIn("unique_fields", bulk_create.call_args.kwargs)
+        self.assertTrue(bulk_create.call_args.kwargs["update_conflicts"])
+
+
+class SuggestionIndexTests(TestCase):
+    """Random inserts, removals and lookups checked against a brute force scan.
+
+    Small blocks and many titles sharing a key make runs of equal keys span
+    several blocks.
+    """
+
+    WORDS = ["a", "novel", "history", "of", "the", "river", "harbor", "light"]
+
+    def setUp(self):
+        patcher = mock.patch.object(suggest, "BLOCK_SIZE", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.index = suggest.SuggestionIndex()
+        self.index.rebuild()  # Empty catalog
+        self.books = {}
+
+    def expected(self, prefix):
+        """``{(kind, value): score}`` of everything matching ``prefix``."""
+        matches = {}
+        author_scores = {}
+        for title, author, popularity in self.books.values():
+            author_scores[author] = author_scores.get(author, 0) + popularity
+        for isbn, (title, author, popularity) in self.books.items():
+            if any(key.startswith(prefix) for key in suggest.keys_for(title)):
+                matches[(suggest.TITLE, isbn)] = popularity
+            if any(key.startswith(prefix) for key in suggest.keys_for(author)):
+                matches[(suggest.AUTHOR, author)] = author_scores[author]
+        return matches
+
+    def check(self, prefix, limit):
+        expected = self.expected(prefix)
+        refs = self.index._top(prefix, limit)
+        scores = [expected.get(ref) for ref in refs]
+        self.assertNotIn(None, scores, f"{prefix!r}: unexpected {refs}")
+        self.assertEqual(len(refs), len(set(refs)))
+        self.assertEqual(len(refs), min(limit, len(expected)), prefix)
+        self.assertEqual(scores, sorted(scores, reverse=True), prefix)
+        # The best scores, whichever refs tied for them were picked
+        self.assertEqual(scores, sorted(expected.values(), reverse=True)[:limit])
+
+    def test_shared_key_spanning_blocks(self):
+        for number in range(300):
+            isbn = f"{number:013}"
+            self.books[isbn] = (f"Story {number} A Novel", f"Writer {number % 7}", 1)
+            self.index.update_book(isbn, *self.books[isbn])
+        self.assertEqual(len(self.index.suggest("a novel", 400)), 300)
+        for number in range(0, 300, 2):
+            isbn = f"{number:013}"
+            del self.books[isbn]
+            self.index.remove_book(isbn)
+        for prefix in ("a novel", "a", "story", "writer", "novel"):
+            self.check(prefix, 400)
+        self.index._refresh_keys({"a novel"})
+
+    def test_random_operations_match_brute_force(self):
+        rng = random.Random(1234)
+        for step in range(1500):
+            isbn = f"{rng.randrange(120):013}"
+            if isbn in self.books and rng.random() < 0.4:
+                del self.books[isbn]
+                self.index.remove_book(isbn)
+            else:
+                title = " ".join(rng.choices(self.WORDS, k=rng.randint(1, 4)))
+                author = rng.choice(["Ann Lee", "Bo Li", "Cy Long", "Di Lane"])
+                self.books[isbn] = (title, author, rng.randrange(5))
+                self.index.update_book(isbn, *self.books[isbn])
+            if step % 50 == 0:
+                for prefix in ("a", "a novel", "h", "the river", "l", "zz"):
+                    self.check(prefix, rng.choice([1, 3, 10, 1000]))
+        for prefix in ("a", "n", "ri", "ann", "b"):
+            self.check(prefix, 1000)
+
+    def test_first_sync_builds_once(self):
+        index = suggest.SuggestionIndex()
+        builds = []
+
+        def slow_rebuild():
+            builds.append(threading.get_ident())
+            time.sleep(0.05)
+            index.built_at = time.time()
+            index.version = suggest.get_catalog_version()
+
+        with mock.patch.object(index, "rebuild", slow_rebuild):
+            threads = [threading.Thread(target=index.sync) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(builds), 1)
+
+    def test_stale_index_rebuilds_in_background(self):
+        self.index.built_at -= 3600
+        started = threading.Event()
+        release = threading.Event()
+        builds = []
+
+        def slow_rebuild():
+            builds.append(threading.get_ident())
+            started.set()
+            release.wait(5)
+
+        with mock.patch.object(self.index, "rebuild", slow_rebuild):
+            self.index.sync()  # Returns without waiting for the rebuild
+            self.assertTrue(started.wait(5))
+            self.index.sync()  # Already under way: no second rebuild
+            release.set()
+            with self.index._rebuilding:
+                pass
+        self.assertEqual(len(builds), 1)
+        self.assertNotEqual(builds[0], threading.get_ident())
+
+
+class CatalogResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patron = User.objects.create(email="patron@example.com")
+        cls.category = Category.objects.create(name="Fiction")
+
+    def setUp(self):
+        get_response_store().clear()
+        self.client = APIClient()
+
+    def add_book(self, isbn, **fields):
+        return Book.objects.create(
+            isbn=isbn,
+            title=f"Book {isbn}",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=self.category,
+            fine_per_day=Decimal("1.00"),
+            **fields,
+        )
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_response_expires_when_a_fee_appears(self):
+        # Due almost a full day ago: the first fee is a second away
+        due = timezone.now() - timedelta(days=1) + timedelta(seconds=1)
+        self.add_book("9780000000001", borrowed_by=self.patron, due_date=due)
+        self.assertEqual(self.get("/api/books/")["X-Cache"], "MISS")
+        hit = self.get("/api/books/")
+        self.assertEqual(hit["X-Cache"], "HIT")
+        self.assertEqual(hit.json()["results"][0]["overdue_fee"], 0)
+        time.sleep(1.1)
+        fresh = self.get("/api/books/")
+        self.assertEqual(fresh["X-Cache"], "MISS")
+        self.assertEqual(fresh.json()["results"][0]["overdue_fee"], 1.0)
+
+    def test_fee_selections_are_not_cached(self):
+        self.add_book("9780000000001")
+        for url in (
+            "/api/books/?overdue=true",
+            "/api/books/?min_fee=1",
+            "/api/books/?ordering=-overdue_fee",
+        ):
+            with self.subTest(url):
+                self.assertNotIn("X-Cache", self.get(url))
+        self.assertEqual(self.get("/api/books/?ordering=title")["X-Cache"], "MISS")
+
+    def test_deploy_check_refuses_process_local_cache(self):
+        errors = checks.run_checks(include_deployment_checks=True)
+        self.assertIn("library.E001", [error.id for error in errors])
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": "/tmp/library-check-test",
+                }
+            }
+        ):
+            errors = checks.run_checks(include_deployment_checks=True)
+        self.assertNotIn("library.E001", [error.id for error in errors])
+
+
+class NotificationStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="stream@example.com", password="x")
+
+    def setUp(self):
+        self.client = AsyncClient()
+        token = VersionedRefreshToken.for_user(self.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def ticket(self):
+        response = await self.client.post(
+            "/api/notifications/stream/ticket/", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()["ticket"]
+
+    async def first_frame(self, response):
+        content = aiter(response.streaming_content)
+        try:
+            return await anext(content)
+        finally:
+            await content.aclose()
+
+    async def test_ticket_opens_a_single_stream(self):
+        ticket = await self.ticket()
+        response = await self.client.get(
+            "/api/notifications/stream/", {"ticket": ticket}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await self.first_frame(response), b"retry: 5000\n\n")
+        response = await self.client.get(
+            "/api/notifications/stream/", {"ticket": ticket}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_access_token_in_url_is_refused(self):
+        token = self.headers["Authorization"].split()[1]
+        response = await self.client.get(
+            "/api/notifications/stream/", {"token": token}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    async def test_deactivated_user_cannot_redeem_ticket(self):
+        ticket = await self.ticket()
+        user = await User.objects.aget(pk=self.user.pk)
+        user.is_active = False
+        await user.asave()
+        response = await self.client.get(
+            "/api/notifications/stream/", {"ticket": ticket}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(LIBRARY_STREAM_HEARTBEAT=0.01)
+    async def test_revocation_ends_open_stream(self):
+        response = await self.client.get(
+            "/api/notifications/stream/", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b"retry: 5000\n\n")
+        self.assertEqual(await anext(content), b": keep-alive\n\n")
+        user = await User.objects.aget(pk=self.user.pk)
+        user.set_password("changed")
+        await user.asave()
+        frames = [frame async for frame in content]
+        self.assertLessEqual(len(frames), 1)  # At most one heartbeat in flight
+
+    def test_streams_are_refused_outside_asgi(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post("/api/notifications/stream/ticket/")
+        self.assertEqual(response.status_code, 501)
+
+
+class BookSearchPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        Book.objects.bulk_create(
+            Book(
+                isbn=f"978{i:010}",
+                # Longer titles rank lower, so scores differ and also tie
+                title="Dragon " + "tale " * (i % 4),
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+                borrowed_by=cls.user if i % 3 == 0 else None,
+            )
+            for i in range(30)
+        )
+        Book.objects.create(
+            isbn="9781111111111",
+            title="Unrelated",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+        )
+        rebuild_index()
+
+    def setUp(self):
+        cache.clear()
+        get_response_store().clear()
+
+    def walk(self, url):
+        isbns = []
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(url)
+            isbns += [book["isbn"] for book in response.data["results"]]
+            url = response.data["next"]
+        return isbns, pages
+
+    def test_pages_follow_the_whole_ranking(self):
+        with CaptureQueriesContext(connection) as queries:
+            isbns, pages = self.walk("/api/books/?search=dragon&page_size=7")
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(len(isbns), 30)
+        self.assertEqual(len(set(isbns)), 30)
+        expected = sorted(
+            (f"978{i:010}" for i in range(30)), key=lambda isbn: (int(isbn) % 4, isbn)
+        )
+        self.assertEqual(isbns, expected)
+        # Only one page of scores is ever sent to the database
+        for query in queries.captured_queries:
+            ranks = re.findall(r'WHEN \(?"library_book"\."isbn" =', query["sql"])
+            self.assertLessEqual(len(ranks), 8)
+
+    def test_previous_link_returns_the_previous_page(self):
+        first = self.client.get("/api/books/?search=dragon&page_size=7")
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+        self.assertEqual(
+            [book["isbn"] for book in back.data["results"]],
+            [book["isbn"] for book in first.data["results"]],
+        )
+
+    def test_ranking_respects_other_filters(self):
+        isbns, _ = self.walk(
+            "/api/books/?search=dragon&page_size=4&borrowed_by=reader@example.com"
+        )
+        self.assertEqual(len(isbns), 10)
+        self.assertTrue(all(int(isbn) % 3 == 0 for isbn in isbns))
+
+    def test_explicit_ordering_returns_every_match(self):
+        isbns, _ = self.walk("/api/books/?search=dragon&ordering=title&page_size=50")
+        self.assertEqual(len(isbns), 30)
+        self.assertNotIn("9781111111111", isbns)
+
+    def test_crafted_cursor_is_not_found(self):
+        first = self.client.get("/api/books/?search=dragon&page_size=7")
+        cursor = re.search(r"cursor=([^&]+)", first.data["next"]).group(1)
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        payload["p"][0] = "high"
+        crafted = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        response = self.client.get(f"/api/books/?search=dragon&cursor={crafted}")
+        self.assertEqual(response.status_code, 404)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="Fiction")
+        Book.objects.bulk_create(
+            Book(
+                isbn=f"978{i:010}",
+                title=f"Title {i:02}",
+                author="Author",
+                published_date=date(2000 + i, 1, 1),
+                category=category,
+            )
+            for i in range(5)
+        )
+
+    def setUp(self):
+        get_response_store().clear()
+
+    def crafted(self, url, position):
+        cursor = re.search(r"cursor=([^&]+)", self.client.get(url).json()["next"])
+        padded = cursor.group(1) + "=" * (-len(cursor.group(1)) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        payload["p"] = position
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    def test_pages_have_no_count(self):
+        body = self.client.get("/api/books/?page_size=2").json()
+        self.assertEqual(list(body), ["next", "previous", "results"])
+        response = self.client.get(body["next"])
+        self.assertEqual(
+            [book["isbn"] for book in response.data["results"]],
+            ["9780000000002", "9780000000003"],
+        )
+
+    def test_undecodable_cursor_is_not_found(self):
+        response = self.client.get("/api/books/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_values_that_dont_fit_the_ordering_are_not_found(self):
+        url = "/api/books/?ordering=-published_date&page_size=2"
+        for position in (["not-a-date", "9780000000001"], [{}, []], [1, 2]):
+            with self.subTest(position=position):
+                cursor = self.crafted(url, position)
+                response = self.client.get(f"{url}&cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+
+
+class UnreadCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        cls.other = User.objects.create_user(email="other@example.com", password="pw")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def unread(self, user=None):
+        return notifications.unread_count(user or self.user)
+
+    def assertCounterMatchesRows(self):
+        for user in (self.user, self.other):
+            rows = Notification.objects.filter(user=user, is_read=False).count()
+            self.assertEqual(self.unread(user), rows)
+
+    def test_new_unread_notifications_increment(self):
+        Notification.objects.create(user=self.user, message="one")
+        Notification.objects.create(user=self.user, message="seen", is_read=True)
+        notifications.create_many(
+            [
+                Notification(user=self.user, message="two"),
+                Notification(user=self.user, message="three"),
+                Notification(user=self.other, message="elsewhere"),
+            ]
+        )
+        self.assertEqual(self.unread(), 3)
+        self.assertEqual(self.unread(self.other), 1)
+        response = self.client.get("/api/notifications/unread-count/")
+        self.assertEqual(response.json(), {"unread": 3})
+
+    def test_mark_read_decrements_once(self):
+        first, second, third = notifications.create_many(
+            Notification(user=self.user, message=str(i)) for i in range(3)
+        )
+        for _ in range(2):
+            response = self.client.post(f"/api/notifications/{first.pk}/read/")
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.unread(), 2)
+        response = self.client.post(
+            "/api/notifications/mark-read/", {"up_to": third.pk}, format="json"
+        )
+        self.assertEqual(response.json(), {"marked": 2, "unread": 0})
+        self.assertCounterMatchesRows()
+
+    def test_other_users_notifications_are_not_marked(self):
+        theirs = Notification.objects.create(user=self.other, message="theirs")
+        response = self.client.post(
+            "/api/notifications/mark-read/", {"ids": [theirs.pk]}, format="json"
+        )
+        self.assertEqual(response.json()["marked"], 0)
+        self.assertEqual(self.unread(self.other), 1)
+
+    def test_ids_outside_the_id_range_are_rejected(self):
+        for body in [
+            {"ids": [10**30]},
+            {"ids": [0]},
+            {"ids": [True]},
+            {"up_to": 2**63},
+            {"up_to": -1},
+        ]:
+            response = self.client.post(
+                "/api/notifications/mark-read/", body, format="json"
+            )
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.post(
+            "/api/notifications/mark-read/", {"up_to": 2**63 - 1}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleting_unread_notifications_decrements(self):
+        unread = Notification.objects.create(user=self.user, message="unread")
+        Notification.objects.create(user=self.user, message="read", is_read=True)
+        Notification.objects.create(user=self.user, message="bulk")
+        unread.delete()
+        self.assertEqual(self.unread(), 1)
+        Notification.objects.filter(user=self.user).delete()
+        self.assertEqual(self.unread(), 0)
+
+    def test_profile_update_keeps_the_counter(self):
+        stale = User.objects.get(pk=self.user.pk)
+        Notification.objects.create(user=self.user, message="new")
+        serializer = UserSerializer(stale, data={"first_name": "Renamed"}, partial=True)
+        self.assertTrue(serializer.is_valid())
+        serializer.save()
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).first_name, "Renamed")
+
+    def test_full_save_still_writes_every_column(self):
+        self.user.first_name = "Renamed"
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertIn("unread_notifications", queries[-1]["sql"])
+
+
+@override_settings(
+    LIBRARY_NOTIFICATION_WRITE_BEHIND=True,
+    LIBRARY_NOTIFICATION_BATCH_SIZE=100,
+    LIBRARY_NOTIFICATION_QUEUE_CAPACITY=3,
+)
+class WriteBehindQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+
+    def setUp(self):
+        # A private queue with no writer thread; the tests flush it themselves
+        self.queue = notifications.WriteBehindQueue()
+        patcher = mock.patch.object(self.queue, "_start")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def batch(self, *messages):
+        return [Notification(user=self.user, message=message) for message in messages]
+
+    def test_sends_are_queued_until_commit_and_flushed_in_bulk(self):
+        with mock.patch.object(notifications, "queue", self.queue):
+            with self.captureOnCommitCallbacks(execute=True):
+                notifications.send(self.batch("one", "two"))
+                self.assertEqual(len(self.queue), 0)
+        self.assertEqual(len(self.queue), 2)
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(
+            list(Notification.objects.order_by("id").values_list("message", flat=True)),
+            ["one", "two"],
+        )
+        self.assertEqual(notifications.unread_count(self.user), 2)
+
+    def test_past_capacity_the_caller_writes_synchronously(self):
+        self.queue.put(self.batch("one", "two"))
+        self.queue.put(self.batch("three", "four"))  # Would make 4 > 3
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(
+            set(Notification.objects.values_list("message", flat=True)),
+            {"three", "four"},
+        )
+        self.queue.put(self.batch("five"))  # Exactly at capacity
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.queue.flush(), 3)
+        self.assertEqual(notifications.unread_count(self.user), 5)
+
+    def test_bulk_written_notifications_are_published_with_ids(self):
+        # As on MySQL, where a bulk insert leaves the objects without ids
+        with mock.patch.object(
+            type(connection.features),
+            "can_return_rows_from_bulk_insert",
+            new=mock.PropertyMock(return_value=False),
+        ):
+            with mock.patch.object(notifications, "publish") as publish:
+                created = notifications.create_many(self.batch("one", "one"))
+        stored = list(Notification.objects.order_by("id"))
+        self.assertEqual([row.pk for row in created], [row.pk for row in stored])
+        published = publish.call_args.args[0]
+        self.assertEqual([row.pk for row in published], [row.pk for row in stored])
+        self.assertNotIn(None, [notifications.encode(row)[0] for row in published])
+
+    def test_failed_batch_is_requeued_in_front(self):
+        self.queue.put(self.batch("one"))
+        with mock.patch.object(
+            notifications, "create_many", side_effect=OperationalError
+        ):
+            with self.assertRaises(OperationalError):
+                self.queue.flush()
+        self.queue.put(self.batch("two"))
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(
+            list(Notification.objects.order_by("id").values_list("message", flat=True)),
+            ["one", "two"],
+        )
+
+
+@override_settings(
+    LIBRARY_NOTIFICATION_RETENTION_DAYS=90,
+    LIBRARY_UNREAD_NOTIFICATION_RETENTION_DAYS=None,
+)
+class NotificationRetentionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        cls.now = timezone.now()
+        # Ids grow with timestamps, as they do in production
+        for days, is_read in [(200, True), (150, False), (120, True), (10, True)]:
+            notification = Notification.objects.create(
+                user=cls.user, message=f"{days} days", is_read=is_read
+            )
+            Notification.objects.filter(pk=notification.pk).update(
+                timestamp=cls.now - timedelta(days=days)
+            )
+        Notification.objects.create(user=cls.user, message="new")
+
+    def remaining(self):
+        return list(
+            Notification.objects.order_by("id").values_list("message", flat=True)
+        )
+
+    def test_only_expired_read_notifications_are_pruned(self):
+        self.assertEqual(retention.prune(now=self.now, batch_size=2), 2)
+        self.assertEqual(self.remaining(), ["150 days", "10 days", "new"])
+        self.assertEqual(notifications.unread_count(self.user), 2)
+
+    @override_settings(LIBRARY_UNREAD_NOTIFICATION_RETENTION_DAYS=100)
+    def test_expired_unread_notifications_leave_the_counter(self):
+        self.assertEqual(retention.prune(now=self.now, batch_size=1), 3)
+        self.assertEqual(self.remaining(), ["10 days", "new"])
+        self.assertEqual(notifications.unread_count(self.user), 1)
+
+    def test_walk_stops_at_the_first_range_still_kept(self):
+        with CaptureQueriesContext(connection) as queries:
+            retention.prune(now=self.now, batch_size=1)
+        sql = [query["sql"] for query in queries.captured_queries]
+        self.assertEqual(len([q for q in sql if q.startswith("DELETE")]), 2)
+        # One probe per range up to the "10 days" one; "new" is never looked at
+        probes = [q for q in sql if q.endswith("LIMIT 1") and '"timestamp"' in q]
+        self.assertEqual(len(probes), 4)
+
+    def test_table_archive_keeps_pruned_rows(self):
+        retention.prune(now=self.now, archive=retention.TableArchive())
+        archived = ArchivedNotification.objects.order_by("id")
+        self.assertEqual(
+            [(row.message, row.user_id) for row in archived],
+            [("200 days", self.user.pk), ("120 days", self.user.pk)],
+        )
+        self.assertEqual(retention.prune(now=self.now), 0)
+
+    def test_file_archive_appends_json_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "archive.jsonl.gz")
+            archive = retention.FileArchive(path)
+            retention.prune(now=self.now, batch_size=1, archive=archive)
+            with gzip.open(path, "rt", encoding="utf-8") as lines:
+                rows = [json.loads(line) for line in lines]
+        self.assertEqual([row["message"] for row in rows], ["200 days", "120 days"])
+        self.assertEqual(set(rows[0]), set(retention.ARCHIVE_FIELDS))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(email="reader@example.com", password="pw")
+
+    def get_profile(self, access):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        return client.get("/api/user/")
+
+    def assertRevoked(self, access):
+        response = self.get_profile(access)
+        self.assertEqual(response.status_code, 401)
+        return response
+
+    def test_password_change_revokes_issued_tokens(self):
+        access = VersionedRefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(access).status_code, 200)  # Now cached
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new password")
+        user.save()
+        self.assertEqual(user.auth_version, 1)
+        response = self.assertRevoked(access)
+        self.assertEqual(response.json()["code"], "token_revoked")
+        fresh = VersionedRefreshToken.for_user(user).access_token
+        self.assertEqual(self.get_profile(fresh).status_code, 200)
+
+    def test_deactivation_revokes_issued_tokens(self):
+        access = VersionedRefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(access).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        self.assertEqual(User.objects.get(pk=user.pk).auth_version, 1)
+        self.assertRevoked(access)
+
+    def test_session_users_are_not_served_from_the_cache(self):
+        backend = EmailBackend()
+        self.assertTrue(backend.get_user(self.user.pk).is_active)
+        # As when another process deactivates the user
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertFalse(backend.get_user(self.user.pk).is_active)
+        self.assertEqual(len(get_user_cache()), 0)
+
+    def test_other_changes_keep_tokens_valid(self):
+        access = VersionedRefreshToken.for_user(self.user).access_token
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = "Ada"
+        user.save()
+        self.assertEqual(User.objects.get(pk=user.pk).auth_version, 0)
+        response = self.get_profile(access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["first_name"], "Ada")
+
+    def test_refreshing_a_revoked_token_gives_a_revoked_token(self):
+        refresh = VersionedRefreshToken.for_user(self.user)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new password")
+        user.save()
+        response = APIClient().post("/api/token/refresh/", {"refresh": str(refresh)})
+        self.assertEqual(response.status_code, 200)
+        # The new access token carries the old version along
+        self.assertRevoked(response.json()["access"])
+
+    def test_deactivated_users_cannot_refresh(self):
+        refresh = VersionedRefreshToken.for_user(self.user)
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+        response = APIClient().post("/api/token/refresh/", {"refresh": str(refresh)})
+        self.assertEqual(response.status_code, 401)
+
+    def test_tokens_from_before_versioning_last_until_the_first_bump(self):
+        access = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get_profile(access).status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new password")
+        user.save()
+        self.assertRevoked(access)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        cls.book = Book.objects.create(
+            isbn="9780000000001",
+            title="Borrowed",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+            borrowed_by=cls.user,
+            due_date=timezone.now() - timedelta(days=2, hours=1),
+        )
+        Book.objects.create(
+            isbn="9780000000002",
+            title="On the shelf",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+        )
+
+    def setUp(self):
+        cache.clear()
+        get_response_store().clear()
+
+    def revalidate(self, url, **headers):
+        # Skip the response cache so the validators themselves answer
+        get_response_store().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers=headers)
+        return response, [query["sql"] for query in queries.captured_queries]
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get("/api/books/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Authorization", response["Vary"])
+        etag = response["ETag"]
+        response, sql = self.revalidate("/api/books/", if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        # Answered from the narrow validator query, without loading the rows
+        self.assertFalse(any('"fine_per_day"' in query for query in sql))
+
+    def test_edit_changes_the_list_etag(self):
+        etag = self.client.get("/api/books/")["ETag"]
+        Book.objects.filter(pk="9780000000002").update(
+            title="Renamed", updated_at=timezone.now()
+        )
+        response, _ = self.revalidate("/api/books/", if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_detail_honours_if_modified_since(self):
+        url = f"/api/books/{self.book.isbn}/"
+        response = self.client.get(url)
+        last_modified = response["Last-Modified"]
+        response, _ = self.revalidate(url, if_modified_since=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_growing_fee_changes_the_etag(self):
+        url = f"/api/books/{self.book.isbn}/"
+        etag = self.client.get(url)["ETag"]
+        tomorrow = timezone.now() + timedelta(days=1)
+        with mock.patch("django.utils.timezone.now", return_value=tomorrow):
+            response, _ = self.revalidate(url, if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class BookFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        fiction = Category.objects.create(name="Fiction")
+        history = Category.objects.create(name="History")
+        for i, (title, category, year, borrowed) in enumerate(
+            [
+                ("Dragon tales", fiction, 1999, True),
+                ("Dragon lore", history, 1999, False),
+                ("Dragon wars", fiction, 2005, False),
+                ("Sea stories", fiction, 2005, True),
+            ]
+        ):
+            Book.objects.create(
+                isbn=f"978000000000{i}",
+                title=title,
+                author="Author",
+                published_date=date(year, 1, 1),
+                category=category,
+                borrowed_by=cls.user if borrowed else None,
+            )
+        cls.fiction, cls.history = fiction, history
+
+    def setUp(self):
+        cache.clear()
+        get_response_store().clear()
+
+    def test_facets_count_every_match_not_just_the_page(self):
+        body = self.client.get("/api/books/?facets=1&page_size=1").json()
+        self.assertEqual(len(body["results"]), 1)
+        self.assertEqual(
+            body["facets"],
+            {
+                "category": [
+                    {"id": self.fiction.pk, "name": "Fiction", "count": 3},
+                    {"id": self.history.pk, "name": "History", "count": 1},
+                ],
+                "status": {"available": 2, "borrowed": 2},
+                "year": [{"year": 2005, "count": 2}, {"year": 1999, "count": 2}],
+            },
+        )
+
+    def test_facets_follow_the_search(self):
+        body = self.client.get("/api/books/?facets=true&search=dragon").json()
+        facets = body["facets"]
+        self.assertEqual(
+            [(row["name"], row["count"]) for row in facets["category"]],
+            [("Fiction", 2), ("History", 1)],
+        )
+        self.assertEqual(facets["status"], {"available": 2, "borrowed": 1})
+
+    def test_facets_only_when_asked(self):
+        self.assertNotIn("facets", self.client.get("/api/books/").json())
+
+    def test_facets_are_part_of_the_etag(self):
+        url = "/api/books/?facets=1&page_size=1"
+        etag = self.client.get(url)["ETag"]
+        Book.objects.create(
+            isbn="9780000000009",
+            title="Zebra",  # Sorts after the first page
+            author="Author",
+            published_date=date(2010, 1, 1),
+            category=self.history,
+        )
+        get_response_store().clear()
+        response = self.client.get(url, headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()["facets"]["year"][0], {"year": 2010, "count": 1}
+        )
+
+
+class BookExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.librarian = User.objects.create_librarian(
+            email="librarian@example.com", password="pw"
+        )
+        cls.patron = User.objects.create_user(email="patron@example.com", password="pw")
+        fiction = Category.objects.create(name="Fiction")
+        history = Category.objects.create(name="History")
+        for i in range(5):
+            Book.objects.create(
+                isbn=f"978000000000{i}",
+                title=f"Title, part {i}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=fiction if i % 2 else history,
+                borrowed_by=cls.patron if i == 3 else None,
+                due_date=timezone.now() + timedelta(days=7) if i == 3 else None,
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.librarian)
+
+    def export(self, query=""):
+        response = self.client.get(f"/api/books/export/{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_book_once(self):
+        lines = self.export().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [row["isbn"] for row in rows], [f"978000000000{i}" for i in range(5)]
+        )
+        self.assertEqual(rows[3]["borrowed_by"], "patron@example.com")
+        self.assertEqual(list(rows[0]), list(exporter.COLUMNS))
+
+    def test_rows_are_read_in_bounded_keyset_chunks(self):
+        chunks = exporter.export_chunks(Book.objects.all(), "ndjson", chunk_size=2)
+        with CaptureQueriesContext(connection) as queries:
+            sizes = [len(chunk.decode().splitlines()) for chunk in chunks]
+        self.assertEqual(sizes, [2, 2, 1])
+        self.assertEqual(len(queries), 4)  # The last one finds nothing more
+        for query in queries.captured_queries:
+            self.assertIn("LIMIT 2", query["sql"])
+
+    def test_csv_header_is_sent_before_any_query(self):
+        chunks = exporter.export_chunks(Book.objects.all(), "csv")
+        with self.assertNumQueries(0):
+            header = next(chunks)
+        self.assertEqual(header.decode().strip(), ",".join(exporter.COLUMNS))
+        rows = list(csv.reader(StringIO(b"".join(chunks).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][1], "Title, part 0")
+
+    def test_filters_narrow_the_export(self):
+        borrowed = self.export("?borrowed=true").splitlines()
+        self.assertEqual(
+            [json.loads(line)["isbn"] for line in borrowed], ["9780000000003"]
+        )
+        history = self.export("?output=csv&category=History").splitlines()
+        self.assertEqual(len(history), 4)  # Header and three books
+        future = (timezone.now() + timedelta(days=1)).date().isoformat()
+        self.assertEqual(self.export(f"?since={future}"), "")
+
+    def test_bad_parameters_and_patrons_are_refused(self):
+        for query in ("?output=xml", "?since=soon"):
+            response = self.client.get(f"/api/books/export/{query}")
+            self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.patron)
+        self.assertEqual(self.client.get("/api/books/export/").status_code, 403)
+
+
+class OverdueFilterTests(TestCase):
+    # (isbn, days past due or None if on the shelf, fine per day)
+    BOOKS = [
+        ("9780000000001", 0.5, "5.00"),  # Not yet a whole day
+        ("9780000000002", 1.1, "5.00"),
+        ("9780000000003", 3.5, "2.00"),
+        ("9780000000004", 4.2, "0.00"),
+        ("9780000000005", -2, "5.00"),  # Due in two days
+        ("9780000000006", None, "5.00"),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        now = timezone.now()
+        for isbn, days, fine in cls.BOOKS:
+            Book.objects.create(
+                isbn=isbn,
+                title=f"Book {isbn}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+                borrowed_by=cls.user if days is not None else None,
+                due_date=now - timedelta(days=days) if days is not None else None,
+                fine_per_day=Decimal(fine),
+            )
+
+    def setUp(self):
+        get_response_store().clear()
+
+    def isbns(self, query):
+        response = self.client.get(f"/api/books/{query}")
+        self.assertEqual(response.status_code, 200)
+        return [book["isbn"] for book in response.json()["results"]]
+
+    def test_fees_match_the_model(self):
+        for book in with_overdue(Book.objects.all()):
+            with self.subTest(isbn=book.isbn):
+                self.assertEqual(book.overdue_fee, book.calculate_overdue_fee())
+
+    def test_contradictory_filters_are_rejected(self):
+        response = self.client.get("/api/books/?overdue=false&min_fee=5")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("min_fee", response.json())
+        self.assertEqual(
+            self.isbns("?overdue=false&min_fee=0"),
+            ["9780000000001", "9780000000005", "9780000000006"],
+        )
+        queryset = with_overdue(Book.objects.all())
+        self.assertFalse(
+            filter_overdue(queryset, overdue=False, min_fee=Decimal("5")).exists()
+        )
+
+    def test_overdue_flag(self):
+        self.assertEqual(
+            self.isbns("?overdue=true"),
+            ["9780000000002", "9780000000003", "9780000000004"],
+        )
+        self.assertEqual(
+            self.isbns("?overdue=false"),
+            ["9780000000001", "9780000000005", "9780000000006"],
+        )
+
+    def test_min_fee_and_fee_ordering(self):
+        self.assertEqual(self.isbns("?min_fee=5"), ["9780000000002", "9780000000003"])
+        self.assertEqual(
+            self.isbns("?overdue=true&ordering=-overdue_fee"),
+            ["9780000000003", "9780000000002", "9780000000004"],
+        )
+        response = self.client.get("/api/books/?min_fee=lots")
+        self.assertEqual(response.status_code, 400)
+
+    def test_fee_changes_at_the_next_whole_day(self):
+        now = timezone.now()
+        due = now - timedelta(days=2, hours=3)
+        self.assertEqual(
+            fee_changes_at([(True, due, Decimal("1.00"))], now), due + timedelta(days=3)
+        )
+        self.assertIsNone(fee_changes_at([(True, due, Decimal("0.00"))], now))
+        self.assertIsNone(fee_changes_at([(False, None, Decimal("1.00"))], now))
+
+
+class ReminderSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        cls.now = timezone.now()
+        category = Category.objects.create(name="Fiction")
+        # (isbn, due in, borrowed)
+        for isbn, due_in, borrowed in [
+            ("9780000000001", timedelta(days=-1, hours=-12), True),
+            ("9780000000002", timedelta(days=-1, hours=-12), True),
+            ("9780000000003", timedelta(days=-1, hours=-6), True),
+            ("9780000000004", timedelta(hours=12), True),
+            ("9780000000005", timedelta(days=-1, hours=-12), False),
+        ]:
+            Book.objects.create(
+                isbn=isbn,
+                title=f"Book {isbn[-1]}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+                borrowed_by=cls.user if borrowed else None,
+                due_date=cls.now + due_in,
+            )
+
+    def messages(self):
+        return sorted(Notification.objects.values_list("message", flat=True))
+
+    def test_each_threshold_is_notified_once(self):
+        self.assertEqual(reminders.sweep(now=self.now), 4)
+        self.assertEqual(
+            self.messages(),
+            [
+                f"'Book {i}' is overdue. A fine of $5.00 per day now applies."
+                for i in (1, 2, 3)
+            ]
+            + ["'Book 4' is due tomorrow."],
+        )
+        self.assertEqual(reminders.sweep(now=self.now), 0)
+        state = OverdueSweepState.objects.get()
+        self.assertEqual((state.swept_until, state.target), (self.now, None))
+        # Six days on, the overdue loans are a week late and book 4 overdue
+        self.assertEqual(reminders.sweep(now=self.now + timedelta(days=6)), 4)
+        self.assertEqual(
+            Notification.objects.filter(message__endswith="7 days overdue.").count(),
+            3,
+        )
+
+    def test_interrupted_run_resumes_from_its_checkpoint(self):
+        create_many = notifications.create_many
+        calls = []
+
+        def fail_on_third_chunk(batch):
+            calls.append(1)
+            if len(calls) == 3:
+                raise OperationalError("connection lost")
+            return create_many(batch)
+
+        with mock.patch.object(
+            notifications, "create_many", side_effect=fail_on_third_chunk
+        ):
+            with self.assertRaises(OperationalError):
+                reminders.sweep(now=self.now, chunk_size=1)
+        state = OverdueSweepState.objects.get()
+        # Stopped inside the overdue threshold, after its first book
+        self.assertEqual(state.target, self.now)
+        self.assertEqual((state.threshold, state.last_isbn), (1, "9780000000001"))
+        self.assertEqual(Notification.objects.count(), 2)
+
+        # The rerun finishes the interrupted window before moving on
+        later = self.now + timedelta(hours=1)
+        self.assertEqual(reminders.sweep(now=later, chunk_size=1), 2)
+        state = OverdueSweepState.objects.get()
+        self.assertEqual(state.swept_until, self.now)
+        self.assertEqual(
+            (state.target, state.threshold, state.last_isbn), (None, 0, "")
+        )
+        self.assertEqual(reminders.sweep(now=later, chunk_size=1), 0)
+        self.assertEqual(len(self.messages()), len(set(self.messages())))
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_sweep_refuses_to_race_another(self):
+        # The locked row no longer matches the position this run read
+        with mock.patch.object(
+            reminders, "_position", side_effect=[("moved",), ("here",)]
+        ):
+            with self.assertRaises(reminders.SweepConflict):
+                reminders.sweep(now=self.now)
+        self.assertEqual(Notification.objects.count(), 0)
+
+
+class FavoriteStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        cls.other = User.objects.create_user(email="other@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        cls.isbns = [f"978000000000{i}" for i in range(3)]
+        for isbn in cls.isbns:
+            Book.objects.create(
+                isbn=isbn,
+                title=f"Book {isbn[-1]}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+            )
+        FavoriteBook.objects.create(user=cls.user, book_id=cls.isbns[0])
+        FavoriteBook.objects.create(user=cls.other, book_id=cls.isbns[1])
+
+    def setUp(self):
+        cache.clear()
+        get_response_store().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_status_answers_many_isbns_with_one_query(self):
+        isbns = ",".join([*self.isbns, self.isbns[0], "9789999999999"])
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/favorites/status/?isbns={isbns}")
+        self.assertEqual(
+            response.data["favorited"],
+            {
+                self.isbns[0]: True,
+                self.isbns[1]: False,
+                self.isbns[2]: False,
+                "9789999999999": False,
+            },
+        )
+
+    def test_status_rejects_empty_and_oversized_lists(self):
+        response = self.client.get("/api/favorites/status/?isbns=,")
+        self.assertEqual(response.status_code, 400)
+        isbns = ",".join(str(9780000000000 + i) for i in range(MAX_STATUS_ISBNS + 1))
+        response = self.client.get(f"/api/favorites/status/?isbns={isbns}")
+        self.assertEqual(response.status_code, 400)
+
+    def test_book_list_flags_favorites_only_on_request(self):
+        response = self.client.get("/api/books/")
+        self.assertNotIn("is_favorited", response.json()["results"][0])
+
+        response = self.client.get("/api/books/?include=is_favorited")
+        flags = {
+            book["isbn"]: book["is_favorited"] for book in response.json()["results"]
+        }
+        self.assertEqual(flags, dict(zip(self.isbns, [True, False, False])))
+
+        response = APIClient().get("/api/books/?include=is_favorited")
+        self.assertFalse(
+            any(book["is_favorited"] for book in response.json()["results"])
+        )
+
+    def test_flags_follow_favorite_changes(self):
+        url = "/api/books/?include=is_favorited"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(f"/api/favorite/{self.isbns[2]}/")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["results"][2]["is_favorited"])
+
+
+class FavoriteBookTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="reader@example.com", password="pw")
+        category = Category.objects.create(name="Fiction")
+        cls.books = [
+            Book.objects.create(
+                isbn=f"978000000000{i}",
+                title=f"Book {i}",
+                author="Author",
+                published_date=date(2000, 1, 1),
+                category=category,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unknown_isbn_cannot_be_favorited(self):
+        response = self.client.post("/api/favorite/9789999999999/")
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(FavoriteBook.objects.exists())
+
+    def test_list_returns_book_records_newest_first_in_one_query(self):
+        for book in self.books:
+            self.client.post(f"/api/favorite/{book.isbn}/")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/favorites/")
+        results = response.json()["results"]
+        self.assertEqual(
+            [entry["isbn"] for entry in results],
+            [book.isbn for book in reversed(self.books)],
+        )
+        self.assertEqual(results[0]["title"], "Book 2")
+        self.assertEqual(results[0]["category_name"], "Fiction")
+        self.assertIn("favorited_at", results[0])
+
+    def test_deleting_a_book_removes_its_favorites(self):
+        FavoriteBook.objects.create(user=self.user, book=self.books[0])
+        self.assertEqual(
+            list(self.books[0].favorites.all()), [FavoriteBook.objects.get()]
+        )
+        self.books[0].delete()
+        self.assertFalse(FavoriteBook.objects.exists())
+
+
+class FavoriteBookMigrationTests(TransactionTestCase):
+    before = [("library", "0025_archived_notification")]
+    after = [("library", "0026_favoritebook_book")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        leaf = MigrationExecutor(connection).loader.graph.leaf_nodes("library")
+        self.migrate(leaf)
+
+    def test_favorites_are_linked_by_isbn_and_back(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model("library", "User").objects.create(email="r@example.com")
+        category = apps.get_model("library", "Category").objects.create(name="F")
+        apps.get_model("library", "Book").objects.create(
+            isbn="9780000000001",
+            title="Kept",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=category,
+        )
+        FavoriteBook = apps.get_model("library", "FavoriteBook")
+        FavoriteBook.objects.create(user=user, isbn="9780000000001")
+        FavoriteBook.objects.create(user=user, isbn="9789999999999")
+
+        apps = self.migrate(self.after)
+        favorites = apps.get_model("library", "FavoriteBook").objects.all()
+        # The favorite of an ISBN missing from the catalog is dropped
+        self.assertEqual(
+            list(favorites.values_list("user_id", "book_id")),
+            [(user.pk, "9780000000001")],
+        )
+
+        apps = self.migrate(self.before)
+        favorites = apps.get_model("library", "FavoriteBook").objects.all()
+        self.assertEqual(
+            list(favorites.values_list("isbn", flat=True)), ["9780000000001"]
+        )
+
+
+class HashingPoolTests(TestCase):
+    async def test_full_pool_rejects_checks_at_once(self):
+        pool = HashingPool(workers=1, queue_limit=1)
+        self.addCleanup(pool.shutdown)
+        release = threading.Event()
+
+        def slow_check(password, encoded):
+            release.wait(5)
+            return True, None
+
+        with mock.patch.object(hashing, "_check", slow_check):
+            first = asyncio.ensure_future(pool.check("pw", "encoded"))
+            await asyncio.sleep(0)  # Let it take the only slot
+            with self.assertRaises(HashingPoolFull):
+                await pool.check("pw", "encoded")
+            self.assertEqual(
+                pool.stats(),
+                {"workers": 1, "queue_limit": 1, "in_flight": 1, "rejected": 1},
+            )
+            release.set()
+            self.assertEqual(await first, (True, None))
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+    def test_login_answers_503_when_the_pool_is_full(self):
+        User.objects.create_user(email="reader@example.com", password="pw")
+        pool = mock.Mock(check=mock.AsyncMock(side_effect=HashingPoolFull))
+        with mock.patch("library.authentication.get_hashing_pool", return_value=pool):
+            response = APIClient().post(
+                "/api/login/user/",
+                {"email": "reader@example.com", "password": "pw"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+        response = APIClient().post(
+            "/api/login/user/",
+            {"email": "reader@example.com", "password": "pw"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json())
+
+    def test_pool_full_during_backend_login_is_a_503(self):
+        User.objects.create_user(email="reader@example.com", password="pw")
+        request = RequestFactory().post("/admin/login/")
+        pool = mock.Mock(check=mock.AsyncMock(side_effect=HashingPoolFull))
+        with mock.patch("library.authentication.get_hashing_pool", return_value=pool):
+            with self.assertRaises(HashingPoolFull) as raised:
+                async_to_sync(aauthenticate)(
+                    request, email="reader@example.com", password="pw"
+                )
+        middleware = HashingPoolFullMiddleware(lambda request: None)
+        response = middleware.process_exception(request, raised.exception)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+        self.assertIsNone(middleware.process_exception(request, ValueError()))
+
+
+class SearchIndexMigrationTests(TestCase):
+    def test_migration_caps_counts_like_the_live_index(self):
+        migration = importlib.import_module("library.migrations.0018_searchindexentry")
+        book = Book.objects.create(
+            isbn="9780000000001",
+            title="Dragon",
+            author="Author",
+            published_date=date(2000, 1, 1),
+            category=Category.objects.create(name="Fiction"),
+        )
+        SearchIndexEntry.objects.all().delete()  # Indexed on save
+        terms = ["dragon"] * 40000  # More than a small integer column holds
+        with mock.patch.object(migration, "analyze", return_value=terms):
+            migration.build_search_index(apps, None)
+        with mock.patch("library.search.analyze", return_value=terms):
+            live = build_entries(book)
+        self.assertEqual(
+            sorted(
+                SearchIndexEntry.objects.values_list(
+                    "field", "term", "frequency", "length"
+                )
+            ),
+            sorted(
+                (entry.field, entry.term, entry.frequency, entry.length)
+                for entry in live
+            ),
+        )
+        self.assertEqual(
+            set(SearchIndexEntry.objects.values_list("frequency", "length")),
+            {(32767, 32767)},
+        )
@@ -2,19 +2,31 @@ from rest_framework_simplejwt.views import TokenRefreshView
 from django.urls import path
 from .views import (
     FavoriteBookToggleView,
+    FavoriteBookStatusView,
     RegisterView,
+    AuthCacheStatsView,
     UserLoginView,
     AdminLoginView,
     BookListCreateView,
     BookDetailView,
+    BookExportView,
+    BatchBorrowBookView,
+    BatchReturnBookView,
+    BookImportView,
+    BookSuggestView,
     GoogleLoginView,
     UserDetailView,
     BorrowBookView,
     ReturnBookView,
+    BookHoldView,
     CategoryListCreateView,
     CategoryDetailView,
     NotificationListView,
     MarkNotificationAsReadView,
+    MarkNotificationsReadView,
+    NotificationStreamTicketView,
+    NotificationStreamView,
+    UnreadNotificationCountView,
     PayFeeView,
     FavoriteBookListCreateView,
     FavoriteBookDetailView,
@@ -25,15 +37,46 @@ urlpatterns = [
     path("login/user/", UserLoginView.as_view(), name="user-login"),
     path("login/admin/", AdminLoginView.as_view(), name="admin-login"),
     path("books/", BookListCreateView.as_view(), name="book-list"),
+    path("books/suggest/", BookSuggestView.as_view(), name="book-suggest"),
+    path("books/import/", BookImportView.as_view(), name="book-import"),
+    path("books/export/", BookExportView.as_view(), name="book-export"),
+    path(
+        "books/borrow/batch/", BatchBorrowBookView.as_view(), name="borrow-books"
+    ),
+    path(
+        "books/return/batch/", BatchReturnBookView.as_view(), name="return-books"
+    ),
     path("books/<str:isbn>/", BookDetailView.as_view(), name="book-detail"),
     path("auth/google/", GoogleLoginView.as_view(), name="google-login"),
+    path("auth/cache-stats/", AuthCacheStatsView.as_view(), name="auth-cache-stats"),
     path("user/", UserDetailView.as_view(), name="user-detail"),
     path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("books/<str:isbn>/borrow/", BorrowBookView.as_view(), name="borrow-book"),
     path("books/<str:isbn>/return/", ReturnBookView.as_view(), name="return-book"),
+    path("books/<str:isbn>/hold/", BookHoldView.as_view(), name="book-hold"),
     path("categories/", CategoryListCreateView.as_view(), name="category-list"),
     path("categories/<int:pk>/", CategoryDetailView.as_view(), name="category-detail"),
     path("notifications/", NotificationListView.as_view(), name="notifications"),
+    path(
+        "notifications/unread-count/",
+        UnreadNotificationCountView.as_view(),
+        name="unread-notification-count",
+    ),
+    path(
+        "notifications/stream/",
+        NotificationStreamView.as_view(),
+        name="notification-stream",
+    ),
+    path(
+        "notifications/stream/ticket/",
+        NotificationStreamTicketView.as_view(),
+        name="notification-stream-ticket",
+    ),
+    path(
+        "notifications/mark-read/",
+        MarkNotificationsReadView.as_view(),
+        name="mark-notifications-read",
+    ),
     path(
         "notifications/<int:notification_id>/read/",
         MarkNotificationAsReadView.as_view(),
@@ -41,6 +84,11 @@ urlpatterns = [
     ),
     path("pay-fee/", PayFeeView.as_view(), name="pay-fee"),
     path("favorites/", FavoriteBookListCreateView.as_view(), name="favorite-list"),
+    path(
+        "favorites/status/",
+        FavoriteBookStatusView.as_view(),
+        name="favorite-status",
+    ),
     path(
         "favorite/<str:isbn>/",
         FavoriteBookToggleView.as_view(),
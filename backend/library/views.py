@@ -1,27 +1,74 @@
+import json
+
 from django.shortcuts import get_object_or_404
-import requests
 from rest_framework import generics, permissions
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import generics, status, views
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 from .models import Book, Category, Notification, FavoriteBook
+from .authentication import (
+    InvalidCredentials,
+    VersionedRefreshToken,
+    authenticate_credentials,
+    get_user_cache,
+)
+from .caching import CachedResponseMixin
+from .conditional import (
+    AggregateValidatorsMixin,
+    BookDetailValidatorsMixin,
+    BookListValidatorsMixin,
+)
+from . import circulation, notifications
+from .exporter import CONTENT_TYPES, export_chunks
+from .facets import book_facets
+from .favorites import (
+    MAX_STATUS_ISBNS,
+    favorite_books,
+    favorite_status,
+    favorites_validator,
+    with_favorited,
+)
+from .google import InvalidIDToken, KeySetUnavailable, verify_id_token
+from .hashing import HashingPoolFull
+from .importer import import_books
+from .middleware import pool_full_response
+from .overdue import fee_changes_at, filter_overdue, with_overdue
+from .import_formats import FORMATS, guess_format
+from .filters import BookSearchFilter
+from .pagination import KeysetPagination
+from .streams import (
+    issue_ticket,
+    last_event_id,
+    notification_events,
+    stream_grant,
+    streams_supported,
+)
+from .suggest import index as suggestion_index
 from .serializers import (
+    BookListingSerializer,
     BookSerializer,
     UserSerializer,
     LoginSerializer,
     CategorySerializer,
     NotificationSerializer,
-    FavoriteBookSerializer,
 )
 from rest_framework.permissions import IsAuthenticated, BasePermission
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date, parse_datetime
 from django.core.files.storage import default_storage
 from django.utils import timezone
 from django.db.models import Q
-from datetime import timedelta
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 User = get_user_model()
 
@@ -29,13 +76,17 @@ User = get_user_model()
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
+    def get_object(self):
+        # request.user may be a cached copy; the profile shows the current row
+        return User.objects.get(pk=self.request.user.pk)
+
     def get(self, request):
-        user = request.user
+        user = self.get_object()
         serializer = UserSerializer(user)
         return Response(serializer.data)
 
     def put(self, request):
-        user = request.user
+        user = self.get_object()
         serializer = UserSerializer(user, data=request.data, partial=True)
 
         if serializer.is_valid():
@@ -72,83 +123,100 @@ class RegisterView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserLoginView(APIView):
-    def post(self, request, *args, **kwargs):
-        serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.validated_data
+@method_decorator(csrf_exempt, name="dispatch")
+class LoginView(View):
+    """Password login that awaits the hash instead of holding a thread.
 
-            # Ensure only regular users can log in here
-            if user.is_staff or user.is_librarian:
-                return Response(
-                    {"error": "Admins/Librarians must log in via /admin/login"},
-                    status=status.HTTP_403_FORBIDDEN,
-                )
+    The check runs on ``library.hashing``'s bounded pool; when that is full
+    the login is refused with 503 at once. Subclasses say who may log in.
+    """
 
-            refresh = RefreshToken.for_user(user)
-            return Response(
-                {
-                    "refresh": str(refresh),
-                    "access": str(refresh.access_token),
-                }
+    def refusal(self, user):
+        """Why ``user`` may not log in here, or ``None``."""
+        return None
+
+    async def post(self, request, *args, **kwargs):
+        if request.content_type == "application/json":
+            try:
+                data = json.loads(request.body or b"{}")
+            except ValueError:
+                return JsonResponse(
+                    {"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            data = request.POST
+        serializer = LoginSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            user = await authenticate_credentials(**serializer.validated_data)
+        except InvalidCredentials as error:
+            return JsonResponse(
+                {"non_field_errors": [str(error)]},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        except HashingPoolFull:
+            return pool_full_response()
 
+        refusal = self.refusal(user)
+        if refusal is not None:
+            return JsonResponse({"error": refusal}, status=status.HTTP_403_FORBIDDEN)
 
-class AdminLoginView(APIView):
-    def post(self, request, *args, **kwargs):
-        serializer = LoginSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.validated_data
+        refresh = VersionedRefreshToken.for_user(user)
+        return JsonResponse(
+            {
+                "refresh": str(refresh),
+                "access": str(refresh.access_token),
+            }
+        )
 
-            if not (user.is_staff or user.is_librarian):
-                return Response(
-                    {"error": "Only admins/librarians can log in here"},
-                    status=status.HTTP_403_FORBIDDEN,
-                )
 
-            refresh = RefreshToken.for_user(user)
-            return Response(
-                {
-                    "refresh": str(refresh),
-                    "access": str(refresh.access_token),
-                }
-            )
+class UserLoginView(LoginView):
+    def refusal(self, user):
+        # Ensure only regular users can log in here
+        if user.is_staff or user.is_librarian:
+            return "Admins/Librarians must log in via /admin/login"
+        return None
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class AdminLoginView(LoginView):
+    def refusal(self, user):
+        if not (user.is_staff or user.is_librarian):
+            return "Only admins/librarians can log in here"
+        return None
 
 
 class GoogleLoginView(views.APIView):
     def post(self, request):
         token = request.data.get("token")
-        print(token)
 
         if not token:
             return Response(
                 {"error": "No token provided"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        google_response = requests.get(
-            f"https://oauth2.googleapis.com/tokeninfo?id_token={token}"
-        )
-        google_data = google_response.json()
-
-        if "email" not in google_data:
+        # Checked against Google's cached signing keys; see library.google
+        try:
+            claims = verify_id_token(token)
+        except InvalidIDToken:
             return Response(
                 {"error": "Invalid token"}, status=status.HTTP_400_BAD_REQUEST
             )
+        except KeySetUnavailable:
+            return Response(
+                {"error": "Google sign-in is unavailable, try again shortly"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
 
-        email = google_data["email"]
-        first_name = google_data.get("given_name", "")  # Extract first name
-        last_name = google_data.get("family_name", "")  # Extract last name
-
-        user, created = User.objects.get_or_create(email=email)
-        if created:
-            user.first_name = first_name
-            user.last_name = last_name
-            user.save()
+        user, _ = User.objects.get_or_create(
+            email=claims["email"],
+            defaults={
+                "first_name": claims.get("given_name", ""),
+                "last_name": claims.get("family_name", ""),
+            },
+        )
 
-        refresh = RefreshToken.for_user(user)
+        refresh = VersionedRefreshToken.for_user(user)
         return Response(
             {
                 "access_token": str(refresh.access_token),
@@ -172,11 +240,24 @@ class IsLibrarianOrAdmin(BasePermission):
         )
 
 
-class BookListCreateView(generics.ListCreateAPIView):
+class AuthCacheStatsView(APIView):
+    """Hit and miss counts of this process's authenticated-user cache."""
+
+    permission_classes = [IsLibrarianOrAdmin]
+
+    def get(self, request):
+        return Response(get_user_cache().stats())
+
+
+class BookListCreateView(
+    CachedResponseMixin, BookListValidatorsMixin, generics.ListCreateAPIView
+):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
-    ordering_fields = ["published_date", "title"]
+    pagination_class = KeysetPagination
+    # The search backend runs last so relevance can replace the default ordering
+    filter_backends = [DjangoFilterBackend, OrderingFilter, BookSearchFilter]
+    ordering_fields = ["published_date", "title", "overdue_fee"]
     ordering = ["title"]
 
     def get_permissions(self):
@@ -184,43 +265,128 @@ class BookListCreateView(generics.ListCreateAPIView):
             return [IsLibrarianOrAdmin()]
         return []
 
+    def favorites_requested(self):
+        include = self.request.query_params.get("include", "").split(",")
+        return "is_favorited" in include
+
+    def selects_by_fee(self, request):
+        """Whether the rows themselves, not just their fees, depend on the time."""
+        params = request.query_params
+        ordering = params.get(OrderingFilter.ordering_param, "")
+        return bool(
+            params.get("overdue") or params.get("min_fee") or "overdue_fee" in ordering
+        )
+
+    def is_cacheable(self, request):
+        # The favorite flags are per user and change without a catalog write,
+        # and which books are overdue changes with no write at all
+        return (
+            not self.favorites_requested()
+            and not self.selects_by_fee(request)
+            and super().is_cacheable(request)
+        )
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context["request"] = self.request
+        context["include_favorited"] = self.favorites_requested()
         return context
 
     def get_queryset(self):
-        queryset = Book.objects.all()
-        author_query = self.request.query_params.get("author", None)
-        title_query = self.request.query_params.get("title", None)
-        category_query = self.request.query_params.get("category", None)
+        now = timezone.now()
+        queryset = with_overdue(
+            BookSerializer.setup_eager_loading(Book.objects.all()), now
+        )
+        if self.favorites_requested():
+            queryset = with_favorited(queryset, self.request.user)
         borrowed_by_query = self.request.query_params.get("borrowed_by", None)
 
+        # title/author/category/search are handled by BookSearchFilter
         filters = Q()
 
-        if author_query:
-            filters &= Q(author__icontains=author_query)
-
-        if title_query:
-            filters &= Q(title__icontains=title_query)
-
-        if category_query:
-            filters &= Q(category__name__icontains=category_query)
-
         if borrowed_by_query:
             filters &= Q(borrowed_by__email=borrowed_by_query)
 
         if filters:
             queryset = queryset.filter(filters)
 
-        return queryset
-
+        overdue = self.request.query_params.get("overdue", "").lower()
+        min_fee = self.request.query_params.get("min_fee")
+        if min_fee:
+            try:
+                min_fee = Decimal(min_fee)
+                if not min_fee.is_finite():
+                    raise InvalidOperation
+            except InvalidOperation:
+                raise ValidationError({"min_fee": "Enter a number."})
+        overdue = {"1": True, "true": True, "0": False, "false": False}.get(overdue)
+        if overdue is False and min_fee and min_fee > 0:
+            raise ValidationError(
+                {"min_fee": "Books that aren't overdue owe no fee; drop overdue=false."}
+            )
+        return filter_overdue(
+            queryset,
+            overdue=overdue,
+            min_fee=min_fee or None,
+            now=now,
+        )
 
-class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Book.objects.all()
+    def facets_requested(self):
+        return self.request.query_params.get("facets", "").lower() in ("1", "true")
+
+    def get_facets(self, queryset):
+        # Shared by the conditional GET validators and the response body
+        if not hasattr(self, "_facets"):
+            self._facets = book_facets(queryset)
+        return self._facets
+
+    def get_extra_validators(self, request, queryset):
+        facets = self.get_facets(queryset) if self.facets_requested() else None
+        if not self.favorites_requested():
+            return facets
+        return facets, favorites_validator(request.user)
+
+    def list(self, request, *args, **kwargs):
+        # Reads skip ModelSerializer and work on plain column values
+        serializer = BookListingSerializer(context=self.get_serializer_context())
+        queryset = self.filter_queryset(self.get_queryset())
+        ordering = [field.lstrip("-") for field in queryset.query.order_by]
+        rows = queryset.values(*serializer.columns, *ordering)
+
+        page = self.paginate_queryset(rows)
+        shown = rows if page is None else page
+        self.cache_expires_at = fee_changes_at(
+            (row["borrowed_by_id"] is not None, row["due_date"], row["fine_per_day"])
+            for row in shown
+        )
+        if page is not None:
+            response = self.get_paginated_response(serializer.serialize(page))
+        else:
+            response = Response(serializer.serialize(rows))
+        if self.facets_requested():
+            response.data["facets"] = self.get_facets(queryset)
+        return response
+
+
+class BookDetailView(
+    CachedResponseMixin,
+    BookDetailValidatorsMixin,
+    generics.RetrieveUpdateDestroyAPIView,
+):
+    queryset = BookSerializer.setup_eager_loading(Book.objects.all())
     serializer_class = BookSerializer
     lookup_field = "isbn"  # Use ISBN as the lookup field
 
+    def get_queryset(self):
+        return with_overdue(super().get_queryset())
+
+    def retrieve(self, request, *args, **kwargs):
+        book = self.get_object()
+        self.cache_expires_at = fee_changes_at(
+            [(book.borrowed_by_id is not None, book.due_date, book.fine_per_day)]
+        )
+        return Response(self.get_serializer(book).data)
+
     def get_permissions(self):
         if self.request.method in ["PUT", "PATCH", "DELETE"]:
             return [IsLibrarianOrAdmin()]
@@ -235,79 +401,230 @@ class BookDetailView(generics.RetrieveUpdateDestroyAPIView):
         return super().update(request, *args, **kwargs)
 
 
-class BorrowBookView(APIView):
-    permission_classes = [IsAuthenticated]
+class BookSuggestView(APIView):
+    """Autocomplete titles and authors from the in-process prefix index."""
 
-    def post(self, request, isbn):
+    max_limit = 20
+
+    def get(self, request):
+        query = request.query_params.get("q", "")
         try:
-            book = Book.objects.get(isbn=isbn)
-            if book.borrowed_by:
-                return Response(
-                    {"error": "Book is already borrowed"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+            limit = min(int(request.query_params.get("limit", 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+
+        suggestion_index.sync()
+        return Response({"suggestions": suggestion_index.suggest(query, limit)})
+
+
+class BookImportView(APIView):
+    """Bulk upsert books from an uploaded CSV, JSON Lines or MARC file."""
 
-            book.borrowed_by = request.user
-            book.due_date = timezone.now() + timedelta(days=7)
-            book.save()
+    permission_classes = [IsLibrarianOrAdmin]
+    parser_classes = [MultiPartParser]
 
-            # Create a notification for the user
-            Notification.objects.create(
-                user=request.user, message=f"You have borrowed '{book.title}'."
+    def post(self, request):
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        format = request.data.get("format") or guess_format(upload.name)
+        if format not in FORMATS:
+            return Response(
+                {"error": f"Unsupported format, expected one of {', '.join(FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        report = import_books(
+            upload.file,
+            format,
+            batch_size=getattr(settings, "LIBRARY_IMPORT_BATCH_SIZE", 1000),
+            workers=getattr(settings, "LIBRARY_IMPORT_WORKERS", 0),
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class BookExportView(APIView):
+    """Stream the whole (filtered) catalog as NDJSON or CSV.
+
+    ``?output=ndjson|csv`` picks the encoding (``format`` is taken by DRF).
+    ``since`` keeps books updated at or after a date or datetime, and
+    ``category``, ``borrowed`` and ``borrowed_by`` narrow the rows further.
+    """
+
+    permission_classes = [IsLibrarianOrAdmin]
+
+    def get_queryset(self, params):
+        filters = Q()
+        since = params.get("since")
+        if since:
+            try:
+                moment = parse_datetime(since)
+                if moment is None:
+                    moment = datetime.combine(parse_date(since), datetime.min.time())
+            except (TypeError, ValueError):
+                raise ValidationError({"since": "Enter an ISO date or datetime."})
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            filters &= Q(updated_at__gte=moment)
+        if params.get("category"):
+            filters &= Q(category__name=params["category"])
+        if params.get("borrowed_by"):
+            filters &= Q(borrowed_by__email=params["borrowed_by"])
+        borrowed = params.get("borrowed", "").lower()
+        if borrowed in ("1", "true", "0", "false"):
+            filters &= Q(borrowed_by__isnull=borrowed in ("0", "false"))
+        return Book.objects.filter(filters)
+
+    def get(self, request):
+        output = request.query_params.get("output", "ndjson")
+        if output not in CONTENT_TYPES:
             return Response(
-                {"message": "Book borrowed successfully", "due_date": book.due_date},
-                status=status.HTTP_200_OK,
+                {"error": "output must be ndjson or csv"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        except Book.DoesNotExist:
+        chunks = export_chunks(self.get_queryset(request.query_params), output)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[output])
+        stamp = timezone.now().strftime("%Y%m%dT%H%M%S")
+        response["Content-Disposition"] = (
+            f'attachment; filename="catalog-{stamp}.{output}"'
+        )
+        return response
+
+
+class BorrowBookView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, isbn):
+        outcome = circulation.borrow_book(request.user, isbn)
+        if outcome["status"] == circulation.NOT_FOUND:
             return Response(
                 {"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        if outcome["status"] == circulation.UNAVAILABLE:
+            return Response(
+                {"error": "Book is already borrowed"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if outcome["status"] == circulation.RESERVED:
+            return Response(
+                {"error": "Book is reserved for another patron"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"message": "Book borrowed successfully", "due_date": outcome["due_date"]},
+            status=status.HTTP_200_OK,
+        )
 
 
 class ReturnBookView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, isbn):
-        try:
-            book = Book.objects.get(isbn=isbn)
-            if book.borrowed_by != request.user:
-                return Response(
-                    {"error": "You did not borrow this book"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
+        outcome = circulation.return_book(request.user, isbn)
+        if outcome["status"] == circulation.NOT_FOUND:
+            return Response(
+                {"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        if outcome["status"] == circulation.NOT_BORROWED:
+            return Response(
+                {"error": "You did not borrow this book"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if outcome["status"] == circulation.FEE_DUE:
+            return Response(
+                {
+                    "error": f"You must pay an overdue fee of ${outcome['fee']:.2f} before returning the book."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"message": "Book returned successfully"}, status=status.HTTP_200_OK
+        )
 
-            # Calculate overdue fee
-            overdue_fee = book.calculate_overdue_fee()
-            if overdue_fee > 0:
-                return Response(
-                    {
-                        "error": f"You must pay an overdue fee of ${overdue_fee:.2f} before returning the book."
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
 
-            # Mark book as returned
-            book.borrowed_by = None
-            book.due_date = None
-            book.save()
+class BookHoldView(APIView):
+    """Join, inspect or leave the hold queue of a borrowed book."""
 
-            # Create a notification for the user
-            Notification.objects.create(
-                user=request.user, message=f"You have returned '{book.title}'."
-            )
+    permission_classes = [IsAuthenticated]
 
+    def get(self, request, isbn):
+        outcome = circulation.get_hold(request.user, isbn)
+        if outcome["status"] == circulation.NOT_FOUND:
             return Response(
-                {"message": "Book returned successfully"}, status=status.HTTP_200_OK
+                {"error": "You have no hold on this book"},
+                status=status.HTTP_404_NOT_FOUND,
             )
-        except Book.DoesNotExist:
+        return Response({"position": outcome["position"]}, status=status.HTTP_200_OK)
+
+    def post(self, request, isbn):
+        outcome = circulation.place_hold(request.user, isbn)
+        if outcome["status"] == circulation.NOT_FOUND:
             return Response(
                 {"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        if outcome["status"] == circulation.AVAILABLE:
+            return Response(
+                {"error": "Book is available, borrow it instead"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if outcome["status"] == circulation.ALREADY_HOLDING:
+            return Response(
+                {"error": "You already have this book"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response(
+            {"message": "Hold placed", "position": outcome["position"]},
+            status=status.HTTP_201_CREATED,
+        )
+
+    def delete(self, request, isbn):
+        outcome = circulation.cancel_hold(request.user, isbn)
+        if outcome["status"] == circulation.NOT_FOUND:
+            return Response(
+                {"error": "You have no hold on this book"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
+class BatchCirculationView(APIView):
+    """Borrow or return several books in one request and one transaction."""
 
-class CategoryListCreateView(generics.ListCreateAPIView):
+    permission_classes = [IsAuthenticated]
+    action = None  # A batch function from circulation, as a staticmethod
+
+    def post(self, request):
+        isbns = request.data.get("isbns")
+        if (
+            not isinstance(isbns, list)
+            or not isbns
+            or not all(isinstance(isbn, str) and isbn for isbn in isbns)
+        ):
+            return Response(
+                {"error": "isbns must be a non-empty list of ISBNs"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(isbns) > circulation.MAX_BATCH_SIZE:
+            return Response(
+                {"error": f"At most {circulation.MAX_BATCH_SIZE} books per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"results": self.action(request.user, isbns)})
+
+
+class BatchBorrowBookView(BatchCirculationView):
+    action = staticmethod(circulation.borrow_books)
+
+
+class BatchReturnBookView(BatchCirculationView):
+    action = staticmethod(circulation.return_books)
+
+
+class CategoryListCreateView(
+    CachedResponseMixin, AggregateValidatorsMixin, generics.ListCreateAPIView
+):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
@@ -330,6 +647,7 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user).order_by(
@@ -337,23 +655,112 @@ class NotificationListView(generics.ListAPIView):
         )
 
 
+STREAMS_UNSUPPORTED = {
+    "error": "Notification streams need the ASGI server; poll unread-count instead"
+}
+
+
+class NotificationStreamTicketView(APIView):
+    """A single-use ticket for opening ``NotificationStreamView``."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if not streams_supported(request):
+            return Response(
+                STREAMS_UNSUPPORTED, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        return Response(
+            {"ticket": issue_ticket(request.user, request.auth)},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class NotificationStreamView(View):
+    """Server-Sent Events of new notifications; see ``library.streams``."""
+
+    async def get(self, request):
+        if not streams_supported(request):
+            return JsonResponse(
+                STREAMS_UNSUPPORTED, status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        grant = await stream_grant(request)
+        if grant is None:
+            return JsonResponse(
+                {"error": "A valid stream ticket or access token is required"},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        response = StreamingHttpResponse(
+            notification_events(grant, last_event_id(request)),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # Don't let nginx hold events back
+        return response
+
+
 class MarkNotificationAsReadView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, notification_id):
-        try:
-            notification = Notification.objects.get(
+        if not notifications.mark_read(request.user, ids=[notification_id]):
+            if not Notification.objects.filter(
                 id=notification_id, user=request.user
+            ).exists():
+                return Response(
+                    {"error": "Notification not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+        return Response(
+            {"message": "Notification marked as read"}, status=status.HTTP_200_OK
+        )
+
+
+class MarkNotificationsReadView(APIView):
+    """Mark a list of notifications, or all up to an id, read in one UPDATE."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        ids = request.data.get("ids")
+        up_to = request.data.get("up_to")
+        if (ids is None) == (up_to is None):
+            return Response(
+                {"error": "Provide either ids or up_to"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            notification.is_read = True
-            notification.save()
+        if ids is not None and (
+            not isinstance(ids, list)
+            or not all(notifications.is_notification_id(pk) for pk in ids)
+        ):
             return Response(
-                {"message": "Notification marked as read"}, status=status.HTTP_200_OK
+                {"error": "ids must be a list of notification ids"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        except Notification.DoesNotExist:
+        if ids is not None and len(ids) > notifications.MAX_MARK_READ_IDS:
             return Response(
-                {"error": "Notification not found"}, status=status.HTTP_404_NOT_FOUND
+                {
+                    "error": f"At most {notifications.MAX_MARK_READ_IDS} ids per "
+                    "request; use up_to to mark everything read"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
             )
+        if up_to is not None and not notifications.is_notification_id(up_to):
+            return Response(
+                {"error": "up_to must be a notification id"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        marked = notifications.mark_read(request.user, ids=ids, up_to=up_to)
+        return Response(
+            {"marked": marked, "unread": notifications.unread_count(request.user)}
+        )
+
+
+class UnreadNotificationCountView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread": notifications.unread_count(request.user)})
 
 
 class PayFeeView(APIView):
@@ -367,46 +774,50 @@ class PayFeeView(APIView):
             return Response(
                 {"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST
             )
-
         try:
-            book = Book.objects.get(isbn=isbn, borrowed_by=request.user)
-
-            overdue_fee = book.calculate_overdue_fee()
-
-            if overdue_fee > 0 and (amount is None or amount < overdue_fee):
-                return Response(
-                    {"error": f"Full payment required: ${overdue_fee:.2f}"},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Mark fee as paid (Implement actual payment gateway logic)
-            book.due_date = None  # Reset due date
-            book.borrowed_by = None
-            book.save()
-
-            Notification.objects.create(
-                user=request.user,
-                message=f"Overdue fee of ${amount:.2f} paid for '{book.title}'.",
+            amount = Decimal(str(amount))
+            if not amount.is_finite() or amount < 0:
+                raise InvalidOperation
+        except InvalidOperation:
+            return Response(
+                {"error": "amount must be a non-negative number"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # Mark fee as paid (Implement actual payment gateway logic)
+        outcome = circulation.pay_fee(request.user, isbn, amount)
+        if outcome["status"] == circulation.FEE_DUE:
             return Response(
-                {"message": "Payment successful"}, status=status.HTTP_200_OK
+                {"error": f"Full payment required: ${outcome['fee']:.2f}"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-
-        except Book.DoesNotExist:
+        if outcome["status"] != circulation.PAID:
             return Response(
                 {"error": "Book not found or not borrowed by this user"},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        return Response({"message": "Payment successful"}, status=status.HTTP_200_OK)
 
 
-class FavoriteBookListCreateView(APIView):
-    permission_classes = [permissions.IsAuthenticated]
+class FavoriteBookListCreateView(generics.ListAPIView):
+    """The user's favorites, newest first, as full book records."""
 
-    def get(self, request):
-        favorites = FavoriteBook.objects.filter(user=request.user)
-        serializer = FavoriteBookSerializer(favorites, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        serializer = BookListingSerializer(context=self.get_serializer_context())
+        rows = favorite_books(request.user, serializer.columns)
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(
+            [
+                {
+                    **serializer.to_representation(row),
+                    "favorited_at": serializer.format_datetime(row["created_at"]),
+                }
+                for row in page
+            ]
+        )
 
 
 class FavoriteBookToggleView(APIView):
@@ -414,7 +825,11 @@ class FavoriteBookToggleView(APIView):
 
     def post(self, request, isbn):
         user = request.user
-        favorite, created = FavoriteBook.objects.get_or_create(user=user, isbn=isbn)
+        if not Book.objects.filter(isbn=isbn).exists():
+            return Response(
+                {"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        favorite, created = FavoriteBook.objects.get_or_create(user=user, book_id=isbn)
 
         if created:
             return Response(
@@ -428,7 +843,7 @@ class FavoriteBookToggleView(APIView):
     def delete(self, request, isbn):
         user = request.user
         try:
-            favorite = FavoriteBook.objects.get(user=user, isbn=isbn)
+            favorite = FavoriteBook.objects.get(user=user, book_id=isbn)
             favorite.delete()
             return Response(
                 {"message": "Book removed from favorites"},
@@ -441,10 +856,31 @@ class FavoriteBookToggleView(APIView):
             )
 
 
+class FavoriteBookStatusView(APIView):
+    """Favorite status of several ISBNs, e.g. a page of book cards, at once."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        requested = request.query_params.get("isbns", "").split(",")
+        isbns = list(dict.fromkeys(isbn for isbn in requested if isbn))
+        if not isbns:
+            return Response(
+                {"error": "isbns must be a comma-separated list of ISBNs"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(isbns) > MAX_STATUS_ISBNS:
+            return Response(
+                {"error": f"At most {MAX_STATUS_ISBNS} ISBNs per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({"favorited": favorite_status(request.user, isbns)})
+
+
 class FavoriteBookDetailView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, isbn):
         user = request.user
-        is_favorited = FavoriteBook.objects.filter(user=user, isbn=isbn).exists()
+        is_favorited = FavoriteBook.objects.filter(user=user, book_id=isbn).exists()
         return Response({"favorited": is_favorited})
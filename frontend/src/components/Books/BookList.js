@@ -25,10 +25,18 @@ const BookList = ({ books }) => {
   const fetchFavoriteBooks = async () => {
     try {
       const accessToken = localStorage.getItem("access_token");
-      const response = await axios.get(`${API_BASE_URL}/api/favorites/`, {
+      const isbns = books.slice(0, 100).map((book) => book.isbn);
+      if (isbns.length === 0) return;
+      // One request for the whole grid; the favorites list is paginated
+      const response = await axios.get(`${API_BASE_URL}/api/favorites/status/`, {
         headers: { Authorization: `Bearer ${accessToken}` },
+        params: { isbns: isbns.join(",") },
       });
-      const favorites = new Set(response.data.map((book) => book.isbn));
+      const favorites = new Set(
+        Object.keys(response.data.favorited).filter(
+          (isbn) => response.data.favorited[isbn]
+        )
+      );
       setFavoriteBooks(favorites);
     } catch (error) {
       console.error("Error fetching favorite books:", error);
@@ -4,18 +4,46 @@ import { useAuth } from "@/context/AuthContext";
 import { useRouter } from "next/navigation";
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_BASE_URL;
+const POLL_INTERVAL_MS = 30000;
+const RECONNECT_DELAY_MS = 5000;
 
 const NotificationDropdown = () => {
   const [notifications, setNotifications] = useState([]);
+  const [unreadCount, setUnreadCount] = useState(0);
   const [dropdownOpen, setDropdownOpen] = useState(false);
   const dropdownRef = useRef(null);
-  const { user, fetchUser } = useAuth();
+  const { user } = useAuth();
   const router = useRouter();
 
   useEffect(() => {
-    window.refreshNotifications = fetchNotifications; // 🔥 Make it globally accessible
+    window.refreshNotifications = fetchUnreadCount; // 🔥 Make it globally accessible
   }, []);
 
+  // Function to fetch the badge count
+  const fetchUnreadCount = async () => {
+    if (!user) return;
+    const accessToken = localStorage.getItem("access_token");
+    if (!accessToken) return;
+
+    try {
+      const res = await fetch(
+        `${API_BASE_URL}/api/notifications/unread-count/`,
+        {
+          headers: {
+            Authorization: `Bearer ${accessToken}`,
+          },
+        }
+      );
+
+      if (res.ok) {
+        const data = await res.json();
+        setUnreadCount(data.unread);
+      }
+    } catch (error) {
+      console.error("Error fetching unread count:", error);
+    }
+  };
+
   // Function to fetch notifications
   const fetchNotifications = async () => {
     if (!user) return;
@@ -38,11 +66,84 @@ const NotificationDropdown = () => {
     }
   };
 
-  // Fetch notifications on mount
+  // Fetch the badge count on mount, then follow new notifications as the
+  // server pushes them, or poll for the count where it can't
   useEffect(() => {
-    fetchNotifications();
+    fetchUnreadCount();
+    if (!user) return;
+    let stream = null;
+    let reconnect = null;
+    let poll = null;
+    let closed = false;
+    let lastEventId = null;
+
+    const open = async () => {
+      const accessToken = localStorage.getItem("access_token");
+      if (!accessToken) return;
+
+      // EventSource can't send the token, so trade it for a one-time ticket;
+      // the server refuses when it isn't running under ASGI
+      let ticket = null;
+      try {
+        const res = await fetch(
+          `${API_BASE_URL}/api/notifications/stream/ticket/`,
+          {
+            method: "POST",
+            headers: {
+              Authorization: `Bearer ${accessToken}`,
+            },
+          }
+        );
+        if (res.ok) ticket = (await res.json()).ticket;
+      } catch (error) {
+        console.error("Error opening notification stream:", error);
+      }
+      if (closed) return;
+      if (!ticket) {
+        poll = setInterval(fetchUnreadCount, POLL_INTERVAL_MS);
+        return;
+      }
+
+      const params = new URLSearchParams({ ticket });
+      if (lastEventId) params.set("last_event_id", lastEventId);
+      stream = new EventSource(
+        `${API_BASE_URL}/api/notifications/stream/?${params}`
+      );
+      stream.onmessage = (event) => {
+        if (event.lastEventId) lastEventId = event.lastEventId;
+        const notif = JSON.parse(event.data);
+        setNotifications((prev) =>
+          notif.id && prev.some((n) => n.id === notif.id)
+            ? prev
+            : [notif, ...prev].slice(0, 3)
+        );
+        if (!notif.is_read) setUnreadCount((count) => count + 1);
+      };
+      // The ticket is spent, so reconnect with a new one rather than let
+      // EventSource retry with it; the server replays after lastEventId
+      stream.onerror = () => {
+        stream.close();
+        reconnect = setTimeout(() => {
+          if (!lastEventId) fetchUnreadCount();
+          open();
+        }, RECONNECT_DELAY_MS);
+      };
+    };
+
+    open();
+    return () => {
+      closed = true;
+      if (stream) stream.close();
+      clearTimeout(reconnect);
+      clearInterval(poll);
+    };
   }, [user]);
 
+  // Fetch the list only when it is shown
+  useEffect(() => {
+    if (dropdownOpen) fetchNotifications();
+  }, [dropdownOpen]);
+
   // Close dropdown when clicking outside
   useEffect(() => {
     const handleClickOutside = (event) => {
@@ -74,12 +175,41 @@ const NotificationDropdown = () => {
         )
       );
 
-      fetchUser(); // Refresh user to update notification count
+      fetchUnreadCount();
     } catch (error) {
       console.error("Error marking notification as read:", error);
     }
   };
 
+  // Mark everything up to the newest shown notification as read
+  const markAllAsRead = async () => {
+    const accessToken = localStorage.getItem("access_token");
+    if (!accessToken || notifications.length === 0) return;
+
+    try {
+      const res = await fetch(`${API_BASE_URL}/api/notifications/mark-read/`, {
+        method: "POST",
+        headers: {
+          Authorization: `Bearer ${accessToken}`,
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          up_to: Math.max(...notifications.map((notif) => notif.id)),
+        }),
+      });
+
+      if (res.ok) {
+        const data = await res.json();
+        setUnreadCount(data.unread);
+        setNotifications((prev) =>
+          prev.map((notif) => ({ ...notif, is_read: true }))
+        );
+      }
+    } catch (error) {
+      console.error("Error marking notifications as read:", error);
+    }
+  };
+
   return (
     <div className="relative" ref={dropdownRef}>
       <button
@@ -87,14 +217,24 @@ const NotificationDropdown = () => {
         className="relative p-2 text-gray-700 transition-all duration-300 ease-in-out hover:bg-gray-200 hover:shadow-lg rounded-full"
       >
         <Bell className="w-6 h-6 text-icon-color hover:text-primary-color transition duration-300" />
-        {notifications.some((notif) => !notif.is_read) && (
+        {unreadCount > 0 && (
           <span className="absolute top-0 right-0 w-3 h-3 bg-red-500 border border-white rounded-full"></span>
         )}
       </button>
 
       {dropdownOpen && (
         <div className="absolute right-0 mt-2 w-64 bg-white border border-gray-300 rounded-lg shadow-lg z-10">
-          <div className="p-2 font-semibold border-b">Notifications</div>
+          <div className="flex items-center justify-between p-2 font-semibold border-b">
+            <span>Notifications</span>
+            {unreadCount > 0 && (
+              <button
+                onClick={markAllAsRead}
+                className="text-xs font-normal text-blue-500 hover:underline"
+              >
+                Mark all read
+              </button>
+            )}
+          </div>
           <div className="max-h-48 overflow-y-auto">
             {notifications.length > 0 ? (
               notifications.map((notif) => (